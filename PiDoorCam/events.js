@@ -0,0 +1,42 @@
+// Events from /ws that survive reconnects (phones sleeping, Tailscale hiccups).
+// The server numbers its events (seq); when we reconnect we say which one we saw
+// last and get just the ones we missed - or a "resync" when it no longer has them,
+// and then the page reloads its list. See backend/event_log.py.
+//
+//   connectEvents({ onEvent: (msg) => ..., onResync: () => load() })
+function connectEvents({ query = '', onEvent, onResync }) {
+  let lastSeq = null
+  let retryMs = 1000
+
+  function open() {
+    const params = new URLSearchParams(query)
+    // Only the events: no frames, detections or camera state
+    params.set('live', '0')
+    if (lastSeq !== null) params.set('last_seq', lastSeq)
+    const ws = new WebSocket((location.protocol === 'https:' ? 'wss://' : 'ws://') + location.host + '/ws?' + params)
+    ws.onopen = () => { retryMs = 1000 }
+    ws.onmessage = (e) => {
+      let msg
+      try { msg = JSON.parse(e.data) } catch (_) { return }
+      if (msg.type === 'sync') {
+        lastSeq = Math.max(lastSeq || 0, msg.seq)
+      } else if (msg.type === 'resync') {
+        lastSeq = msg.seq
+        if (onResync) onResync()
+      } else if (msg.seq !== undefined) {
+        // Already seen (replayed and broadcast at the same time)
+        if (lastSeq !== null && msg.seq <= lastSeq) return
+        lastSeq = msg.seq
+        onEvent(msg)
+      } else {
+        onEvent(msg)
+      }
+    }
+    ws.onclose = () => {
+      setTimeout(open, retryMs)
+      retryMs = Math.min(retryMs * 2, 30000)
+    }
+  }
+
+  open()
+}
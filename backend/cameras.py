@@ -0,0 +1,335 @@
+"""
+Camera registry: one or more named cameras on the same Pi.
+Each camera has its own frame source, streamer (replay buffer, tracker,
+zones, detection state) and supervisor; main.py adds broadcaster/detection
+tasks and an event clip recorder per camera. The heavy work they generate (MP4
+encodes, photo writes) goes through the shared WorkScheduler, so two
+cameras don't mean twice the threads.
+
+Cameras come from config/cameras.json (or the file PICAM_CAMERAS points at):
+    [
+      {"id": "door", "camera": 0},
+      {"id": "garden", "camera": 1, "zones": "config/zones-garden.json", "h264": true, "timelapse": true},
+      {"id": "test", "replay": "recordings/door.mjpeg", "metadata": "recordings/door.json"}
+    ]
+"camera" is the `rpicam-vid --camera` index; "replay" runs a recording
+through FileReplaySource instead (looped, real time). "h264" adds the
+low-bandwidth H.264/HLS live view (hls.py); "h264_file" replays an Annex B
+recording for it. "timelapse" (true or options) records a daily timelapse
+(timelapse.py). Relative paths are from the repo root. Without a config
+file there's one camera, "main": the IMX500, or PICAM_REPLAY_MJPEG /
+PICAM_REPLAY_METADATA if set - same as before - with PICAM_LIVE_H264=1 /
+PICAM_REPLAY_H264 for the H.264 view and PICAM_TIMELAPSE=1 for the timelapse.
+
+Try two fake cameras side by side:
+    python -m backend.cameras
+(tests/test_cameras.py runs the whole app that way.)
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .frame_sources import CONFIG_DIR, FileReplaySource, FrameSource, RPiCamVidSource
+from .supervisor import StreamSupervisor
+
+ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CONFIG = CONFIG_DIR / "cameras.json"
+DEFAULT_ID = "main"
+
+
+class Camera:
+    def __init__(
+        self,
+        cam_id: str,
+        make_source: Callable[[], FrameSource],
+        name: Optional[str] = None,
+        zones_file: Optional[Path] = None,
+        metadata_file: Optional[str] = None,
+        timelapse: Optional[Dict] = None,
+        **streamer_options
+    ):
+        self.id = cam_id
+        self.name = name or cam_id
+        # A factory, since a stopped camera gets a fresh source (and streamer) next time
+        self.make_source = make_source
+        self.zones_file = zones_file
+        # rpicam-vid writes detections here - one file per camera
+        self.metadata_file = metadata_file or f"/tmp/imx500_stream_detections-{cam_id}.json"
+        self.streamer_options = streamer_options
+        # TimelapseRecorder options, or None for no timelapse
+        self.timelapse = timelapse
+        self._streamer = None
+        self._lock = threading.Lock()
+        # None = in-process camera; "writer"/"reader" = capture process / web worker, see use_frame_bus()
+        self.bus_role: Optional[str] = None
+        self.bus_prefix: Optional[str] = None
+        self.supervisor = StreamSupervisor(self.get_streamer, camera_id=cam_id)
+        # Filled in by main.py when it starts the camera's services
+        self.clip_recorder = None
+        self.timelapse_recorder = None
+        self.tasks: List = []
+        # Why the camera didn't start, while main.py retries it
+        self.start_error: Optional[str] = None
+
+    def get_streamer(self):
+        """
+        This camera's RPiCamStreaming (a frame_bus.BusStreamer in a web worker),
+        built on first use (imports numpy/OpenCV - keep it off the event loop).
+        """
+        if self._streamer is None:
+            with self._lock:
+                if self._streamer is None:
+                    self._streamer = self._build_streamer()
+        return self._streamer
+
+    def _build_streamer(self):
+        if self.bus_role == "reader":
+            from .frame_bus import BusStreamer
+            return BusStreamer(self.id, self.bus_prefix, zones_file=self.zones_file,
+                               framerate=self.streamer_options.get("framerate", 15))
+        from .rpicam_streaming import RPiCamStreaming
+        streamer = RPiCamStreaming(
+            source=self.make_source(),
+            metadata_file=self.metadata_file,
+            camera_id=self.id,
+            zones_file=self.zones_file,
+            **self.streamer_options
+        )
+        if self.bus_role == "writer":
+            from .frame_bus import FrameBus
+            streamer.attach_bus(FrameBus(self.id, self.bus_prefix, create=True))
+        return streamer
+
+    def use_frame_bus(self, role: str, prefix: str):
+        """
+        "writer": this process runs the camera and publishes it to shared memory.
+        "reader": the camera runs in the capture process; read it from shared memory.
+        Call before the streamer is built.
+        """
+        self.bus_role = role
+        self.bus_prefix = prefix
+        if role == "reader":
+            from .frame_bus import RemoteSupervisor
+            self.supervisor = RemoteSupervisor(self.id, self.get_streamer)
+
+    def publish_status(self):
+        """Capture process: snapshot of the camera for the web workers (once a second or so)."""
+        streamer = self._streamer
+        if self.bus_role != "writer" or streamer is None or streamer.bus is None:
+            return
+        from .frame_bus import STATE_STATUS
+        streamer.bus.publish_state(STATE_STATUS, {
+            "running": streamer.is_running(),
+            "source": streamer.source.name,
+            "pid": streamer.source.pid,
+            "framerate": streamer.framerate,
+            "frame_info": streamer.get_frame_info(),
+            "supervisor": self.supervisor.stats(),
+            "log": streamer.source.log_stats(),
+            "log_tail": streamer.source.recent_log(limit=100),
+            "buffer": streamer.get_buffer_stats(),
+        })
+
+    @property
+    def created(self) -> bool:
+        """True once get_streamer() has built the streamer (without building it)."""
+        return self._streamer is not None
+
+    def stop(self):
+        self.supervisor.stop()
+        if self.clip_recorder is not None:
+            self.clip_recorder.stop()
+        if self.timelapse_recorder is not None:
+            self.timelapse_recorder.stop()
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+        if self.bus_role == "reader":
+            # Nothing to stop here; the capture process owns the camera
+            return
+        with self._lock:
+            streamer, self._streamer = self._streamer, None
+        if streamer is not None:
+            streamer.stop()
+            if streamer.bus is not None:
+                streamer.bus.close()
+
+    def describe(self) -> Dict:
+        streamer = self._streamer
+        return {
+            "id": self.id,
+            "name": self.name,
+            "source": streamer.source.name if streamer else None,
+            "state": "failed" if self.start_error else self.supervisor.state if streamer else "starting",
+            "running": streamer.is_running() if streamer else False,
+        }
+
+
+class CameraRegistry:
+    def __init__(self, cameras: Optional[List[Camera]] = None):
+        self._cameras: Dict[str, Camera] = {}
+        for camera in cameras or []:
+            self.add(camera)
+
+    def add(self, camera: Camera):
+        if camera.id in self._cameras:
+            raise ValueError(f"Duplicate camera id {camera.id!r}")
+        self._cameras[camera.id] = camera
+
+    def get(self, cam_id: str) -> Optional[Camera]:
+        return self._cameras.get(cam_id)
+
+    @property
+    def default(self) -> Camera:
+        """The first camera - what the old single-camera routes (/stream.mjpg, /api/photo, ...) use."""
+        return next(iter(self._cameras.values()))
+
+    def ids(self) -> List[str]:
+        return list(self._cameras)
+
+    def __iter__(self) -> Iterator[Camera]:
+        return iter(list(self._cameras.values()))
+
+    def __len__(self) -> int:
+        return len(self._cameras)
+
+    def stop_all(self):
+        for camera in self:
+            camera.stop()
+
+    def use_frame_bus(self, role: str, prefix: str):
+        for camera in self:
+            camera.use_frame_bus(role, prefix)
+
+    @classmethod
+    def from_config(cls, path: Optional[Path] = None) -> "CameraRegistry":
+        path = Path(path or os.environ.get("PICAM_CAMERAS") or DEFAULT_CONFIG)
+        if not path.exists():
+            return cls([Camera(DEFAULT_ID, _source_from_env, timelapse=_timelapse_from_env(), **_h264_from_env())])
+        with open(path) as f:
+            entries = json.load(f)
+        if not entries:
+            raise ValueError(f"{path} lists no cameras")
+        registry = cls([_camera_from_entry(entry) for entry in entries])
+        print(f"[Cameras] {len(registry)} camera(s) from {path}: {', '.join(registry.ids())}")
+        return registry
+
+
+def _resolve(p: Optional[str]) -> Optional[Path]:
+    if not p:
+        return None
+    p = Path(p)
+    return p if p.is_absolute() else ROOT / p
+
+
+def _camera_from_entry(entry: Dict) -> Camera:
+    cam_id = str(entry["id"])
+    if "replay" in entry:
+        mjpeg, metadata = _resolve(entry["replay"]), _resolve(entry.get("metadata"))
+        realtime, loop = entry.get("realtime", True), entry.get("loop", True)
+
+        def make_source():
+            return FileReplaySource(mjpeg, metadata, realtime=realtime, loop=loop)
+    else:
+        index = entry.get("camera")
+        post_process = _resolve(entry.get("post_process_file")) or CONFIG_DIR / "imx500_person_detection.json"
+
+        def make_source():
+            return RPiCamVidSource(post_process, camera=index)
+    options = {k: entry[k] for k in ("width", "height", "framerate", "motion_detection", "h264") if k in entry}
+    if entry.get("h264_file"):
+        options["h264_file"] = _resolve(entry["h264_file"])
+    # true = the defaults, or a dict of TimelapseRecorder options
+    timelapse = entry.get("timelapse")
+    timelapse = {} if timelapse is True else timelapse if isinstance(timelapse, dict) else None
+    return Camera(cam_id, make_source, name=entry.get("name"), zones_file=_resolve(entry.get("zones")),
+                  timelapse=timelapse, **options)
+
+
+def _source_from_env() -> FrameSource:
+    """
+    PICAM_REPLAY_MJPEG=/path/rec.mjpeg (and optionally PICAM_REPLAY_METADATA=/path/rec.json)
+    runs the whole app off a looping recording instead of the camera.
+    """
+    mjpeg = os.environ.get("PICAM_REPLAY_MJPEG")
+    if not mjpeg:
+        return RPiCamVidSource()
+    print(f"[Cameras] Replaying {mjpeg} instead of the camera")
+    return FileReplaySource(mjpeg, os.environ.get("PICAM_REPLAY_METADATA"), realtime=True, loop=True)
+
+
+def _h264_from_env() -> Dict:
+    """PICAM_LIVE_H264=1 turns on the H.264 live view; PICAM_REPLAY_H264=/path/rec.h264 feeds it a recording."""
+    options = {}
+    if os.environ.get("PICAM_LIVE_H264") == "1":
+        options["h264"] = True
+    if os.environ.get("PICAM_REPLAY_H264"):
+        options["h264_file"] = Path(os.environ["PICAM_REPLAY_H264"])
+    return options
+
+
+def _timelapse_from_env() -> Optional[Dict]:
+    """PICAM_TIMELAPSE=1 records a daily timelapse; PICAM_TIMELAPSE_INTERVAL sets the seconds between frames."""
+    if os.environ.get("PICAM_TIMELAPSE") != "1":
+        return None
+    options = {}
+    if os.environ.get("PICAM_TIMELAPSE_INTERVAL"):
+        options["interval"] = float(os.environ["PICAM_TIMELAPSE_INTERVAL"])
+    return options
+
+
+def _demo():
+    """Two fake cameras plus the shared scheduler: frames stay per camera, one stalling doesn't touch the other."""
+    import asyncio
+    import tempfile
+    import time
+
+    from .pipeline_bench import generate_recording
+    from .work_scheduler import WorkScheduler
+
+    with tempfile.TemporaryDirectory() as tmp:
+        door = generate_recording(Path(tmp) / "door", seconds=3)
+        yard = generate_recording(Path(tmp) / "yard", seconds=3)
+        registry = CameraRegistry([
+            Camera("door", lambda: FileReplaySource(*door, realtime=True, loop=True),
+                   metadata_file=str(Path(tmp) / "door-meta.json"), motion_detection=False),
+            # This one wedges after 20 frames and has to be restarted by its supervisor
+            Camera("yard", lambda: FileReplaySource(*yard, realtime=True, stall_after=20),
+                   metadata_file=str(Path(tmp) / "yard-meta.json"), motion_detection=False),
+        ])
+        for camera in registry:
+            camera.supervisor.stall_timeout = 1.0
+            camera.supervisor.initial_backoff = 0.5
+            camera.supervisor.start()
+        time.sleep(6)
+
+        for camera in registry:
+            info = camera.get_streamer().get_frame_info()
+            print(f"{camera.id}: {info['frames_seen']} frames, state {camera.supervisor.state}, "
+                  f"restarts {camera.supervisor.restart_count}")
+        door_cam, yard_cam = registry.get("door"), registry.get("yard")
+        assert door_cam.supervisor.restart_count == 0, "the healthy camera shouldn't have been restarted"
+        assert yard_cam.supervisor.restart_count >= 1, "the stalled camera should have been restarted"
+        assert door_cam.get_streamer().get_frame() != yard_cam.get_streamer().get_frame()
+
+        # 6 jobs of 0.2 s on a 2-worker pool: ~0.6 s, not 0.2 s (all at once) or 1.2 s (one by one)
+        scheduler = WorkScheduler({"capture": 2})
+
+        async def burst():
+            start = time.perf_counter()
+            await asyncio.gather(*(scheduler.run("capture", time.sleep, 0.2) for _ in range(6)))
+            return time.perf_counter() - start
+
+        took = asyncio.run(burst())
+        print(f"scheduler: 6 x 0.2 s jobs on 2 workers took {took:.2f}s")
+        assert 0.55 < took < 1.0
+        scheduler.shutdown()
+        registry.stop_all()
+        print("OK")
+
+
+if __name__ == "__main__":
+    _demo()
@@ -0,0 +1,39 @@
+"""
+The capture process for running more than one web worker (see frame_bus.py).
+It does everything main.py does except serve HTTP: cameras and their
+supervisors, detection events (photos, DB events, clips), GC and retention.
+Frames, the replay buffer and detections go to shared memory; messages for
+WebSocket clients go onto the event bus.
+
+    python -m backend.capture &
+    PICAM_ROLE=web uvicorn backend.main:app --workers 4 --port 8080
+
+(run.sh does this when PICAM_WORKERS is more than 1.)
+"""
+
+import asyncio
+import os
+import signal
+
+
+def run():
+    # Has to be set before main.py is imported: it picks its role at import time
+    os.environ["PICAM_ROLE"] = "capture"
+    from . import main as app
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        app.loop_watchdog.start()
+        await app._bring_up()
+        print("[capture] Publishing to the frame bus")
+        await stop.wait()
+        await app.shutdown_event()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    run()
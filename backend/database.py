@@ -1,27 +1,71 @@
 
 # This file handles all the database stuff for our Pi-Ai-Camera project
 # We use SQLite because it's simple and works great for small projects
+import os
 import sqlite3
+import sys
+import threading
 from pathlib import Path
 import time
 
+from . import metrics
+
 # Where we keep our database file
-DB_PATH = Path(__file__).resolve().parents[1] / "data" / "database.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+# PICAM_DATA_DIR moves all data (DB, photos, replays) elsewhere, e.g. for benchmarks
+DB_PATH = Path(os.environ.get("PICAM_DATA_DIR") or Path(__file__).resolve().parents[1] / "data") / "database.db"
 
+# Tables are created on the first connection instead of at import time,
+# so importing this module (and main.py) stays fast
+_initialized = False
+_init_lock = threading.Lock()
 
 
-# Get a connection to our SQLite database
-def get_conn():
-    conn = sqlite3.connect(str(DB_PATH))
+
+DB_SECONDS = metrics.histogram("db_call_seconds", "Time from opening to closing a DB connection, per function",
+                               ("op",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+
+# Every function here opens its own connection and closes it when done,
+# so timing the connection's lifetime gives us the latency of each call
+class _TimedConnection(sqlite3.Connection):
+    op = "unknown"
+    opened_at = 0.0
+
+    def close(self):
+        super().close()
+        DB_SECONDS.observe(time.perf_counter() - self.opened_at, op=self.op)
+
+
+def _connect(op):
+    conn = sqlite3.connect(str(DB_PATH), factory=_TimedConnection)
     conn.row_factory = sqlite3.Row
+    conn.op = op
+    conn.opened_at = time.perf_counter()
     return conn
 
 
+# Get a connection to our SQLite database
+def get_conn():
+    if not _initialized:
+        init_db()
+    # Name of the function that asked for the connection, e.g. "add_event"
+    return _connect(sys._getframe(1).f_code.co_name)
+
+
 
-# Set up all our tables if they don't exist yet
+# Set up all our tables if they don't exist yet (runs once, on first use)
 def init_db():
-    conn = get_conn()
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _create_tables()
+        _initialized = True
+
+
+def _create_tables():
+    conn = _connect("init_db")
     cur = conn.cursor()
     # Table for people enrolled (if you use face recognition)
     cur.execute("""
@@ -63,16 +107,119 @@ def init_db():
     CREATE TABLE IF NOT EXISTS replays (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         timestamp INTEGER NOT NULL,
-        duration INTEGER NOT NULL,
+        duration REAL NOT NULL,
         frame_count INTEGER NOT NULL,
         file_size INTEGER NOT NULL,
         path TEXT NOT NULL
     )
     """)
+    # Columns added after the first release - older databases need them added in place
+    _add_column_if_missing(cur, "events", "replay_id", "INTEGER")
+    # Tracker ID of the person the event belongs to (one event per track)
+    _add_column_if_missing(cur, "events", "track_id", "INTEGER")
+    # Which zone / tripwire a zone_enter or line_cross event is for
+    _add_column_if_missing(cur, "events", "zone_id", "TEXT")
+    # Where people were in the frame: bbox centroid counts per grid cell per day
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS spatial_heatmap (
+        day INTEGER NOT NULL,
+        gx INTEGER NOT NULL,
+        gy INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, gx, gy)
+    )
+    """)
+    # Rows marked deleted but whose files the garbage collector hasn't removed yet
+    _add_column_if_missing(cur, "photos", "deleted_at", "INTEGER")
+    _add_column_if_missing(cur, "replays", "deleted_at", "INTEGER")
+    # Photo + thumbnail bytes on disk (replays already have file_size)
+    _add_column_if_missing(cur, "photos", "size_bytes", "INTEGER")
+    # Which camera (cameras.py id) an event/photo/replay came from; NULL = from before multi-camera
+    for table in ("events", "photos", "replays"):
+        _add_column_if_missing(cur, table, "camera_id", "TEXT")
+    # Who a person event was, when recognition knew them (see recognition.py)
+    _add_column_if_missing(cur, "events", "enrollment_id", "INTEGER")
+    # sha256 of the JPEG, for PICAM_PHOTO_DEDUP (see photo_store.py)
+    _add_column_if_missing(cur, "photos", "content_hash", "TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_photos_content_hash ON photos(content_hash)")
+    # Numbered WebSocket events, so a reconnecting page gets only what it missed (see event_log.py).
+    # The seq comes from here, so every process (capture, each web worker) numbers from the same count
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ws_events (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp REAL NOT NULL,
+        camera TEXT,
+        message TEXT NOT NULL
+    )
+    """)
+    _add_column_if_missing(cur, "ws_events", "camera", "TEXT")
+    _init_storage_usage(cur)
     conn.commit()
     conn.close()
 
 
+# Running totals of live (not tombstoned) bytes/rows per data class, kept up to
+# date by triggers so the retention check never has to walk the SD card
+def _init_storage_usage(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS storage_usage (
+        kind TEXT PRIMARY KEY,
+        bytes INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    for kind, size_col in _SIZE_COLUMN.items():
+        live = "1" if kind == "events" else "deleted_at IS NULL"
+        # Recount once at startup so rows from before the triggers existed are included
+        cur.execute(f"""
+        INSERT OR REPLACE INTO storage_usage (kind, bytes, count)
+        SELECT ?, COALESCE(SUM({size_col}), 0), COUNT(*) FROM {kind} WHERE {live}
+        """, (kind,))
+        new_live = "1" if kind == "events" else "NEW.deleted_at IS NULL"
+        old_live = "1" if kind == "events" else "OLD.deleted_at IS NULL"
+        new_size = "0" if kind == "events" else f"NEW.{size_col}"
+        old_size = "0" if kind == "events" else f"OLD.{size_col}"
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {kind}_usage_insert AFTER INSERT ON {kind} WHEN {new_live}
+        BEGIN
+            UPDATE storage_usage SET bytes = bytes + COALESCE({new_size}, 0), count = count + 1 WHERE kind = '{kind}';
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {kind}_usage_delete AFTER DELETE ON {kind} WHEN {old_live}
+        BEGIN
+            UPDATE storage_usage SET bytes = bytes - COALESCE({old_size}, 0), count = count - 1 WHERE kind = '{kind}';
+        END
+        """)
+        if kind == "events":
+            continue
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {kind}_usage_tombstone AFTER UPDATE OF deleted_at ON {kind}
+        WHEN OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL
+        BEGIN
+            UPDATE storage_usage SET bytes = bytes - COALESCE(OLD.{size_col}, 0), count = count - 1 WHERE kind = '{kind}';
+        END
+        """)
+        cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {kind}_usage_resize AFTER UPDATE OF {size_col} ON {kind}
+        WHEN NEW.deleted_at IS NULL
+        BEGIN
+            UPDATE storage_usage SET bytes = bytes + COALESCE(NEW.{size_col}, 0) - COALESCE(OLD.{size_col}, 0) WHERE kind = '{kind}';
+        END
+        """)
+
+
+# Which column holds the on-disk size for each data class (events are rows only)
+_SIZE_COLUMN = {"photos": "size_bytes", "replays": "file_size", "events": "0"}
+
+
+# SQLite has no "ADD COLUMN IF NOT EXISTS", so check the table info first
+def _add_column_if_missing(cur, table, column, decl):
+    cur.execute(f"PRAGMA table_info({table})")
+    if column not in [r["name"] for r in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
 
 # Add a new person to the enrollments table
 def add_enrollment(name):
@@ -92,8 +239,10 @@ def add_enrollment_image(enrollment_id, path):
     conn = get_conn()
     cur = conn.cursor()
     cur.execute("INSERT INTO enrollment_images (enrollment_id, path) VALUES (?, ?)", (enrollment_id, str(path)))
+    image_id = cur.lastrowid
     conn.commit()
     conn.close()
+    return image_id
 
 
 
@@ -101,28 +250,69 @@ def add_enrollment_image(enrollment_id, path):
 def list_enrollments():
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT id, name, created_at FROM enrollments ORDER BY created_at DESC")
+    cur.execute("""SELECT e.id, e.name, e.created_at, COUNT(i.id) AS images
+                   FROM enrollments e LEFT JOIN enrollment_images i ON i.enrollment_id = e.id
+                   GROUP BY e.id ORDER BY e.created_at DESC""")
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+# Every enrollment image with whose it is (for the recognition index)
+def list_enrollment_images():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""SELECT i.id, i.enrollment_id, i.path, e.name
+                   FROM enrollment_images i JOIN enrollments e ON e.id = i.enrollment_id ORDER BY i.id""")
     rows = [dict(r) for r in cur.fetchall()]
     conn.close()
     return rows
 
 
+# Remove a person and their images; returns the image paths (the caller deletes the files)
+def delete_enrollment(enrollment_id):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT path FROM enrollment_images WHERE enrollment_id = ?", (enrollment_id,))
+    paths = [r["path"] for r in cur.fetchall()]
+    cur.execute("DELETE FROM enrollment_images WHERE enrollment_id = ?", (enrollment_id,))
+    cur.execute("DELETE FROM enrollments WHERE id = ?", (enrollment_id,))
+    found = cur.rowcount > 0
+    conn.commit()
+    conn.close()
+    return paths if found else None
+
+
 
 # Add a detection event (like a person detected)
-def add_event(timestamp, label, confidence, snapshot_path=None):
+def add_event(timestamp, label, confidence, snapshot_path=None, track_id=None, zone_id=None, camera_id=None,
+              enrollment_id=None):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO events (timestamp, label, confidence, snapshot_path, track_id, zone_id, camera_id, enrollment_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (int(timestamp), label, confidence, snapshot_path, track_id, zone_id, camera_id, enrollment_id))
+    event_id = cur.lastrowid
+    conn.commit()
+    conn.close()
+    return event_id
+
+
+def link_events_to_replay(event_ids, replay_id):
+    """Point one or more events at the replay clip that recorded them"""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("INSERT INTO events (timestamp, label, confidence, snapshot_path) VALUES (?, ?, ?, ?)",
-                (int(timestamp), label, confidence, snapshot_path))
+    cur.executemany("UPDATE events SET replay_id = ? WHERE id = ?",
+                    [(int(replay_id), int(eid)) for eid in event_ids])
     conn.commit()
     conn.close()
 
 
 def clear_events_without_snapshots():
-    """Delete all events that don't have associated snapshots (false positives from old detection)"""
+    """Delete person events that don't have associated snapshots (false positives from old detection)"""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("DELETE FROM events WHERE snapshot_path IS NULL")
+    # Motion events never have snapshots, so leave those alone
+    cur.execute("DELETE FROM events WHERE snapshot_path IS NULL AND label = 'person'")
     deleted = cur.rowcount
     conn.commit()
     conn.close()
@@ -140,21 +330,32 @@ def clear_all_events():
     return deleted
 
 
-def add_photo(timestamp, path):
+def add_photo(timestamp, path, size_bytes=None, camera_id=None, content_hash=None):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("INSERT INTO photos (timestamp, path) VALUES (?, ?)", (int(timestamp), str(path)))
+    cur.execute("INSERT INTO photos (timestamp, path, size_bytes, camera_id, content_hash) VALUES (?, ?, ?, ?, ?)",
+                (int(timestamp), str(path), size_bytes, camera_id, content_hash))
+    photo_id = cur.lastrowid
     conn.commit()
-    cur.execute("SELECT id FROM photos WHERE path = ?", (str(path),))
+    conn.close()
+    return photo_id
+
+
+def find_photo_by_hash(content_hash):
+    """Path of a live photo with this content, or None"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT path FROM photos WHERE content_hash = ? AND deleted_at IS NULL ORDER BY id DESC LIMIT 1",
+                (content_hash,))
     row = cur.fetchone()
     conn.close()
-    return row["id"] if row else None
+    return row["path"] if row else None
 
 
 def list_photos(limit=100):
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT id, timestamp, path FROM photos ORDER BY timestamp DESC LIMIT ?", (int(limit),))
+    cur.execute("SELECT id, timestamp, path, camera_id FROM photos WHERE deleted_at IS NULL ORDER BY timestamp DESC LIMIT ?", (int(limit),))
     rows = [dict(r) for r in cur.fetchall()]
     conn.close()
     return rows
@@ -176,25 +377,17 @@ def delete_photo(photo_id):
     return path
 
 
-def delete_all_photos():
-    """Delete all photos and return their paths for file cleanup"""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT path FROM photos")
-    rows = cur.fetchall()
-    paths = [row["path"] for row in rows]
-    cur.execute("DELETE FROM photos")
-    conn.commit()
-    conn.close()
-    return paths
+def tombstone_all_photos():
+    """Mark every photo as deleted in one transaction; the garbage collector removes the files"""
+    return _tombstone_all("photos")
 
 
-def add_replay(timestamp, duration, frame_count, file_size, path):
-    """Add a replay to the database"""
+def add_replay(timestamp, duration, frame_count, file_size, path, camera_id=None):
+    """Add a replay to the database (duration is real playback time in seconds)"""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("INSERT INTO replays (timestamp, duration, frame_count, file_size, path) VALUES (?, ?, ?, ?, ?)",
-                (int(timestamp), int(duration), int(frame_count), int(file_size), str(path)))
+    cur.execute("INSERT INTO replays (timestamp, duration, frame_count, file_size, path, camera_id) VALUES (?, ?, ?, ?, ?, ?)",
+                (int(timestamp), round(float(duration), 3), int(frame_count), int(file_size), str(path), camera_id))
     conn.commit()
     cur.execute("SELECT id FROM replays WHERE path = ?", (str(path),))
     row = cur.fetchone()
@@ -202,11 +395,16 @@ def add_replay(timestamp, duration, frame_count, file_size, path):
     return row["id"] if row else None
 
 
-def list_replays(limit=100):
+def list_replays(limit=100, camera_id=None):
     """List replays sorted by timestamp descending"""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT id, timestamp, duration, frame_count, file_size, path FROM replays ORDER BY timestamp DESC LIMIT ?", (int(limit),))
+    q = "SELECT id, timestamp, duration, frame_count, file_size, path, camera_id FROM replays WHERE deleted_at IS NULL"
+    params = []
+    if camera_id:
+        q += " AND camera_id = ?"
+        params.append(camera_id)
+    cur.execute(q + " ORDER BY timestamp DESC LIMIT ?", params + [int(limit)])
     rows = [dict(r) for r in cur.fetchall()]
     conn.close()
     return rows
@@ -228,40 +426,248 @@ def delete_replay(replay_id):
     return path
 
 
-def delete_all_replays():
-    """Delete all replays and return their paths for file cleanup"""
+def tombstone_all_replays():
+    """Mark every replay as deleted in one transaction; the garbage collector removes the files"""
+    return _tombstone_all("replays")
+
+
+# Tables the garbage collector is allowed to touch (table names can't be SQL parameters)
+GC_TABLES = ("photos", "replays")
+
+
+def _tombstone_all(table):
+    assert table in GC_TABLES
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT path FROM replays")
-    rows = cur.fetchall()
-    paths = [row["path"] for row in rows]
-    cur.execute("DELETE FROM replays")
+    cur.execute(f"UPDATE {table} SET deleted_at = ? WHERE deleted_at IS NULL", (int(time.time()),))
+    marked = cur.rowcount
+    conn.commit()
+    conn.close()
+    return marked
+
+
+def tombstone_rows(table, ids):
+    """Mark specific rows as deleted (used when reconcile finds rows with no file)"""
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    now = int(time.time())
+    cur.executemany(f"UPDATE {table} SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL",
+                    [(now, int(i)) for i in ids])
+    conn.commit()
+    conn.close()
+
+
+def list_tombstoned(table, limit=200):
+    """Get a batch of (id, path) rows waiting for their files to be deleted"""
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, path FROM {table} WHERE deleted_at IS NOT NULL ORDER BY id LIMIT ?", (int(limit),))
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def count_tombstoned(table):
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {table} WHERE deleted_at IS NOT NULL")
+    count = cur.fetchone()[0]
+    conn.close()
+    return count
+
+
+def tombstoned_bytes(table):
+    """Bytes of the rows waiting for the garbage collector (still on disk until it gets to them)"""
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"SELECT COALESCE(SUM({_SIZE_COLUMN[table]}), 0) FROM {table} WHERE deleted_at IS NOT NULL")
+    total = cur.fetchone()[0]
+    conn.close()
+    return total
+
+
+def purge_rows(table, ids):
+    """Really delete rows once their files are gone"""
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany(f"DELETE FROM {table} WHERE id = ?", [(int(i),) for i in ids])
+    conn.commit()
+    conn.close()
+
+
+def list_live_paths(table):
+    """Get (id, path) for every row that isn't tombstoned (for the reconcile scan)"""
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, path FROM {table} WHERE deleted_at IS NULL")
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def set_photo_paths(paths):
+    """paths is a list of (photo_id, path) - for moving photo files around (photo_store.migrate)"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany("UPDATE photos SET path = ? WHERE id = ?", [(str(p), int(i)) for i, p in paths])
+    conn.commit()
+    conn.close()
+
+
+def normalize_snapshot_paths():
+    """Point events saved with a filesystem snapshot path at the public /data/photos/<name> URL instead"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT id, snapshot_path FROM events WHERE snapshot_path IS NOT NULL AND snapshot_path NOT LIKE '/data/photos/%'")
+    fixed = [(f"/data/photos/{Path(r['snapshot_path']).name}", r["id"]) for r in cur.fetchall()]
+    cur.executemany("UPDATE events SET snapshot_path = ? WHERE id = ?", fixed)
+    conn.commit()
+    conn.close()
+    return len(fixed)
+
+
+def get_storage_usage():
+    """Live bytes and row counts per data class, from the running totals"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT kind, bytes, count FROM storage_usage")
+    usage = {r["kind"]: {"bytes": r["bytes"], "count": r["count"]} for r in cur.fetchall()}
+    conn.close()
+    return usage
+
+
+def photos_missing_size(limit=500):
+    """Photos saved before sizes were tracked (the retention task fills these in)"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT id, path FROM photos WHERE size_bytes IS NULL AND deleted_at IS NULL LIMIT ?", (int(limit),))
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def set_photo_sizes(sizes):
+    """sizes is a list of (photo_id, size_bytes)"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany("UPDATE photos SET size_bytes = ? WHERE id = ?", [(int(b), int(i)) for i, b in sizes])
+    conn.commit()
+    conn.close()
+
+
+def tombstone_older_than(table, cutoff_ts):
+    """Mark rows older than cutoff_ts as deleted, returns how many"""
+    assert table in GC_TABLES
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"UPDATE {table} SET deleted_at = ? WHERE deleted_at IS NULL AND timestamp < ?",
+                (int(time.time()), int(cutoff_ts)))
+    marked = cur.rowcount
+    conn.commit()
+    conn.close()
+    return marked
+
+
+def tombstone_oldest(table, count=None, free_bytes=None):
+    """
+    Mark the oldest live rows as deleted until `count` rows or `free_bytes`
+    bytes have been marked (whichever is given). Returns (rows, bytes) marked.
+    """
+    assert table in GC_TABLES
+    size_col = _SIZE_COLUMN[table]
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, COALESCE({size_col}, 0) AS size FROM {table} WHERE deleted_at IS NULL ORDER BY timestamp ASC")
+    ids = []
+    freed = 0
+    for row in cur:
+        if count is not None and len(ids) >= count:
+            break
+        if free_bytes is not None and freed >= free_bytes:
+            break
+        ids.append(row["id"])
+        freed += row["size"]
+    now = int(time.time())
+    cur.executemany(f"UPDATE {table} SET deleted_at = ? WHERE id = ?", [(now, i) for i in ids])
+    conn.commit()
+    conn.close()
+    return len(ids), freed
+
+
+def delete_events_older_than(cutoff_ts):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM events WHERE timestamp < ?", (int(cutoff_ts),))
+    deleted = cur.rowcount
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+def delete_oldest_events(count):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM events WHERE id IN (SELECT id FROM events ORDER BY timestamp ASC LIMIT ?)", (int(count),))
+    deleted = cur.rowcount
     conn.commit()
     conn.close()
-    return paths
+    return deleted
+
+
+def add_ws_event(timestamp, camera, message):
+    """Store an event; returns its seq."""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO ws_events (timestamp, camera, message) VALUES (?, ?, ?)",
+                (float(timestamp), camera, message))
+    seq = cur.lastrowid
+    conn.commit()
+    conn.close()
+    return seq
 
 
-def cleanup_old_replays(keep_count=100):
-    """Delete replays beyond the keep_count limit (keeps newest)"""
+def list_ws_events(after_seq=None, limit=1000):
+    """The `limit` events after after_seq, oldest first; without after_seq the latest `limit`."""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT id, path FROM replays ORDER BY timestamp DESC LIMIT -1 OFFSET ?", (int(keep_count),))
+    if after_seq is None:
+        cur.execute("SELECT * FROM (SELECT * FROM ws_events ORDER BY seq DESC LIMIT ?) ORDER BY seq", (int(limit),))
+    else:
+        cur.execute("SELECT * FROM ws_events WHERE seq > ? ORDER BY seq LIMIT ?", (int(after_seq), int(limit)))
     rows = cur.fetchall()
-    deleted_paths = []
-    for row in rows:
-        cur.execute("DELETE FROM replays WHERE id = ?", (row["id"],))
-        deleted_paths.append(row["path"])
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def last_ws_event_seq():
+    conn = get_conn()
+    row = conn.execute("SELECT MAX(seq) FROM ws_events").fetchone()
+    conn.close()
+    return row[0] or 0
+
+
+def prune_ws_events(up_to_seq):
+    conn = get_conn()
+    conn.execute("DELETE FROM ws_events WHERE seq <= ?", (int(up_to_seq),))
     conn.commit()
     conn.close()
-    return deleted_paths
 
 
-def list_events(limit=100, label=None, start_ts=None, end_ts=None):
+def list_events(limit=100, label=None, start_ts=None, end_ts=None, camera_id=None):
     conn = get_conn()
     cur = conn.cursor()
-    q = "SELECT id, timestamp, label, confidence, snapshot_path FROM events"
+    q = "SELECT id, timestamp, label, confidence, snapshot_path, replay_id, track_id, zone_id, camera_id, enrollment_id FROM events"
     conds = []
     params = []
+    if camera_id:
+        conds.append("camera_id = ?")
+        params.append(camera_id)
     if label:
         conds.append("label = ?")
         params.append(label)
@@ -281,14 +687,42 @@ def list_events(limit=100, label=None, start_ts=None, end_ts=None):
     return rows
 
 
-def heatmap_last_days(days=30):
+EXPORT_COLUMNS = {
+    "events": "id, timestamp, label, confidence, snapshot_path, replay_id, track_id, zone_id, camera_id, enrollment_id",
+    "photos": "id, timestamp, path, size_bytes, camera_id",
+    "replays": "id, timestamp, duration, frame_count, file_size, path, camera_id",
+}
+
+
+def list_rows_between(table, start_ts, end_ts, after_id=0, limit=500, camera_id=None):
+    """
+    One batch of events/photos/replays in a time range, by id (for exports).
+    Keep calling with after_id = the last id until it comes back empty.
+    """
+    columns = EXPORT_COLUMNS[table]
+    conn = get_conn()
+    cur = conn.cursor()
+    q = f"SELECT {columns} FROM {table} WHERE timestamp >= ? AND timestamp <= ? AND id > ?"
+    params = [int(start_ts), int(end_ts), int(after_id)]
+    if table in GC_TABLES:
+        q += " AND deleted_at IS NULL"
+    if camera_id:
+        q += " AND camera_id = ?"
+        params.append(camera_id)
+    cur.execute(q + " ORDER BY id LIMIT ?", params + [int(limit)])
+    rows = [dict(r) for r in cur.fetchall()]
+    conn.close()
+    return rows
+
+
+def heatmap_last_days(days=30, label='person'):
     # return simple bucket counts for last `days` days by weekday (0-6) and hour (0-23)
     import time
     end = int(time.time())
     start = end - days * 86400
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT timestamp FROM events WHERE timestamp >= ?", (start,))
+    cur.execute("SELECT timestamp FROM events WHERE timestamp >= ? AND label = ?", (start, label))
     rows = cur.fetchall()
     buckets = {str(d): {str(h): 0 for h in range(24)} for d in range(7)}
     for r in rows:
@@ -301,6 +735,30 @@ def heatmap_last_days(days=30):
     return buckets
 
 
+def add_spatial_counts(timestamp, cells):
+    """Add centroid counts [(gx, gy, count), ...] to the day containing `timestamp`"""
+    day = int(timestamp) // 86400
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO spatial_heatmap (day, gx, gy, count) VALUES (?, ?, ?, ?)
+        ON CONFLICT(day, gx, gy) DO UPDATE SET count = count + excluded.count
+    """, [(day, gx, gy, n) for gx, gy, n in cells])
+    conn.commit()
+    conn.close()
+
+
+def spatial_heatmap_last_days(days=7):
+    """Centroid counts per grid cell over the last `days` days, as {(gx, gy): count}"""
+    start_day = int(time.time()) // 86400 - int(days) + 1
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT gx, gy, SUM(count) FROM spatial_heatmap WHERE day >= ? GROUP BY gx, gy", (start_day,))
+    cells = {(r[0], r[1]): r[2] for r in cur.fetchall()}
+    conn.close()
+    return cells
+
+
 def get_heatmap_photos(weekday: int, hour: int, days: int = 7, limit: int = 3, label: str = 'person'):
     """Get photos for a specific heatmap cell (weekday/hour)."""
     import time
@@ -344,6 +802,3 @@ def get_heatmap_photos(weekday: int, hour: int, days: int = 7, limit: int = 3, l
                 break
     return results
 
-
-# initialize DB on import
-init_db()
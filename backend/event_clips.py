@@ -0,0 +1,183 @@
+"""
+Automatic event clips: when a person is detected we save a short video with
+a few seconds from *before* the detection (taken from the replay buffer) and
+keep recording for a few seconds after it.
+If someone keeps getting detected, the same clip just gets longer instead of
+making a new clip every few seconds.
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional
+
+from . import database
+from . import video_utils
+
+
+class _OpenClip:
+    """A clip that is still collecting frames."""
+
+    def __init__(self, start: float, end: float, event_id: Optional[int]):
+        self.start = start
+        self.end = end
+        self.event_ids: List[int] = [event_id] if event_id is not None else []
+
+
+class EventClipRecorder:
+    """
+    Turns detection events into MP4 clips.
+    trigger() is cheap and called from the frame broadcaster; the actual
+    encoding happens one clip at a time in a background task so we never run
+    more than one ffmpeg for clips. With several cameras (one recorder each)
+    pass the shared WorkScheduler so they also queue behind each other.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        pre_seconds: float = 5.0,
+        post_seconds: float = 10.0,
+        max_clip_seconds: float = 120.0,
+        max_pending: int = 3,
+        camera_id: Optional[str] = None,
+        scheduler=None,
+    ):
+        self.output_dir = Path(output_dir)
+        self.camera_id = camera_id
+        self.scheduler = scheduler
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        # The replay buffer only holds 5 minutes, so a clip can't be longer than that anyway
+        self.max_clip_seconds = max_clip_seconds
+
+        self._streamer = None
+        self._on_saved: Optional[Callable[[dict], Awaitable[None]]] = None
+        self._clip: Optional[_OpenClip] = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, streamer, on_saved: Optional[Callable[[dict], Awaitable[None]]] = None):
+        """Start the background watcher + encoder tasks (call from the event loop)."""
+        self._streamer = streamer
+        self._on_saved = on_saved
+        self._tasks = [
+            asyncio.create_task(self._watch_open_clip()),
+            asyncio.create_task(self._encode_worker()),
+        ]
+        print(f"[EventClips] {self.camera_id or 'Camera'}: recording {self.pre_seconds:g}s before / {self.post_seconds:g}s after detections")
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def trigger(self, event_id: Optional[int], ts: Optional[float] = None):
+        """A confirmed detection happened at `ts` - start a clip or extend the current one."""
+        ts = ts if ts is not None else time.time()
+        clip = self._clip
+        if clip is not None and ts <= clip.end:
+            # Still inside the current clip: push the end out, capped at max length
+            clip.end = min(ts + self.post_seconds, clip.start + self.max_clip_seconds)
+            if event_id is not None:
+                clip.event_ids.append(event_id)
+            return
+        if clip is not None:
+            # Old clip finished but the watcher hasn't picked it up yet
+            self._close_clip()
+        self._clip = _OpenClip(ts - self.pre_seconds, ts + self.post_seconds, event_id)
+        print(f"[EventClips] Clip started for event {event_id}")
+
+    def is_recording(self) -> bool:
+        return self._clip is not None
+
+    async def _watch_open_clip(self):
+        """Close the open clip once its post-event window has passed."""
+        while True:
+            await asyncio.sleep(0.5)
+            clip = self._clip
+            if clip is None or time.time() < clip.end:
+                continue
+            self._close_clip()
+
+    def _close_clip(self):
+        """Hand the open clip to the encoder."""
+        clip, self._clip = self._clip, None
+        try:
+            self._queue.put_nowait(clip)
+        except asyncio.QueueFull:
+            # Encoder is behind - dropping a clip is better than piling up ffmpeg work
+            print(f"[EventClips] Encode queue full, dropping clip for events {clip.event_ids}")
+
+    async def _encode_worker(self):
+        while True:
+            clip = await self._queue.get()
+            try:
+                await self._encode_clip(clip)
+            except Exception as e:
+                print(f"[EventClips] Error encoding clip: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _encode_clip(self, clip: _OpenClip):
+        streamer = self._streamer
+        if streamer is None:
+            return
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        prefix = f"event-{self.camera_id}" if self.camera_id else "event"
+        length = int(clip.end - clip.start)
+
+        # With the H.264 live view, the clip is its segments glued together (no encode)
+        if getattr(streamer, "hls", None) is not None:
+            # Named after the requested start; the segments begin at the keyframe before it
+            output_path = self.output_dir / f"{prefix}-{int(clip.start)}-{length}s.mp4"
+            metadata = await asyncio.to_thread(streamer.clip_from_segments, clip.start, clip.end, output_path)
+            if metadata is not None:
+                await self._save(clip, output_path, int(metadata["start"]), metadata)
+                return
+
+        frames = await asyncio.to_thread(streamer.get_frames_between, clip.start, clip.end)
+        if not frames:
+            print("[EventClips] No buffered frames for clip, skipping")
+            return
+
+        clip_start = int(frames[0][0])
+        output_path = self.output_dir / f"{prefix}-{clip_start}-{length}s.mp4"
+
+        if self.scheduler is not None:
+            metadata = await self.scheduler.run(
+                "encode", video_utils.frames_to_mp4, frames, output_path, streamer.framerate
+            )
+        else:
+            metadata = await asyncio.to_thread(
+                video_utils.frames_to_mp4, frames, output_path, streamer.framerate
+            )
+        await self._save(clip, output_path, clip_start, metadata)
+
+    async def _save(self, clip: _OpenClip, output_path: Path, clip_start: int, metadata: dict):
+        """Record a finished clip file in the DB and tell the clients."""
+        filename = output_path.name
+        replay_id = await asyncio.to_thread(
+            database.add_replay,
+            clip_start,
+            metadata['duration'],
+            metadata['frame_count'],
+            metadata['file_size'],
+            str(output_path),
+            self.camera_id
+        )
+        if clip.event_ids:
+            await asyncio.to_thread(database.link_events_to_replay, clip.event_ids, replay_id)
+
+        print(f"[EventClips] Saved: {filename} ({metadata['duration']}s, events {clip.event_ids})")
+        if self._on_saved:
+            await self._on_saved({
+                "type": "event",
+                "name": "replay_saved",
+                "id": replay_id,
+                "duration": metadata['duration'],
+                "path": f"/data/replays/{filename}",
+                "event_ids": clip.event_ids,
+                "camera": self.camera_id,
+                "ts": clip_start
+            })
@@ -0,0 +1,133 @@
+"""
+Sequence numbers for the WebSocket events, so a client that reconnects gets
+what it missed instead of reloading everything.
+
+Every "event" / "notification" message is stored in the ws_events table, and
+the row id is its seq (1, 2, 3, ... across restarts, last 5000 kept). Each
+process that serves clients follows that table and sends new rows to its
+clients in seq order, keeping the last 1000 in memory. So it doesn't matter
+which process raised an event - the capture process or any web worker: it
+gets one number and reaches every client on every worker. Events raised in
+this process wake the follower right away; others show up within 0.2 s.
+
+A page reconnects with /ws?last_seq=N and gets the messages after N, then
+
+    {"type": "sync", "seq": <latest>}
+
+or, if those aren't around any more (or N is from some other history),
+
+    {"type": "resync", "seq": <latest>}
+
+and re-fetches its list. Frames, detections and camera state aren't
+sequenced: only the latest one matters for those.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from . import database
+
+SEQUENCED_TYPES = ("event", "notification")
+
+
+class EventLog:
+    def __init__(self, ring_size: int = 1000, keep: int = 5000, poll_interval: float = 0.2):
+        self.ring = deque(maxlen=ring_size)
+        self.keep = keep
+        self.poll_interval = poll_interval
+        # The newest seq sent to this process's clients
+        self.seq = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._appended = 0
+
+    def load(self):
+        """Start from the last seq in the DB, with the ring filled up to there."""
+        with self._lock:
+            if self._loaded:
+                return
+            for r in database.list_ws_events(limit=self.ring.maxlen):
+                self.ring.append(_decode(r))
+            self.seq = database.last_ws_event_seq()
+            self._loaded = True
+
+    @staticmethod
+    def is_sequenced(msg: Dict) -> bool:
+        return msg.get("type") in SEQUENCED_TYPES
+
+    async def append(self, msg: Dict, camera: Optional[str] = None) -> int:
+        """Store an event (which gives it its seq); follow() sends it. Returns the seq."""
+        seq = await asyncio.to_thread(database.add_ws_event, time.time(), camera, json.dumps(msg, default=str))
+        if self._wake is not None:
+            self._wake.set()
+        self._appended += 1
+        if self._appended % 100 == 0:
+            await asyncio.to_thread(database.prune_ws_events, seq - self.keep)
+        return seq
+
+    async def follow(self, deliver: Callable[[Dict, Optional[str]], Awaitable[None]]):
+        """
+        Send every new event, from any process, in seq order: deliver(msg, camera).
+        Runs for good in each process with clients (start it after load()).
+        """
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                rows = await asyncio.to_thread(database.list_ws_events, after_seq=self.seq, limit=500)
+            except Exception as e:
+                print(f"[EventLog] Couldn't read new events: {e}")
+                rows = []
+            for r in rows:
+                msg = _decode(r)
+                with self._lock:
+                    self.ring.append(msg)
+                    self.seq = r["seq"]
+                # No await between the two: a client catching up (since()) either
+                # finds it in the ring or is already among deliver()'s targets
+                await deliver(msg, r["camera"])
+            if len(rows) < 500:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def since(self, last_seq: int) -> Optional[List[Dict]]:
+        """
+        Messages after last_seq from memory: [] if there are none, None if the
+        ring doesn't go back that far (ask since_persisted()).
+        """
+        with self._lock:
+            if last_seq == self.seq:
+                return []
+            if last_seq > self.seq:
+                # From before the DB was reset, or from another install: start over
+                return None
+            if not self.ring or self.ring[0]["seq"] > last_seq + 1:
+                return None
+            missed = [m for m in self.ring if m["seq"] > last_seq]
+            # Only gapless runs (pruned rows leave holes): otherwise the DB decides
+            return missed if len(missed) == self.seq - last_seq else None
+
+    def since_persisted(self, last_seq: int, limit: int = 1000) -> Optional[List[Dict]]:
+        """Same from the DB, up to what's been sent here; None if those are gone too (or too many)."""
+        upto = self.seq
+        rows = [r for r in database.list_ws_events(after_seq=last_seq, limit=limit + 1) if r["seq"] <= upto]
+        if not rows or rows[0]["seq"] != last_seq + 1 or len(rows) > limit or rows[-1]["seq"] != upto:
+            return None
+        return [_decode(r) for r in rows]
+
+    def stats(self) -> Dict:
+        return {"seq": self.seq, "ring": len(self.ring),
+                "oldest_in_ring": self.ring[0]["seq"] if self.ring else None}
+
+
+def _decode(row) -> Dict:
+    msg = json.loads(row["message"])
+    msg["seq"] = row["seq"]
+    return msg
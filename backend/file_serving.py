@@ -0,0 +1,99 @@
+"""
+Serving big media files (replay MP4s) properly: HTTP Range requests so the
+browser can start playing / seek without downloading the whole clip, plus
+ETag caching so it doesn't download the same clip twice.
+"""
+
+import asyncio
+import os
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 256 * 1024
+
+
+def file_etag(stat: os.stat_result) -> str:
+    """Cheap ETag from size + modification time (no need to hash the file)."""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" range into an inclusive (start, end).
+    Returns None if the header is not something we can satisfy.
+    Multi-range requests aren't used by video players, so we don't support them.
+    """
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_s == "":
+            # "bytes=-500" means the last 500 bytes
+            length = int(end_s)
+            if length <= 0:
+                return None
+            return max(size - length, 0), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+async def _read_range(path: Path, start: int, end: int):
+    """Yield the bytes start..end (inclusive) in chunks, reading off the event loop."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        pos = start
+        while pos <= end:
+            n = min(CHUNK_SIZE, end - pos + 1)
+            # pread doesn't move a shared file offset, so no seek needed
+            chunk = await asyncio.to_thread(os.pread, fd, n, pos)
+            if not chunk:
+                break
+            pos += len(chunk)
+            yield chunk
+    finally:
+        os.close(fd)
+
+
+def range_file_response(request: Request, path: Path, media_type: str) -> Response:
+    """
+    Serve `path` with Range/206, ETag/304 and Last-Modified support.
+    Whole-file requests go through FileResponse so the server can use its
+    zero-copy path (ASGI pathsend) when it has one.
+    """
+    stat = path.stat()
+    size = stat.st_size
+    etag = file_etag(stat)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        # Finished clips never change, but they can be deleted - revalidate with the ETag
+        "Cache-Control": "no-cache",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == etag):
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(_read_range(path, start, end), status_code=206,
+                                 media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
@@ -0,0 +1,651 @@
+"""
+Shared-memory frame bus, so more than one uvicorn worker can serve viewers.
+With a single process everything - MJPEG splitting, detection parsing,
+base64, every WebSocket client and every HTTP request - shares one GIL. With
+the bus, the capture process (backend/capture.py) owns the cameras and
+publishes into shared memory, and any number of web workers read from it:
+
+    python -m backend.capture &                                        # cameras, detection events, GC
+    PICAM_ROLE=web uvicorn backend.main:app --workers 4 --port 8080    # viewers
+
+Each camera gets three rings (/dev/shm/<prefix>-<camera>-{live,replay,state}),
+plus one shared <prefix>-events ring:
+  live   - every JPEG frame (a few MB, just enough for the newest frames)
+  replay - the replay buffer: frames the streamer keeps (after thinning), so
+           any worker can cut a clip
+  state  - JSON: latest detections/motion, and a status snapshot once a second
+  events - JSON messages (photo_taken, notifications, ...) the web workers
+           relay to their WebSocket clients
+
+A ring is: header | index slots | data bytes. One writer appends variable-size
+entries to the data area (wrapping around), and records each entry in slot
+seq % slots. Readers never lock. Each read is checked the seqlock way:
+  - the slot's version is set to 0 while the writer fills it, then to seq + 1
+  - the header's data_head (absolute bytes written) moves *before* the
+    writer overwrites old data
+so a reader takes the version, copies the bytes out (or hands them to a
+transform in place), then checks that the version is unchanged
+and data_head hasn't lapped the entry. If either changed, the read is thrown
+away (returns None) and the caller takes the next-newest entry or waits.
+
+Benchmarks:
+    python -m backend.frame_bus                   # ring append/read cost
+    python -m backend.frame_bus --viewers         # viewer capacity, 1 vs 4 web workers
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PREFIX = os.environ.get("PICAM_BUS_PREFIX", "picam")
+REPLAY_BYTES = int(os.environ.get("PICAM_BUS_REPLAY_MB", "96")) * 1024 * 1024
+
+MAGIC = b"PCB1"
+# magic, slots, capacity, created_ns, next_seq, data_head
+_HEADER = struct.Struct("<4s4xQQQQQ")
+HEADER_SIZE = 64
+_NEXT_SEQ_AT = 32
+_DATA_HEAD_AT = 40
+# version (seq + 1, 0 = being written), offset, length, flags, timestamp
+_SLOT = struct.Struct("<QQIId")
+SLOT_SIZE = 32
+
+# state ring entry kinds (the flags field)
+STATE_DETECTIONS = 1
+STATE_STATUS = 2
+
+
+def _json(view: memoryview):
+    return json.loads(bytes(view))
+
+
+# Segments this process created (the tracker should keep cleaning those up)
+_created_here = set()
+
+
+def _open(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without this process taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        if name in _created_here:
+            return shm
+        # Older Pythons register every attach with the resource tracker, which
+        # unlinks the segment when *this* process exits - i.e. any web worker
+        # restarting would pull the frames out from under everyone else
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class SharedRing:
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.name = shm.name
+        self.owner = owner
+        self.buf = shm.buf
+        magic, self.slots, self.capacity, self.created_ns, _, _ = _HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{shm.name} is not a frame bus ring")
+        self._data_at = HEADER_SIZE + self.slots * SLOT_SIZE
+        self._lock = threading.Lock()
+        # Writer-side copies, so appends don't have to read shared memory back
+        self._next_seq = self.next_seq
+        self._head = struct.unpack_from("<Q", self.buf, _DATA_HEAD_AT)[0]
+
+    @classmethod
+    def create(cls, name: str, slots: int, capacity: int) -> "SharedRing":
+        try:
+            # Left over from a capture process that crashed
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        shm = shared_memory.SharedMemory(name, create=True, size=HEADER_SIZE + slots * SLOT_SIZE + capacity)
+        _HEADER.pack_into(shm.buf, 0, MAGIC, slots, capacity, time.time_ns(), 0, 0)
+        _created_here.add(name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRing":
+        return cls(_open(name), owner=False)
+
+    @property
+    def next_seq(self) -> int:
+        """Sequence number the next entry will get (= entries written so far)."""
+        return struct.unpack_from("<Q", self.buf, _NEXT_SEQ_AT)[0]
+
+    def append(self, payload, ts: float, flags: int = 0) -> int:
+        n = len(payload)
+        if n > self.capacity:
+            raise ValueError(f"{n} byte entry doesn't fit in {self.name} ({self.capacity} bytes)")
+        with self._lock:
+            seq = self._next_seq
+            offset = self._head
+            if offset % self.capacity + n > self.capacity:
+                # Don't split an entry across the end; start over at the beginning
+                offset += self.capacity - offset % self.capacity
+            self._head = offset + n
+            slot = HEADER_SIZE + (seq % self.slots) * SLOT_SIZE
+            # Order matters: announce the overwrite, mark the slot busy, write, publish
+            struct.pack_into("<Q", self.buf, _DATA_HEAD_AT, self._head)
+            struct.pack_into("<Q", self.buf, slot, 0)
+            start = self._data_at + offset % self.capacity
+            self.buf[start:start + n] = payload
+            _SLOT.pack_into(self.buf, slot, 0, offset, n, flags, ts)
+            struct.pack_into("<Q", self.buf, slot, seq + 1)
+            self._next_seq = seq + 1
+            struct.pack_into("<Q", self.buf, _NEXT_SEQ_AT, seq + 1)
+        return seq
+
+    def _slot(self, seq: int) -> Tuple[int, int, int, int, float]:
+        return _SLOT.unpack_from(self.buf, HEADER_SIZE + (seq % self.slots) * SLOT_SIZE)
+
+    def read(self, seq: int, transform: Callable = bytes) -> Optional[Tuple[float, int, object]]:
+        """
+        (timestamp, flags, transform(data)) for entry `seq`, or None if it's
+        gone (overwritten, or being written right now). transform gets a
+        memoryview into shared memory, valid only during the call.
+        """
+        version, offset, n, flags, ts = self._slot(seq)
+        if version != seq + 1:
+            return None
+        start = self._data_at + offset % self.capacity
+        with self.buf[start:start + n] as view:
+            result = transform(view)
+        head = struct.unpack_from("<Q", self.buf, _DATA_HEAD_AT)[0]
+        if head - offset > self.capacity or self._slot(seq)[0] != version:
+            return None
+        return ts, flags, result
+
+    def latest(self, flags: Optional[int] = None, transform: Callable = bytes) -> Optional[Tuple[int, float, object]]:
+        """(seq, timestamp, data) of the newest entry (with these flags, if given)."""
+        newest = self.next_seq - 1
+        for seq in range(newest, max(-1, newest - self.slots), -1):
+            if flags is not None and self._slot(seq)[3] != flags:
+                continue
+            # None = mid-write or just overwritten; the one before it will do
+            entry = self.read(seq, transform)
+            if entry is not None:
+                return seq, entry[0], entry[2]
+        return None
+
+    def since(self, seq: int, transform: Callable = bytes) -> Tuple[List[Tuple[int, float, object]], int]:
+        """Entries from `seq` on (older ones that were already overwritten are skipped), and the seq to ask for next."""
+        end = self.next_seq
+        out = []
+        for s in range(max(seq, end - self.slots), end):
+            entry = self.read(s, transform)
+            if entry is not None:
+                out.append((s, entry[0], entry[2]))
+        return out, end
+
+    def between(self, start_ts: float, end_ts: float, transform: Callable = bytes) -> List[Tuple[float, object]]:
+        """(timestamp, data) of entries with start_ts <= ts <= end_ts, oldest first."""
+        end = self.next_seq
+        out = []
+        for seq in range(max(0, end - self.slots), end):
+            version, _, _, _, ts = self._slot(seq)
+            if version != seq + 1 or not start_ts <= ts <= end_ts:
+                continue
+            entry = self.read(seq, transform)
+            if entry is not None:
+                out.append((entry[0], entry[2]))
+        return out
+
+    def stats(self) -> Dict:
+        """Entries and bytes still readable, and how many seconds they cover."""
+        end = self.next_seq
+        head = struct.unpack_from("<Q", self.buf, _DATA_HEAD_AT)[0]
+        frames, size, oldest, newest = 0, 0, None, None
+        for seq in range(max(0, end - self.slots), end):
+            version, offset, n, _, ts = self._slot(seq)
+            if version != seq + 1 or head - offset > self.capacity:
+                continue
+            frames += 1
+            size += n
+            oldest = ts if oldest is None else oldest
+            newest = ts
+        return {"frames": frames, "bytes": size, "seconds": round(newest - oldest, 1) if frames else 0.0}
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FrameBus:
+    """One camera's rings. create=True in the capture process, False (attach) in web workers."""
+
+    def __init__(self, camera_id: str, prefix: str = DEFAULT_PREFIX, create: bool = False,
+                 replay_bytes: int = REPLAY_BYTES):
+        self.camera_id = camera_id
+        base = f"{prefix}-{camera_id}"
+        if create:
+            self.live = SharedRing.create(f"{base}-live", slots=64, capacity=4 * 1024 * 1024)
+            # 8192 slots = 9 minutes at 15 fps, more than the bytes will hold anyway
+            self.replay = SharedRing.create(f"{base}-replay", slots=8192, capacity=replay_bytes)
+            self.state = SharedRing.create(f"{base}-state", slots=256, capacity=1024 * 1024)
+        else:
+            self.live = SharedRing.attach(f"{base}-live")
+            self.replay = SharedRing.attach(f"{base}-replay")
+            self.state = SharedRing.attach(f"{base}-state")
+
+    # -- capture process side --
+
+    def publish_frame(self, frame: bytes, ts: float):
+        self.live.append(frame, ts)
+
+    def buffer_frame(self, ts: float, frame: bytes):
+        self.replay.append(frame, ts)
+
+    def publish_state(self, kind: int, data: Dict):
+        self.state.append(json.dumps(data, default=str).encode(), time.time(), kind)
+
+    # -- web worker side --
+
+    def latest_frame(self, transform: Callable = bytes) -> Optional[Tuple[int, float, object]]:
+        return self.live.latest(transform=transform)
+
+    def get_state(self, kind: int) -> Optional[Tuple[float, Dict]]:
+        entry = self.state.latest(flags=kind, transform=_json)
+        return (entry[1], entry[2]) if entry else None
+
+    def close(self):
+        for ring in (self.live, self.replay, self.state):
+            ring.close()
+
+
+class EventBus:
+    """WebSocket messages from the capture process to every web worker."""
+
+    def __init__(self, prefix: str = DEFAULT_PREFIX, create: bool = False):
+        name = f"{prefix}-events"
+        self.ring = (SharedRing.create(name, slots=1024, capacity=2 * 1024 * 1024) if create
+                     else SharedRing.attach(name))
+
+    def publish(self, msg: Dict, camera: Optional[str] = None):
+        self.ring.append(json.dumps({"msg": msg, "camera": camera}, default=str).encode(), time.time())
+
+    def read_since(self, seq: int) -> Tuple[List[Dict], int]:
+        entries, next_seq = self.ring.since(seq, transform=_json)
+        return [data for _, _, data in entries], next_seq
+
+    def close(self):
+        self.ring.close()
+
+
+class EventPublisher:
+    """
+    Stands in for main.py's ConnectionManager in the capture process: there
+    are no WebSocket clients there, so broadcasts go onto the event bus and
+    the web workers send them on. Frames and detections already travel
+    through the per-camera rings, so those are dropped here. Events go
+    into the ws_events table instead, which every web worker follows
+    (see event_log.py).
+    """
+
+    def __init__(self, bus: EventBus, log):
+        self.bus = bus
+        self.log = log
+        self.active: List = []
+
+    async def broadcast_json(self, msg: dict, camera: Optional[str] = None):
+        if msg.get("type") in ("frame", "detections"):
+            return
+        if self.log.is_sequenced(msg):
+            try:
+                await self.log.append(msg, camera)
+                return
+            except Exception as e:
+                print(f"[EventLog] Couldn't store event: {e}")
+        self.bus.publish(msg, camera)
+
+
+class _BusSource:
+    """The bits of FrameSource that /api/health and /api/camera/log use, from the status snapshot."""
+
+    def __init__(self, streamer: "BusStreamer"):
+        self._streamer = streamer
+
+    @property
+    def name(self) -> str:
+        return self._streamer.status().get("source") or "frame-bus"
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._streamer.status().get("pid")
+
+    def is_alive(self) -> bool:
+        return self._streamer.is_running()
+
+    def log_stats(self) -> Dict:
+        return self._streamer.status().get("log") or {}
+
+    def recent_log(self, limit: int = 100, level: Optional[str] = None) -> List[Dict]:
+        order = ["debug", "info", "warn", "error"]
+        lines = self._streamer.status().get("log_tail") or []
+        if level in order:
+            lines = [l for l in lines if order.index(l["level"]) >= order.index(level)]
+        return lines[-limit:]
+
+
+class BusStreamer:
+    """
+    Read-only stand-in for RPiCamStreaming in a web worker, backed by the
+    capture process's rings. Attaches lazily (the capture process may start
+    later than us) and re-attaches if the capture process was restarted.
+    """
+
+    def __init__(self, camera_id: str, prefix: str = DEFAULT_PREFIX, zones_file=None, framerate: int = 15):
+        self.camera_id = camera_id
+        self.prefix = prefix
+        self.zones_file = zones_file
+        self.framerate = framerate
+        self.source = _BusSource(self)
+        self._bus: Optional[FrameBus] = None
+        self._last_attach_try = 0.0
+        self._zones = None
+        self._lock = threading.Lock()
+
+    def _get_bus(self) -> Optional[FrameBus]:
+        bus = self._bus
+        now = time.time()
+        stale = bus is None or self._frame_age(bus) > 2.0
+        if not stale or now - self._last_attach_try < 1.0:
+            return bus
+        with self._lock:
+            self._last_attach_try = now
+            try:
+                fresh = FrameBus(self.camera_id, self.prefix)
+            except (FileNotFoundError, ValueError):
+                return bus
+            if bus is not None and fresh.live.created_ns == bus.live.created_ns:
+                # Same capture process, just quiet - keep what we have
+                fresh.close()
+                return bus
+            if bus is not None:
+                print(f"[FrameBus] {self.camera_id}: capture process restarted, re-attaching")
+                try:
+                    bus.close()
+                except BufferError:
+                    pass  # a reader still has a view; the old mapping goes when the GC gets it
+            self._bus = fresh
+            return fresh
+
+    @staticmethod
+    def _frame_age(bus: FrameBus) -> float:
+        seq = bus.live.next_seq - 1
+        if seq < 0:
+            return float("inf")
+        return time.time() - bus.live._slot(seq)[4]
+
+    def status(self) -> Dict:
+        bus = self._get_bus()
+        entry = bus.get_state(STATE_STATUS) if bus else None
+        return entry[1] if entry else {}
+
+    def get_frame(self) -> Optional[bytes]:
+        bus = self._get_bus()
+        entry = bus.latest_frame() if bus else None
+        return entry[2] if entry else None
+
+    def get_frame_base64(self) -> Optional[str]:
+        """Latest frame as base64."""
+        import base64
+        # Copy out, then encode: measured a bit faster than encoding in place (python -m backend.frame_bus)
+        frame = self.get_frame()
+        return base64.b64encode(frame).decode("ascii") if frame else None
+
+    def get_frame_info(self) -> Dict:
+        bus = self._get_bus()
+        info = dict(self.status().get("frame_info") or {})
+        last = None
+        if bus is not None and bus.live.next_seq:
+            last = bus.live._slot(bus.live.next_seq - 1)[4]
+        info.update({
+            "frames_seen": bus.live.next_seq if bus else 0,
+            "started_at": info.get("started_at"),
+            "first_frame_at": info.get("first_frame_at"),
+            "last_frame_at": last,
+            "last_frame_age": round(time.time() - last, 2) if last else None,
+        })
+        return info
+
+    def _detections_state(self) -> Dict:
+        bus = self._get_bus()
+        entry = bus.get_state(STATE_DETECTIONS) if bus else None
+        return entry[1] if entry else {}
+
+    def get_detections(self) -> List[Dict]:
+        return self._detections_state().get("detections") or []
+
+    def get_motion(self) -> Optional[Dict]:
+        return self._detections_state().get("motion")
+
+    def pop_track_events(self) -> List[Dict]:
+        # Photos, events and clips for tracks happen in the capture process
+        return []
+
+    def get_zones(self):
+        if self._zones is None:
+            from .zones import ZoneAnalyzer
+            self._zones = ZoneAnalyzer.from_file(self.zones_file) if self.zones_file else ZoneAnalyzer.from_file()
+        return self._zones
+
+    def get_recent_frames(self, seconds: float) -> List[tuple]:
+        return self.get_frames_between(time.time() - seconds, float("inf"))
+
+    def get_frames_between(self, start: float, end: float) -> List[tuple]:
+        bus = self._get_bus()
+        return bus.replay.between(start, end) if bus else []
+
+    def get_buffer_stats(self) -> Dict:
+        bus = self._get_bus()
+        stats = bus.replay.stats() if bus else {"frames": 0, "bytes": 0, "seconds": 0.0}
+        return {**(self.status().get("buffer") or {}), **stats}
+
+    def is_running(self) -> bool:
+        status = self.status()
+        age = self.get_frame_info()["last_frame_age"]
+        return bool(status.get("running")) and age is not None and age < 5
+
+
+class RemoteSupervisor:
+    """What a web worker knows about the capture process's supervisor: its last published stats."""
+
+    def __init__(self, camera_id: str, get_streamer: Callable[[], "BusStreamer"]):
+        self.camera_id = camera_id
+        # A getter, like StreamSupervisor's: the BusStreamer is built in the bring-up, not here
+        self.get_streamer = get_streamer
+
+    @property
+    def state(self) -> str:
+        return self.stats()["state"]
+
+    def stats(self) -> Dict:
+        return self.get_streamer().status().get("supervisor") or {"camera": self.camera_id, "state": "starting"}
+
+    def start(self, on_state_change=None):
+        pass
+
+    def stop(self):
+        pass
+
+
+def _bench_ring(frames: int = 3000, frame_size: int = 40_000):
+    """Append/read cost of the live ring for typical 640x480 JPEG sizes."""
+    import base64
+
+    prefix = f"picam-bench-{os.getpid()}"
+    writer = FrameBus("bench", prefix, create=True, replay_bytes=16 * 1024 * 1024)
+    reader = FrameBus("bench", prefix)
+    frame = os.urandom(frame_size)
+    try:
+        start = time.perf_counter()
+        for i in range(frames):
+            writer.publish_frame(frame, time.time())
+        append_us = (time.perf_counter() - start) * 1e6 / frames
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            reader.latest_frame()
+        copy_us = (time.perf_counter() - start) * 1e6 / frames
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            reader.latest_frame(transform=base64.b64encode)
+        b64_us = (time.perf_counter() - start) * 1e6 / frames
+        start = time.perf_counter()
+        for _ in range(frames):
+            base64.b64encode(reader.latest_frame()[2])
+        b64_plain_us = (time.perf_counter() - start) * 1e6 / frames
+
+        # A reader that's too slow gets None instead of torn data
+        old = reader.live.latest()[0]
+        for _ in range(200):
+            writer.publish_frame(frame, time.time())
+        assert reader.live.read(old) is None, "overwritten entry should not be readable"
+
+        print(f"{frame_size // 1000} KB frames: append {append_us:.1f} us, read (copy) {copy_us:.1f} us, "
+              f"base64 from shared memory {b64_us:.1f} us (vs {b64_plain_us:.1f} us copy + base64)")
+    finally:
+        reader.close()
+        writer.close()
+
+
+def _bench_viewers(workers_options=(1, 4), viewer_steps=(5, 10, 20, 40, 80), seconds: float = 8.0,
+                   port: int = 18080):
+    """
+    Viewer capacity: start the capture process off a synthetic recording,
+    then uvicorn with 1 and 4 web workers, and add MJPEG viewers until they
+    stop getting frames at the camera's rate. Each viewer counts the frames
+    it receives; a viewer is "served" if it got >= 80% of the frames a single
+    viewer gets. Also runs WebSocket viewers if the websockets package is installed.
+    """
+    import asyncio
+    import statistics
+    import subprocess
+    import sys
+    import tempfile
+    from pathlib import Path
+
+    from .pipeline_bench import generate_recording
+
+    root = Path(__file__).resolve().parents[1]
+
+    async def mjpeg_viewer(deadline: float) -> int:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /stream.mjpg HTTP/1.1\r\nHost: bench\r\n\r\n")
+        await writer.drain()
+        frames = 0
+        try:
+            while time.time() < deadline:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), timeout=max(0.01, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+                if line.startswith(b"Content-Length:"):
+                    frames += 1
+        finally:
+            writer.close()
+        return frames
+
+    async def ws_viewer(deadline: float) -> int:
+        import websockets
+        frames = 0
+        async with websockets.connect(f"ws://127.0.0.1:{port}/ws", max_size=None) as ws:
+            while time.time() < deadline:
+                try:
+                    msg = await asyncio.wait_for(ws.recv(), timeout=max(0.01, deadline - time.time()))
+                except asyncio.TimeoutError:
+                    break
+                if '"type": "frame"' in msg[:40] or '"type":"frame"' in msg[:40]:
+                    frames += 1
+        return frames
+
+    async def run_viewers(viewer, count: int) -> List[int]:
+        deadline = time.time() + seconds
+        results = await asyncio.gather(*(viewer(deadline) for _ in range(count)), return_exceptions=True)
+        return [r if isinstance(r, int) else 0 for r in results]
+
+    def wait_ready(timeout: float = 60.0):
+        import urllib.request
+        end = time.time() + timeout
+        while time.time() < end:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health", timeout=1) as r:
+                    if json.loads(r.read()).get("status") == "ok":
+                        return
+            except Exception:
+                pass
+            time.sleep(0.3)
+        raise RuntimeError("web workers never became healthy")
+
+    try:
+        import websockets  # noqa: F401
+        kinds = {"mjpeg": mjpeg_viewer, "websocket": ws_viewer}
+    except ImportError:
+        kinds = {"mjpeg": mjpeg_viewer}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        mjpeg, meta = generate_recording(Path(tmp) / "rec", seconds=10)
+        env = dict(os.environ, PICAM_REPLAY_MJPEG=str(mjpeg), PICAM_REPLAY_METADATA=str(meta),
+                   PICAM_DATA_DIR=str(Path(tmp) / "data"), PICAM_CAMERAS=str(Path(tmp) / "no-cameras.json"),
+                   PICAM_BUS_PREFIX=f"picam-bench-{os.getpid()}", PICAM_BUS_REPLAY_MB="16")
+        capture = subprocess.Popen([sys.executable, "-m", "backend.capture"], cwd=root, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for workers in workers_options:
+                web = subprocess.Popen(
+                    [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                     "--workers", str(workers), "--log-level", "warning"],
+                    cwd=root, env=dict(env, PICAM_ROLE="web"),
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                try:
+                    wait_ready()
+                    for kind, viewer in kinds.items():
+                        baseline = statistics.median(asyncio.run(run_viewers(viewer, 1))) or 1
+                        capacity = 0
+                        for count in viewer_steps:
+                            got = asyncio.run(run_viewers(viewer, count))
+                            served = sum(1 for g in got if g >= 0.8 * baseline)
+                            print(f"workers={workers} {kind}: {count} viewers -> median {statistics.median(got)} "
+                                  f"frames (1 viewer: {baseline}), {served} served", flush=True)
+                            if served < count:
+                                break
+                            capacity = count
+                        results[f"{kind}_workers_{workers}"] = capacity
+                finally:
+                    web.terminate()
+                    web.wait(timeout=10)
+        finally:
+            capture.terminate()
+            capture.wait(timeout=10)
+    print(json.dumps({"viewer_capacity": results, "cpus": os.cpu_count()}, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    if "--viewers" in sys.argv:
+        _bench_viewers()
+    else:
+        _bench_ring()
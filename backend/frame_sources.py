@@ -0,0 +1,289 @@
+"""
+Where RPiCamStreaming gets its frames and detection metadata from.
+A source hands back a byte stream of MJPEG data and writes rpicam-vid style
+metadata (one JSON object per line) to the metadata file. The streamer
+doesn't care whether that's the real camera or a recording.
+
+  RPiCamVidSource  - the real thing: rpicam-vid with the IMX500
+  FileReplaySource - replays a recorded .mjpeg file plus its metadata JSON,
+                     at real time or as fast as possible. Lets us run and
+                     benchmark the whole pipeline on any Linux box.
+"""
+
+import json
+import os
+import signal
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+from .rpicam_log import RPiCamLogParser
+
+CONFIG_DIR = Path(__file__).resolve().parents[1] / "config"
+
+
+class FrameSource:
+    """Interface for frame/metadata sources."""
+
+    name = "source"
+
+    def start(self, width: int, height: int, framerate: int, metadata_file: Path) -> BinaryIO:
+        """Start producing; returns a readable byte stream of MJPEG data."""
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def is_alive(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def pid(self) -> Optional[int]:
+        return None
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return None
+
+    def recent_log(self, limit: int = 100, level: Optional[str] = None) -> List[Dict]:
+        """Last lines of the source's own log output (stderr for rpicam-vid)."""
+        return []
+
+    def log_stats(self) -> Dict:
+        """Numbers parsed from that log (actual fps, dropped frames, ...)."""
+        return {}
+
+
+class RPiCamVidSource(FrameSource):
+    """rpicam-vid streaming MJPEG to stdout and IMX500 detections to the metadata file."""
+
+    name = "rpicam-vid"
+
+    def __init__(self, post_process_file: Path = CONFIG_DIR / "imx500_person_detection.json",
+                 camera: Optional[int] = None):
+        # Use custom config WITHOUT object_detect_draw_cv (no boxes burned into stream)
+        # The default /usr/share/rpi-camera-assets/imx500_mobilenet_ssd.json draws on video
+        self.post_process_file = Path(post_process_file)
+        # Camera index for `rpicam-vid --camera N` when there's more than one (None = rpicam-vid's default)
+        self.camera = camera
+        self._process: Optional[subprocess.Popen] = None
+        self._stderr_thread: Optional[threading.Thread] = None
+        self.log = RPiCamLogParser()
+
+    def start(self, width: int, height: int, framerate: int, metadata_file: Path) -> BinaryIO:
+        # Build command: stream MJPEG to stdout, metadata to file
+        cmd = [
+            "rpicam-vid",
+            "--post-process-file", str(self.post_process_file),
+            "--width", str(width),
+            "--height", str(height),
+            "--framerate", str(framerate),
+            "--nopreview",
+            "--codec", "mjpeg",
+            "--metadata", str(metadata_file),
+            "--metadata-format", "json",
+            "-t", "0",  # Run indefinitely
+            "-o", "-",  # MJPEG to stdout
+        ]
+        if self.camera is not None:
+            cmd[1:1] = ["--camera", str(self.camera)]
+
+        print(f"[RPiCamVidSource] Command: {' '.join(cmd)}")
+        self.log.new_run()
+        self._process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            preexec_fn=os.setsid
+        )
+        # Nobody reading stderr means rpicam-vid blocks once the pipe buffer
+        # (64 KiB) fills up, which freezes the stream - so always drain it
+        self._stderr_thread = threading.Thread(
+            target=self._drain_stderr, args=(self._process.stderr,),
+            daemon=True, name="RPiCam-Stderr"
+        )
+        self._stderr_thread.start()
+        return self._process.stdout
+
+    def _drain_stderr(self, stream: BinaryIO):
+        # Plain os.read so a progress bar without a newline can't hold us up
+        fd = stream.fileno()
+        tail = b""
+        try:
+            while True:
+                data = os.read(fd, 4096)
+                if not data:
+                    break
+                tail = self.log.feed_bytes(tail, data)
+            if tail:
+                self.log.feed(tail.decode("utf-8", "replace"))
+        except OSError:
+            pass
+        finally:
+            stream.close()
+
+    def recent_log(self, limit: int = 100, level: Optional[str] = None) -> List[Dict]:
+        return self.log.recent(limit, level)
+
+    def log_stats(self) -> Dict:
+        return self.log.stats()
+
+    def stop(self):
+        if not self._process:
+            return
+        # Kill process group
+        try:
+            os.killpg(os.getpgid(self._process.pid), signal.SIGTERM)
+            self._process.wait(timeout=5)
+            print("[RPiCamVidSource] Process terminated")
+        except subprocess.TimeoutExpired:
+            os.killpg(os.getpgid(self._process.pid), signal.SIGKILL)
+            self._process.wait()
+        except Exception as e:
+            print(f"[RPiCamVidSource] Stop error: {e}")
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+
+    @property
+    def exit_code(self) -> Optional[int]:
+        return self._process.poll() if self._process else None
+
+
+def split_mjpeg(data: bytes) -> List[bytes]:
+    """Split a concatenated MJPEG file into JPEG frames."""
+    frames = []
+    pos = 0
+    while True:
+        start = data.find(b"\xff\xd8", pos)
+        if start < 0:
+            break
+        end = data.find(b"\xff\xd9", start)
+        if end < 0:
+            break
+        frames.append(data[start:end + 2])
+        pos = end + 2
+    return frames
+
+
+def read_metadata_lines(path: Path) -> List[str]:
+    """Per-frame JSON objects from an rpicam-vid metadata file (the surrounding [ ] are dropped)."""
+    lines = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if line and line not in ('[', ']'):
+                lines.append(line)
+    return lines
+
+
+class FileReplaySource(FrameSource):
+    """
+    Replays a recording through a pipe, so the streamer's reader threads run
+    exactly as they would against rpicam-vid.
+    With realtime=True frames are paced at the recording's frame rate (or its
+    SensorTimestamp values if the metadata has them); with realtime=False they
+    are pushed as fast as the reader can take them.
+    """
+
+    name = "file-replay"
+
+    def __init__(self, mjpeg_file: Path, metadata_file: Optional[Path] = None,
+                 realtime: bool = True, loop: bool = False, stall_after: Optional[int] = None):
+        self.mjpeg_file = Path(mjpeg_file)
+        self.recorded_metadata = Path(metadata_file) if metadata_file else None
+        self.realtime = realtime
+        self.loop = loop
+        # Testing aid: after this many frames, hang with the pipe still open,
+        # like a wedged rpicam-vid that is alive but sends nothing
+        self.stall_after = stall_after
+
+        self._frames = split_mjpeg(self.mjpeg_file.read_bytes())
+        self._metadata = read_metadata_lines(self.recorded_metadata) if self.recorded_metadata else []
+        if not self._frames:
+            raise ValueError(f"No JPEG frames found in {self.mjpeg_file}")
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._write_fd: Optional[int] = None
+        self.frames_sent = 0
+        self.finished = threading.Event()
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._frames)
+
+    def _frame_times(self, framerate: int) -> Iterator[float]:
+        """Seconds from the start of the recording for each frame."""
+        stamps = []
+        for line in self._metadata[:len(self._frames)]:
+            try:
+                stamps.append(json.loads(line).get("SensorTimestamp"))
+            except (json.JSONDecodeError, AttributeError):
+                stamps.append(None)
+        if len(stamps) == len(self._frames) and all(isinstance(s, (int, float)) for s in stamps):
+            # SensorTimestamp is in nanoseconds
+            return iter([(s - stamps[0]) / 1e9 for s in stamps])
+        return iter([i / framerate for i in range(len(self._frames))])
+
+    def start(self, width: int, height: int, framerate: int, metadata_file: Path) -> BinaryIO:
+        read_fd, self._write_fd = os.pipe()
+        self._stop.clear()
+        self.finished.clear()
+        self.frames_sent = 0
+        self._thread = threading.Thread(
+            target=self._play, args=(framerate, Path(metadata_file)),
+            daemon=True, name="FileReplaySource"
+        )
+        self._thread.start()
+        return os.fdopen(read_fd, "rb", buffering=0)
+
+    def _play(self, framerate: int, metadata_file: Path):
+        out = os.fdopen(self._write_fd, "wb", buffering=0)
+        meta = open(metadata_file, "w")
+        try:
+            meta.write("[\n")
+            meta.flush()
+            while not self._stop.is_set():
+                times = list(self._frame_times(framerate))
+                start = time.monotonic()
+                for i, frame in enumerate(self._frames):
+                    if self._stop.is_set():
+                        break
+                    if self.stall_after is not None and self.frames_sent >= self.stall_after:
+                        self._stop.wait()
+                        break
+                    if self.realtime:
+                        delay = start + times[i] - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    out.write(frame)
+                    if i < len(self._metadata):
+                        meta.write(self._metadata[i] + ",\n")
+                        meta.flush()
+                    self.frames_sent += 1
+                if not self.loop:
+                    break
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            meta.close()
+            try:
+                out.close()  # reader sees EOF, same as rpicam-vid exiting
+            except OSError:
+                pass
+            self.finished.set()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
@@ -0,0 +1,711 @@
+"""
+H.264 live view: the camera's frames as fragmented-MP4 HLS.
+MJPEG is 5-10x the bandwidth of H.264, which hurts over Tailscale. With
+`"h264": true` on a camera (or PICAM_LIVE_H264=1 for the default one) the
+streamer also pushes its JPEG frames through an H.264 encoder (ffmpeg:
+libx264, or h264_v4l2m2m on a Pi 4 via PICAM_H264_ENCODER), and this module
+cuts the encoder's Annex B output into ~2 s fMP4 segments at keyframes -
+no ffmpeg muxer, just a few MP4 boxes written here. The last few minutes of
+segments stay in memory:
+
+  GET /live.m3u8              sliding-window HLS playlist (or /cam/<id>/live.m3u8)
+  GET /hls/init.mp4           init segment (SPS/PPS)
+  GET /hls/<seq>.m4s          media segments
+
+The same segments double as a replay buffer: a replay/event clip that the
+segments cover is init + its segments written one after the other (a
+fragmented MP4 that plays anywhere), instead of a JPEG -> H.264 encode.
+Detections, motion, photos and the MJPEG/WebSocket views still run off the
+JPEG frames, as before.
+
+PICAM_REPLAY_H264=rec.h264 feeds an Annex B recording (say from
+`ffmpeg -f lavfi -i testsrc=size=640x480:rate=15 -t 30 -c:v libx264 -g 30
+-bf 0 -f h264 rec.h264`) to the segmenter in place of the encoder.
+
+Try it (uses ffmpeg for input if installed, else a built-in generator):
+    python -m backend.hls [rec.h264]
+"""
+
+import math
+import os
+import queue
+import struct
+import subprocess
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+
+TIMESCALE = 90000
+TARGET_SECONDS = 2.0
+PLAYLIST_SEGMENTS = 6
+
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+SEGMENTS_MADE = metrics.counter("hls_segments_total", "fMP4 segments cut from the H.264 stream", ("camera",))
+SEGMENT_BYTES = metrics.counter("hls_segment_bytes_total", "Bytes of fMP4 segments made", ("camera",))
+ENCODER_DROPS = metrics.counter("h264_encoder_dropped_frames_total", "JPEG frames not encoded because the encoder was behind", ("camera",))
+
+
+# ---------------------------------------------------------------------------
+# Annex B byte stream -> NAL units -> access units (one per frame)
+# ---------------------------------------------------------------------------
+
+class AccessUnitReader:
+    """
+    Splits an Annex B byte stream (00 00 01 start codes) into access units,
+    fed in arbitrary chunks. An access unit is handed out once the next one
+    starts, so there's always one frame held back.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._au: List[bytes] = []
+        self._has_vcl = False
+
+    def feed(self, data: bytes) -> List[List[bytes]]:
+        self._buf += data
+        done: List[List[bytes]] = []
+        start = self._buf.find(b"\x00\x00\x01")
+        if start < 0:
+            return done
+        while True:
+            nxt = self._buf.find(b"\x00\x00\x01", start + 3)
+            if nxt < 0:
+                break
+            self._add_nal(bytes(self._buf[start + 3:nxt]).rstrip(b"\x00"), done)
+            start = nxt
+        del self._buf[:start]
+        return done
+
+    def flush(self) -> List[List[bytes]]:
+        """End of stream: the last NAL and access unit."""
+        done: List[List[bytes]] = []
+        if self._buf.startswith(b"\x00\x00\x01"):
+            self._add_nal(bytes(self._buf[3:]).rstrip(b"\x00"), done)
+        self._buf.clear()
+        if self._au and self._has_vcl:
+            done.append(self._au)
+        self._au, self._has_vcl = [], False
+        return done
+
+    def _add_nal(self, nal: bytes, done: List[List[bytes]]):
+        if not nal:
+            return
+        kind = nal[0] & 0x1F
+        vcl = kind in (NAL_SLICE, NAL_IDR)
+        # first_mb_in_slice == 0 (ue(v) "1") starts a new picture
+        new_picture = vcl and len(nal) > 1 and nal[1] & 0x80
+        if self._has_vcl and (new_picture or kind in (NAL_SEI, NAL_SPS, NAL_PPS, NAL_AUD)):
+            done.append(self._au)
+            self._au, self._has_vcl = [], False
+        self._au.append(nal)
+        self._has_vcl = self._has_vcl or vcl
+
+
+def split_access_units(data: bytes) -> List[List[bytes]]:
+    """A whole Annex B file -> access units."""
+    reader = AccessUnitReader()
+    return reader.feed(data) + reader.flush()
+
+
+def _unescape(nal: bytes) -> bytes:
+    """NAL payload -> RBSP (drop the emulation prevention 03 in 00 00 03)."""
+    return nal.replace(b"\x00\x00\x03", b"\x00\x00")
+
+
+class _BitReader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def u(self, n: int) -> int:
+        value = 0
+        for _ in range(n):
+            byte = self.data[self.pos >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.pos & 7))) & 1)
+            self.pos += 1
+        return value
+
+    def ue(self) -> int:
+        zeros = 0
+        while self.u(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.u(zeros)
+
+    def se(self) -> int:
+        k = self.ue()
+        return (k + 1) // 2 if k & 1 else -(k // 2)
+
+
+def parse_sps(nal: bytes) -> Dict:
+    """Profile, level and picture size from a sequence parameter set NAL."""
+    r = _BitReader(_unescape(nal[1:]))
+    profile, compat, level = r.u(8), r.u(8), r.u(8)
+    r.ue()  # seq_parameter_set_id
+    chroma_format, depth_luma, depth_chroma = 1, 0, 0
+    if profile in (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):
+        chroma_format = r.ue()
+        if chroma_format == 3:
+            r.u(1)  # separate_colour_plane_flag
+        depth_luma, depth_chroma = r.ue(), r.ue()
+        r.u(1)  # qpprime_y_zero_transform_bypass_flag
+        if r.u(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format != 3 else 12):
+                if r.u(1):
+                    last, nxt = 8, 8
+                    for _ in range(16 if i < 6 else 64):
+                        if nxt:
+                            nxt = (last + r.se()) % 256
+                        last = nxt or last
+    r.ue()  # log2_max_frame_num_minus4
+    poc_type = r.ue()
+    if poc_type == 0:
+        r.ue()
+    elif poc_type == 1:
+        r.u(1)
+        r.se()
+        r.se()
+        for _ in range(r.ue()):
+            r.se()
+    r.ue()  # max_num_ref_frames
+    r.u(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs, height_units = r.ue() + 1, r.ue() + 1
+    frame_mbs_only = r.u(1)
+    if not frame_mbs_only:
+        r.u(1)
+    r.u(1)  # direct_8x8_inference_flag
+    crop = (0, 0, 0, 0)
+    if r.u(1):
+        crop = (r.ue(), r.ue(), r.ue(), r.ue())
+    crop_x = 2 if chroma_format in (1, 2) else 1
+    crop_y = (2 if chroma_format == 1 else 1) * (2 - frame_mbs_only)
+    return {
+        "profile": profile,
+        "compat": compat,
+        "level": level,
+        "chroma_format": chroma_format,
+        "bit_depth_luma": depth_luma + 8,
+        "bit_depth_chroma": depth_chroma + 8,
+        "width": width_mbs * 16 - crop_x * (crop[0] + crop[1]),
+        "height": (2 - frame_mbs_only) * height_units * 16 - crop_y * (crop[2] + crop[3]),
+    }
+
+
+# ---------------------------------------------------------------------------
+# fMP4 boxes
+# ---------------------------------------------------------------------------
+
+_MATRIX = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+
+def _box(kind: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I", 8 + len(body)) + kind + body
+
+
+def _full_box(kind: bytes, version: int, flags: int, *payload: bytes) -> bytes:
+    return _box(kind, struct.pack(">I", (version << 24) | flags), *payload)
+
+
+def init_segment(sps: bytes, pps: bytes, duration: int = 0) -> bytes:
+    """ftyp + moov for one H.264 track. `duration` (ticks) is only set for finished clips."""
+    info = parse_sps(sps)
+    width, height = info["width"], info["height"]
+    avcc = bytes([1, info["profile"], info["compat"], info["level"], 0xFF, 0xE1])
+    avcc += struct.pack(">H", len(sps)) + sps + b"\x01" + struct.pack(">H", len(pps)) + pps
+    if info["profile"] in (100, 110, 122, 144):
+        avcc += bytes([0xFC | info["chroma_format"], 0xF8 | (info["bit_depth_luma"] - 8),
+                       0xF8 | (info["bit_depth_chroma"] - 8), 0])
+    avc1 = _box(
+        b"avc1",
+        b"\x00" * 6, struct.pack(">H", 1),       # reserved, data_reference_index
+        b"\x00" * 16,                              # pre_defined/reserved
+        struct.pack(">HHIIIH", width, height, 0x480000, 0x480000, 0, 1),
+        b"\x00" * 32,                              # compressorname
+        struct.pack(">Hh", 0x18, -1),
+        _box(b"avcC", avcc),
+    )
+    stbl = _box(
+        b"stbl",
+        _full_box(b"stsd", 0, 0, struct.pack(">I", 1), avc1),
+        _full_box(b"stts", 0, 0, struct.pack(">I", 0)),
+        _full_box(b"stsc", 0, 0, struct.pack(">I", 0)),
+        _full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)),
+        _full_box(b"stco", 0, 0, struct.pack(">I", 0)),
+    )
+    minf = _box(
+        b"minf",
+        _full_box(b"vmhd", 0, 1, struct.pack(">HHHH", 0, 0, 0, 0)),
+        _box(b"dinf", _full_box(b"dref", 0, 0, struct.pack(">I", 1), _full_box(b"url ", 0, 1))),
+        stbl,
+    )
+    mdia = _box(
+        b"mdia",
+        _full_box(b"mdhd", 0, 0, struct.pack(">IIIIHH", 0, 0, TIMESCALE, duration, 0x55C4, 0)),
+        _full_box(b"hdlr", 0, 0, struct.pack(">I4s12x", 0, b"vide"), b"VideoHandler\x00"),
+        minf,
+    )
+    trak = _box(
+        b"trak",
+        _full_box(b"tkhd", 0, 3, struct.pack(">IIIII", 0, 0, 1, 0, duration), b"\x00" * 8,
+                  struct.pack(">hhhH", 0, 0, 0, 0), _MATRIX, struct.pack(">II", width << 16, height << 16)),
+        mdia,
+    )
+    mvex = [_full_box(b"trex", 0, 0, struct.pack(">IIIII", 1, 1, 0, 0, 0))]
+    if duration:
+        mvex.insert(0, _full_box(b"mehd", 0, 0, struct.pack(">I", duration)))
+    moov = _box(
+        b"moov",
+        _full_box(b"mvhd", 0, 0, struct.pack(">IIIIIH", 0, 0, TIMESCALE, duration, 0x10000, 0x100),
+                  b"\x00" * 10, _MATRIX, b"\x00" * 24, struct.pack(">I", 2)),
+        trak,
+        _box(b"mvex", *mvex),
+    )
+    ftyp = _box(b"ftyp", b"iso5", struct.pack(">I", 512), b"iso5iso6mp41")
+    return ftyp + moov
+
+
+# Where media_segment() puts the fields a clip rewrites (see HLSSegmenter.write_clip)
+_MFHD_SEQ_AT = 8 + 12
+_TFDT_TIME_AT = 8 + 16 + 8 + 16 + 12
+
+
+def media_segment(sequence: int, decode_time: int, samples: List[Tuple[bytes, int, bool]]) -> bytes:
+    """moof + mdat for (length-prefixed sample, duration ticks, keyframe) samples."""
+    entries = b"".join(
+        struct.pack(">III", duration, len(data), 0x02000000 if key else 0x01010000)
+        for data, duration, key in samples
+    )
+    trun_size = 8 + 4 + 8 + len(entries)
+    moof_size = 8 + 16 + 8 + 16 + 20 + trun_size
+    traf = _box(
+        b"traf",
+        _full_box(b"tfhd", 0, 0x020000, struct.pack(">I", 1)),  # default-base-is-moof
+        _full_box(b"tfdt", 1, 0, struct.pack(">Q", decode_time)),
+        # data offset + per-sample duration, size, flags
+        _full_box(b"trun", 0, 0x000701, struct.pack(">Ii", len(samples), moof_size + 8), entries),
+    )
+    moof = _box(b"moof", _full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)), traf)
+    mdat = _box(b"mdat", *(data for data, _, _ in samples))
+    return moof + mdat
+
+
+# ---------------------------------------------------------------------------
+# Segmenter + in-memory segment cache
+# ---------------------------------------------------------------------------
+
+class _Segment:
+    def __init__(self, seq: int, start: float, duration: int, frames: int, data: bytes):
+        self.seq = seq
+        self.start = start        # wall-clock time of the first frame
+        self.duration = duration  # ticks
+        self.frames = frames
+        self.data = data
+
+    @property
+    def seconds(self) -> float:
+        return self.duration / TIMESCALE
+
+    @property
+    def end(self) -> float:
+        return self.start + self.seconds
+
+
+class HLSSegmenter:
+    """
+    Access units + capture timestamps in, fMP4 segments out. Segments start
+    at a keyframe once the current one is >= target_seconds long, and the
+    last keep_seconds (or keep_bytes) of them are kept for the playlist and
+    for clips.
+    """
+
+    def __init__(self, camera_id: str = "main", target_seconds: float = TARGET_SECONDS,
+                 keep_seconds: float = 300, keep_bytes: int = 64 * 1024 * 1024):
+        self.camera_id = camera_id
+        self.target_seconds = target_seconds
+        self.keep_seconds = keep_seconds
+        self.keep_bytes = keep_bytes
+        self._lock = threading.Lock()
+        self._segments: deque = deque()
+        self._bytes = 0
+        self._sps: Optional[bytes] = None
+        self._pps: Optional[bytes] = None
+        self._init: Optional[bytes] = None
+        self._init_sps: Optional[bytes] = None
+        self.info: Dict = {}
+        self._next_seq = 0
+        self._decode_time = 0
+        # Samples of the segment being built: [data, duration, key], duration set when the next frame arrives
+        self._pending: List[list] = []
+        self._pending_start: Optional[float] = None
+        self._last_ts: Optional[float] = None
+
+    def add(self, nals: List[bytes], ts: float):
+        """One access unit (NALs without start codes) captured at `ts`."""
+        kinds = [nal[0] & 0x1F for nal in nals]
+        for nal, kind in zip(nals, kinds):
+            if kind == NAL_SPS:
+                self._sps = nal
+            elif kind == NAL_PPS:
+                self._pps = nal
+        if NAL_SLICE not in kinds and NAL_IDR not in kinds:
+            return
+        key = NAL_IDR in kinds
+        if self._init is None or (key and self._sps != self._init_sps):
+            if not key or self._sps is None or self._pps is None:
+                return  # nothing to decode from until the first keyframe
+            self._new_stream()
+        # Parameter sets live in avcC; the samples carry just SEI and slices
+        sample = b"".join(struct.pack(">I", len(nal)) + nal
+                          for nal, kind in zip(nals, kinds) if kind not in (NAL_SPS, NAL_PPS, NAL_AUD))
+        if self._pending:
+            self._pending[-1][1] = max(1, round((ts - self._last_ts) * TIMESCALE))
+            # (a bit of slack: a 2 s GOP timed by the wall clock can come out at 1.99 s)
+            if key and sum(s[1] for s in self._pending) >= 0.9 * self.target_seconds * TIMESCALE:
+                self._close_segment()
+        if not self._pending:
+            self._pending_start = ts
+        self._pending.append([sample, 0, key])
+        self._last_ts = ts
+
+    def _new_stream(self):
+        """First keyframe, or the encoder came back with different SPS (new size): start over."""
+        with self._lock:
+            if self._init is not None:
+                print(f"[HLS] {self.camera_id}: stream parameters changed, dropping old segments")
+            self._segments.clear()
+            self._bytes = 0
+            self._init_sps = self._sps
+            self._init = init_segment(self._sps, self._pps)
+            self.info = parse_sps(self._sps)
+        self._pending = []
+        self._decode_time = 0
+
+    def _close_segment(self):
+        samples = [tuple(s) for s in self._pending]
+        duration = sum(s[1] for s in samples)
+        data = media_segment(self._next_seq + 1, self._decode_time, samples)
+        segment = _Segment(self._next_seq, self._pending_start, duration, len(samples), data)
+        self._next_seq += 1
+        self._decode_time += duration
+        self._pending = []
+        with self._lock:
+            self._segments.append(segment)
+            self._bytes += len(data)
+            cutoff = segment.end - self.keep_seconds
+            while len(self._segments) > 1 and (self._segments[0].end < cutoff or self._bytes > self.keep_bytes):
+                self._bytes -= len(self._segments.popleft().data)
+        SEGMENTS_MADE.inc(camera=self.camera_id)
+        SEGMENT_BYTES.inc(len(data), camera=self.camera_id)
+
+    @property
+    def init(self) -> Optional[bytes]:
+        return self._init
+
+    def get_segment(self, seq: int) -> Optional[bytes]:
+        with self._lock:
+            if not self._segments:
+                return None
+            i = seq - self._segments[0].seq
+            if 0 <= i < len(self._segments):
+                return self._segments[i].data
+        return None
+
+    def playlist(self, window: int = PLAYLIST_SEGMENTS) -> Optional[str]:
+        """Live media playlist over the newest `window` segments (None until there's one)."""
+        with self._lock:
+            segments = list(self._segments)[-window:]
+        if not segments or self._init is None:
+            return None
+        target = max(math.ceil(s.seconds) for s in segments)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            f"#EXT-X-TARGETDURATION:{target}",
+            f"#EXT-X-MEDIA-SEQUENCE:{segments[0].seq}",
+            "#EXT-X-INDEPENDENT-SEGMENTS",
+            '#EXT-X-MAP:URI="hls/init.mp4"',
+        ]
+        for s in segments:
+            lines.append(f"#EXTINF:{s.seconds:.3f},")
+            lines.append(f"hls/{s.seq}.m4s")
+        return "\n".join(lines) + "\n"
+
+    def covered_until(self) -> float:
+        """Wall-clock end of the newest finished segment (0 if none)."""
+        with self._lock:
+            return self._segments[-1].end if self._segments else 0.0
+
+    def segments_between(self, start: float, end: float) -> List[_Segment]:
+        with self._lock:
+            return [s for s in self._segments if s.end > start and s.start <= end]
+
+    def write_clip(self, start: float, end: float, output_path: Path) -> Optional[Dict]:
+        """
+        Write the segments overlapping [start, end] as one fragmented MP4 -
+        no re-encode. Returns the same metadata as video_utils.frames_to_mp4
+        plus "start" (wall-clock time of the first frame), or None if no
+        segment overlaps.
+        """
+        segments = self.segments_between(start, end)
+        if not segments or self._init_sps is None:
+            return None
+        duration = sum(s.duration for s in segments)
+        base = None
+        with open(output_path, "wb") as f:
+            f.write(init_segment(self._init_sps, self._pps, duration=duration))
+            for i, s in enumerate(segments):
+                data = bytearray(s.data)
+                # Renumber from 1 and start the clip's timeline at 0
+                tfdt = struct.unpack_from(">Q", data, _TFDT_TIME_AT)[0]
+                base = tfdt if base is None else base
+                struct.pack_into(">I", data, _MFHD_SEQ_AT, i + 1)
+                struct.pack_into(">Q", data, _TFDT_TIME_AT, tfdt - base)
+                f.write(data)
+        return {
+            "duration": round(duration / TIMESCALE, 3),
+            "frame_count": sum(s.frames for s in segments),
+            "file_size": output_path.stat().st_size,
+            "start": segments[0].start,
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            segments = list(self._segments)
+            size = self._bytes
+        seconds = sum(s.seconds for s in segments)
+        return {
+            "segments": len(segments),
+            "bytes": size,
+            "seconds": round(seconds, 1),
+            "kbps": round(size * 8 / seconds / 1000, 1) if seconds else None,
+            "width": self.info.get("width"),
+            "height": self.info.get("height"),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Where the H.264 comes from
+# ---------------------------------------------------------------------------
+
+class H264Encoder:
+    """
+    The streamer's JPEG frames -> ffmpeg -> Annex B H.264 -> segmenter.
+    feed() never blocks the reader thread: if ffmpeg is behind, frames are
+    dropped (and counted). No B-frames, so frames come out in the order they
+    went in and each one gets its own capture timestamp back.
+    """
+
+    def __init__(self, segmenter: HLSSegmenter, framerate: int = 15, encoder: Optional[str] = None,
+                 bitrate: str = "1M", gop_seconds: float = TARGET_SECONDS):
+        self.segmenter = segmenter
+        self.framerate = framerate
+        self.encoder = encoder or os.environ.get("PICAM_H264_ENCODER", "libx264")
+        self.bitrate = bitrate
+        self.gop = max(1, round(framerate * gop_seconds))
+        self._queue: queue.Queue = queue.Queue(maxsize=framerate)
+        self._timestamps: deque = deque()
+        self._process: Optional[subprocess.Popen] = None
+        self._threads: List[threading.Thread] = []
+
+    def command(self) -> List[str]:
+        cmd = [
+            "ffmpeg", "-hide_banner", "-loglevel", "error",
+            "-f", "mjpeg", "-framerate", str(self.framerate), "-i", "pipe:0",
+            "-fps_mode", "passthrough",
+            "-c:v", self.encoder, "-b:v", self.bitrate,
+            "-g", str(self.gop), "-bf", "0", "-pix_fmt", "yuv420p",
+        ]
+        if self.encoder == "libx264":
+            cmd += ["-preset", "ultrafast", "-tune", "zerolatency",
+                    "-x264-params", f"keyint={self.gop}:min-keyint={self.gop}:scenecut=0"]
+        return cmd + ["-f", "h264", "pipe:1"]
+
+    def start(self):
+        self._process = subprocess.Popen(self.command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+        name = self.segmenter.camera_id
+        self._threads = [
+            threading.Thread(target=self._write, daemon=True, name=f"H264-Writer-{name}"),
+            threading.Thread(target=self._read, daemon=True, name=f"H264-Reader-{name}"),
+        ]
+        for t in self._threads:
+            t.start()
+        print(f"[HLS] {name}: encoding with {self.encoder} at {self.bitrate}")
+
+    def feed(self, ts: float, jpeg: bytes):
+        try:
+            self._queue.put_nowait((ts, jpeg))
+        except queue.Full:
+            ENCODER_DROPS.inc(camera=self.segmenter.camera_id)
+
+    def _write(self):
+        stdin = self._process.stdin
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            ts, jpeg = item
+            self._timestamps.append(ts)
+            try:
+                stdin.write(jpeg)
+                stdin.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                break
+        try:
+            stdin.close()
+        except OSError:
+            pass
+
+    def _read(self):
+        reader = AccessUnitReader()
+        stdout = self._process.stdout
+        while True:
+            chunk = stdout.read1(65536)
+            if not chunk:
+                break
+            for au in reader.feed(chunk):
+                self._add(au)
+        for au in reader.flush():
+            self._add(au)
+
+    def _add(self, au: List[bytes]):
+        ts = self._timestamps.popleft() if self._timestamps else time.time()
+        self.segmenter.add(au, ts)
+
+    def stop(self):
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # Writer is stuck on (or gone from) a full pipe: the queue only drains once ffmpeg is gone
+            if self._process is not None:
+                self._process.kill()
+        if self._process is not None:
+            try:
+                self._process.wait(timeout=3)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        for t in self._threads:
+            t.join(timeout=2)
+
+
+class H264FileFeed:
+    """Replays an Annex B recording into the segmenter at `framerate`, in place of the encoder."""
+
+    def __init__(self, segmenter: HLSSegmenter, path: Path, framerate: int = 15, loop: bool = True):
+        self.segmenter = segmenter
+        self.path = Path(path)
+        self.framerate = framerate
+        self.loop = loop
+        self._units = split_access_units(self.path.read_bytes())
+        if not self._units:
+            raise ValueError(f"No H.264 access units found in {self.path}")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._play, daemon=True, name=f"H264-File-{self.segmenter.camera_id}")
+        self._thread.start()
+        print(f"[HLS] {self.segmenter.camera_id}: replaying {self.path} ({len(self._units)} frames)")
+
+    def feed(self, ts: float, jpeg: bytes):
+        pass  # the recording is the video; the camera's JPEGs aren't needed
+
+    def _play(self):
+        start, n = time.monotonic(), 0
+        while not self._stop.is_set():
+            for au in self._units:
+                delay = start + n / self.framerate - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    return
+                self.segmenter.add(au, time.time())
+                n += 1
+            if not self.loop:
+                break
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+
+def _demo(path: Optional[str] = None):
+    """Segment a recording, check the playlist and a clip, and compare bandwidth with MJPEG."""
+    import shutil
+    import sys
+    import tempfile
+
+    from .pipeline_bench import generate_h264_recording, generate_recording
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        fps = 15
+        h264_path = Path(path) if path else generate_h264_recording(tmp / "rec", seconds=20, fps=fps)
+        units = split_access_units(h264_path.read_bytes())
+        segmenter = HLSSegmenter("demo")
+        t0 = time.time()
+        start = time.perf_counter()
+        for i, au in enumerate(units):
+            segmenter.add(au, t0 + i / fps)
+        took = time.perf_counter() - start
+        stats = segmenter.stats()
+        print(f"{len(units)} frames -> {stats['segments']} segments in {took * 1000:.0f} ms "
+              f"({took / len(units) * 1e6:.0f} us/frame), {stats['width']}x{stats['height']}, "
+              f"{stats['kbps']} kbit/s")
+        print(segmenter.playlist())
+        assert stats["segments"] >= 3, "expected a segment every ~2 s"
+
+        clip = tmp / "clip.mp4"
+        meta = segmenter.write_clip(t0 + 5, t0 + 11, clip)
+        print(f"clip 5-11 s: {meta}")
+        try:
+            import cv2
+        except ImportError:
+            cv2 = None
+        if cv2 is not None:
+            cap = cv2.VideoCapture(str(clip))
+            decoded = 0
+            while True:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                decoded += 1
+                assert frame.shape[1] == stats["width"] and frame.shape[0] == stats["height"]
+            print(f"OpenCV decoded {decoded} of {meta['frame_count']} clip frames")
+            assert decoded == meta["frame_count"]
+
+        if shutil.which("ffmpeg") is None:
+            print("ffmpeg not installed: skipping the MJPEG vs H.264 bandwidth comparison")
+            return
+        # Same scene both ways: the synthetic MJPEG recording, and it encoded live
+        mjpeg, _ = generate_recording(tmp / "scene", seconds=20, fps=fps)
+        from .frame_sources import split_mjpeg
+        frames = split_mjpeg(mjpeg.read_bytes())
+        live = HLSSegmenter("bandwidth")
+        encoder = H264Encoder(live, framerate=fps)
+        encoder.start()
+        for i, frame in enumerate(frames):
+            encoder._queue.put((t0 + i / fps, frame))  # all of them, no dropping here
+        encoder.stop()
+        mjpeg_kbps = mjpeg.stat().st_size * 8 / (len(frames) / fps) / 1000
+        h264_kbps = live.stats()["kbps"]
+        print(f"MJPEG {mjpeg_kbps:.0f} kbit/s vs H.264 {h264_kbps} kbit/s "
+              f"({mjpeg_kbps / h264_kbps:.1f}x less)" if h264_kbps else "encoder produced no segments",
+              file=sys.stdout)
+
+
+if __name__ == "__main__":
+    import sys
+
+    _demo(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,122 @@
+"""
+Event-loop lag watchdog.
+A small task sleeps for `interval` over and over; whenever it wakes up late,
+the difference is time the loop spent running something else without
+yielding (sync SQLite, PIL, file I/O inside an async handler). That lag goes
+into the event_loop_lag_seconds histogram, and p50/p95/p99 over the last
+minute are exported as gauges, so "the live view froze" shows up in /metrics.
+
+In debug mode (PICAM_LOOP_DEBUG=1) a separate thread also watches the
+task's heartbeat. If the loop hasn't ticked for `block_threshold` seconds
+it prints the loop thread's current stack - i.e. the code that is blocking
+it - once per stall.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Dict, Optional
+
+from . import metrics
+
+LOOP_LAG = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke the watchdog task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = metrics.counter("event_loop_stalls_total", "Times the loop was blocked longer than the stall threshold")
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class LoopWatchdog:
+    def __init__(self, interval: float = 0.1, block_threshold: float = 0.25,
+                 window: float = 60.0, debug: Optional[bool] = None):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.debug = debug if debug is not None else os.environ.get("PICAM_LOOP_DEBUG") == "1"
+        # Recent lag samples for the percentile gauges
+        self._recent: deque = deque(maxlen=int(window / interval))
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._running = False
+        self.max_lag = 0.0
+
+        for q in (0.5, 0.95, 0.99):
+            metrics.gauge(f"event_loop_lag_p{int(q * 100)}_seconds",
+                          f"Event loop lag p{int(q * 100)} over the last {int(window)}s",
+                          callback=lambda q=q: self.percentile(q))
+
+    def start(self):
+        """Call from inside the running loop (e.g. the startup handler)."""
+        if self._running:
+            return
+        self._running = True
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        if self.debug:
+            self._monitor = threading.Thread(target=self._watch, daemon=True, name="LoopWatchdog")
+            self._monitor.start()
+            print(f"[LoopWatchdog] Debug mode: logging stacks of loop stalls > {self.block_threshold * 1000:.0f} ms")
+
+    def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+        if self._monitor and self._monitor.is_alive():
+            self._monitor.join(timeout=2)
+
+    async def _tick(self):
+        while self._running:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - start - self.interval)
+            LOOP_LAG.observe(lag)
+            self._recent.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.block_threshold:
+                LOOP_STALLS.inc()
+
+    def _watch(self):
+        """Debug-only thread: dump the loop thread's stack when it stops ticking."""
+        reported = False
+        while self._running:
+            time.sleep(self.block_threshold / 4)
+            stalled_for = time.monotonic() - self._heartbeat - self.interval
+            if stalled_for < self.block_threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # One report per stall - the first stack we see is the one that's blocking
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=12)) if frame is not None else "  (no frame)\n"
+            print(f"[LoopWatchdog] Event loop blocked for {stalled_for * 1000:.0f} ms, loop thread is in:\n{stack}",
+                  flush=True)
+
+    def percentile(self, q: float) -> float:
+        return _percentile(sorted(self._recent), q)
+
+    def summary(self) -> Dict:
+        values = sorted(self._recent)
+        return {
+            "p50_ms": round(_percentile(values, 0.5) * 1000, 1),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 1),
+            "max_ms": round(self.max_lag * 1000, 1),
+            "stalls": int(LOOP_STALLS.value()),
+            "debug": self.debug,
+        }
@@ -1,28 +1,40 @@
+import hmac
 import io
 import os
 import time
 import uuid
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 import asyncio
-import base64
-import zipfile
-from PIL import Image
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 
 from . import database
+from . import export
+from . import metrics
 from . import video_utils
-from .rpicam_streaming import get_streamer, start_streamer, stop_streamer
+from .cameras import Camera, CameraRegistry
+from .event_log import EventLog
+from .event_clips import EventClipRecorder
+from .file_serving import parse_range, range_file_response
+from .loop_watchdog import LoopWatchdog
+from .photo_store import PhotoStore
+from .profiler import ProfilerBusy, profiler
+from .storage_gc import StorageGC
+from .timelapse import TimelapseRecorder, list_days as list_timelapse_days
+from .retention import RetentionManager
+from .startup import StartupTracker
+from .static_assets import StaticAssets
+from .work_scheduler import WorkScheduler
 from pathlib import Path
 import io
 from fastapi import BackgroundTasks
 
 ROOT = Path(__file__).resolve().parents[1]
 FRONTEND_DIR = ROOT / "PiDoorCam"
-DATA_DIR = ROOT / "data"
+DATA_DIR = Path(os.environ.get("PICAM_DATA_DIR") or ROOT / "data")
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 app = FastAPI()
@@ -30,182 +42,722 @@ app = FastAPI()
 
 # WebSocket manager
 class ConnectionManager:
-    def __init__(self):
+    def __init__(self, log: EventLog):
         self.active: List[WebSocket] = []
-
-    async def connect(self, ws: WebSocket):
+        # Which camera each client is watching - its frames/detections only go there
+        self.watching: Dict[WebSocket, str] = {}
+        # Clients watching the H.264 view: detections and events, but no JPEG frames
+        self.no_frames = set()
+        # Pages that only want events (photos, replays): nothing camera-specific
+        self.no_live = set()
+        # Numbered events, so a reconnecting client can catch up (see event_log.py)
+        self.log = log
+
+    async def connect(self, ws: WebSocket, camera_id: str, frames: bool = True,
+                      live: bool = True, last_seq: Optional[int] = None):
         await ws.accept()
+        state = await self._catch_up(ws, last_seq)
+        # No await between catching up and this, so no broadcast can slip in between
         self.active.append(ws)
+        self.watching[ws] = camera_id
+        if not frames:
+            self.no_frames.add(ws)
+        if not live:
+            self.no_live.add(ws)
+        await ws.send_json(state)
+
+    async def _catch_up(self, ws: WebSocket, last_seq: Optional[int]) -> dict:
+        """
+        Send a reconnecting client the events after last_seq. Returns the
+        message to finish with: "sync" with the seq it's now at, or "resync"
+        if they're gone and the page has to reload its lists.
+        """
+        if last_seq is None:
+            return {"type": "sync", "seq": self.log.seq}
+        seq, replayed = last_seq, 0
+        while True:
+            missed = self.log.since(seq)
+            if missed is None:
+                missed = await asyncio.to_thread(self.log.since_persisted, seq)
+                if missed is None:
+                    WS_RESYNCS.inc()
+                    return {"type": "resync", "seq": self.log.seq}
+            if not missed:
+                # Checked again after every await: caught up for real now
+                WS_EVENTS_REPLAYED.inc(replayed)
+                return {"type": "sync", "seq": seq, "replayed": replayed}
+            for m in missed:
+                await ws.send_json(m)
+            seq, replayed = missed[-1]["seq"], replayed + len(missed)
 
     def disconnect(self, ws: WebSocket):
         if ws in self.active:
             self.active.remove(ws)
+        self.watching.pop(ws, None)
+        self.no_frames.discard(ws)
+        self.no_live.discard(ws)
 
-    async def broadcast_json(self, msg: dict):
-        to_remove = []
-        for ws in list(self.active):
+    async def broadcast_json(self, msg: dict, camera: Optional[str] = None):
+        """Send to every client, or with `camera` only to the clients watching that camera."""
+        if self.log.is_sequenced(msg) and "seq" not in msg:
             try:
-                await ws.send_json(msg)
-            except Exception:
-                to_remove.append(ws)
+                # Numbered by the DB; the log's follower sends it (in every worker)
+                await self.log.append(msg, camera)
+                return
+            except Exception as e:
+                # Still goes out live, just without a seq to catch up from
+                print(f"[EventLog] Couldn't store event: {e}")
+        await self.deliver(msg, camera)
+
+    async def deliver(self, msg: dict, camera: Optional[str] = None):
+        """The sending part of broadcast_json (also what EventLog.follow calls)."""
+        to_remove = []
+        targets = list(self.active)
+        if camera is not None:
+            targets = [ws for ws in targets if self.watching.get(ws) == camera and ws not in self.no_live]
+        if msg.get("type") == "frame":
+            targets = [ws for ws in targets if ws not in self.no_frames]
+        with BROADCAST_SECONDS.time(type=msg.get("type", "unknown")):
+            for ws in targets:
+                try:
+                    await ws.send_json(msg)
+                except Exception:
+                    to_remove.append(ws)
         for ws in to_remove:
+            WS_SEND_FAILURES.inc()
             self.disconnect(ws)
 
 
-manager = ConnectionManager()
+BROADCAST_SECONDS = metrics.histogram("ws_broadcast_seconds", "Time to send one message to all WebSocket clients", ("type",))
+WS_SEND_FAILURES = metrics.counter("ws_send_failures_total", "WebSocket sends that failed (client dropped)")
+WS_EVENTS_REPLAYED = metrics.counter("ws_events_replayed_total", "Missed events sent to reconnecting WebSocket clients")
+WS_RESYNCS = metrics.counter("ws_resyncs_total", "Reconnecting WebSocket clients told to reload (missed events no longer kept)")
+WS_FRAMES_SKIPPED = metrics.counter("ws_frames_skipped_total", "Camera frames never sent to WebSocket clients (broadcast runs below camera fps)")
+PHOTOS_SAVED = metrics.counter("photos_saved_total", "Photos written to disk", ("source",))
+EVENTS_LOGGED = metrics.counter("events_logged_total", "Events stored in the database", ("label",))
+STARTED_AT = time.time()
+
+# What the background bring-up (DB, streamer, camera) is doing; see startup.py
+startup = StartupTracker()
+
+# PiDoorCam/, read and compressed once (in the bring-up, or on the first request)
+frontend = StaticAssets(FRONTEND_DIR)
+
+manager = ConnectionManager(EventLog())
+
+# The cameras (config/cameras.json, or just "main"); each one has its own
+# streamer, supervisor, broadcaster and event clip recorder - see cameras.py
+cameras = CameraRegistry.from_config()
+
+# By default this one process does everything. For more than one uvicorn
+# worker, backend/capture.py runs the cameras with PICAM_ROLE=capture and
+# publishes them to shared memory, and workers started with PICAM_ROLE=web
+# serve clients from there (see frame_bus.py)
+ROLE = os.environ.get("PICAM_ROLE", "all")
+if ROLE == "capture":
+    from .frame_bus import DEFAULT_PREFIX, EventBus, EventPublisher
+    cameras.use_frame_bus("writer", DEFAULT_PREFIX)
+    # No clients here: broadcasts go onto the event bus for the web workers to send
+    manager = EventPublisher(EventBus(DEFAULT_PREFIX, create=True), manager.log)
+elif ROLE == "web":
+    from .frame_bus import DEFAULT_PREFIX
+    cameras.use_frame_bus("reader", DEFAULT_PREFIX)
+
+# MP4 encodes and photo writes from all cameras queue up here instead of each grabbing threads
+scheduler = WorkScheduler()
+
+
+def _per_camera(fn):
+    """Gauge callback: {camera id: fn(camera)} for cameras whose streamer exists (scrapes shouldn't build one)."""
+    def collect():
+        values = {}
+        for camera in cameras:
+            if camera.created:
+                value = fn(camera)
+                if value is not None:
+                    values[camera.id] = value
+        return values
+    return collect
+
+
+metrics.gauge("ws_clients", "Connected WebSocket clients", callback=lambda: len(manager.active))
+metrics.gauge("picam_running", "1 if the frame source is running", ("camera",),
+              callback=_per_camera(lambda c: int(c.get_streamer().is_running())))
+metrics.gauge("picam_last_frame_age_seconds", "Seconds since the last camera frame", ("camera",),
+              callback=_per_camera(lambda c: c.get_streamer().get_frame_info()["last_frame_age"]))
+metrics.gauge("replay_buffer_frames", "Frames in the replay buffer", ("camera",),
+              callback=_per_camera(lambda c: c.get_streamer().get_buffer_stats()["frames"]))
+metrics.gauge("replay_buffer_bytes", "Bytes in the replay buffer", ("camera",),
+              callback=_per_camera(lambda c: c.get_streamer().get_buffer_stats()["bytes"]))
+metrics.gauge("process_uptime_seconds", "Seconds since the app started", callback=lambda: time.time() - STARTED_AT)
+metrics.gauge("startup_seconds", "Seconds from process start until the backend was ready",
+              callback=lambda: startup.status()["seconds"] if startup.ready else None)
+
+# Photos + thumbnails in day folders under data/photos (see photo_store.py)
+photo_store = PhotoStore(DATA_DIR)
+
+# Deletes files for cleared photos/replays in the background
+storage_gc = StorageGC(DATA_DIR)
+
+# Names known people (enrollments) when PICAM_EMBEDDER is set; None otherwise (see recognition.py).
+# Only where the detections are handled - web workers just manage the enrollments.
+# Imported only then: it needs numpy, which would slow down every cold start
+recognizer = None
+if ROLE != "web" and os.environ.get("PICAM_EMBEDDER"):
+    from .recognition import Recognizer
+    recognizer = Recognizer.from_env(DATA_DIR / "enrollments")
+
+# Age/size/count limits for photos, replays and events (see retention.DEFAULT_POLICIES)
+retention = RetentionManager(DATA_DIR)
+
+# Measures event loop lag; PICAM_LOOP_DEBUG=1 also logs what's blocking it
+loop_watchdog = LoopWatchdog()
+
+# Each camera's supervisor starts it and restarts it if rpicam-vid exits or stops sending frames
+metrics.gauge("picam_uptime_seconds", "Seconds since the camera was last (re)started", ("camera",),
+              callback=_per_camera(lambda c: c.supervisor.stats()["uptime"]))
+metrics.gauge("rpicam_fps", "Frame rate rpicam-vid reports on stderr", ("camera",),
+              callback=_per_camera(lambda c: c.get_streamer().source.log_stats().get("fps")))
+metrics.gauge("rpicam_network_loaded", "1 once the IMX500 network firmware is loaded", ("camera",),
+              callback=_per_camera(lambda c: int(c.get_streamer().source.log_stats().get("network_state") == "loaded")))
+
+
+def _stored_size(*paths) -> int:
+    """Total bytes of the given files (missing ones count as 0)."""
+    total = 0
+    for p in paths:
+        try:
+            total += Path(p).stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def _photo_name(kind: str, camera: Camera, timestamp: float) -> str:
+    # Camera id in the name for browsing; uniqueness comes from the store's random suffix
+    return photo_store.new_name(kind, camera.id, timestamp)
+
 
+def _make_thumb(frame: bytes) -> bytes:
+    from PIL import Image
 
+    img = Image.open(io.BytesIO(frame))
+    img.thumbnail((300, 200))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=75)
+    return out.getvalue()
 
 
-async def frame_broadcaster():
+def _write_photo(frame: bytes, fname: str, timestamp: float, verify: bool = False,
+                 camera_id: Optional[str] = None) -> Tuple[bool, int]:
+    """
+    Save a JPEG frame + its thumbnail and add it to the photos table.
+    Blocking (PIL + disk + SQLite) - run it on the scheduler's "capture" pool.
+    Returns (whether the thumbnail was made, the photo's id).
     """
-    Unified approach: rpicam-vid for both streaming and AI detection.
-    Single process, more stable than hybrid.
+    if verify:
+        from PIL import Image  # only needed here; keeps it out of the import at startup
+        # Raises if not a valid JPEG
+        Image.open(io.BytesIO(frame)).verify()
+    # thumbnails improve gallery load times
+    path, thumb_ok, digest = photo_store.save(fname, frame, _make_thumb)
+    photo_id = database.add_photo(int(timestamp), str(path), _stored_size(path, photo_store.thumb_path_for(fname)),
+                                  camera_id, digest)
+    return thumb_ok, photo_id
+
+
+async def frame_broadcaster(camera: Camera):
     """
-    streamer = get_streamer()
+    Live frames + detection boxes for one camera's WebSocket clients.
+    Runs in every process that serves clients (with the frame bus: every web worker).
+    """
+    streamer = camera.get_streamer()
     
-    print("[frame_broadcaster] Using rpicam-vid for streaming + detection")
+    print(f"[frame_broadcaster] Streaming {camera.id} to WebSocket clients")
     
     # target fps for websocket frames
     fps = 5
     interval = 1.0 / fps
     
-    last_person_notification = 0
-    notification_cooldown = 3.0  # seconds between person notifications
+    last_frames_seen = None
     
     while True:
-        # Get streaming frame from rpicam-vid
-        frame = streamer.get_frame()
+        # Frames the camera produced since the last tick that nobody will see live
+        frames_seen = streamer.get_frame_info()["frames_seen"]
+        if last_frames_seen is not None and frames_seen - last_frames_seen > 1:
+            WS_FRAMES_SKIPPED.inc(frames_seen - last_frames_seen - 1)
+        last_frames_seen = frames_seen
         
         # Get detections from same rpicam-vid process
         detections = streamer.get_detections() if streamer.is_running() else []
         
-        if frame:
-            b64 = base64.b64encode(frame).decode('ascii')
-            msg = {"type": "frame", "data": b64, "ts": int(time.time())}
-            await manager.broadcast_json(msg)
+        # Encode once here rather than per client
+        b64 = streamer.get_frame_base64()
+        if b64:
+            msg = {"type": "frame", "camera": camera.id, "data": b64, "ts": int(time.time())}
+            await manager.broadcast_json(msg, camera=camera.id)
+            
+            motion = streamer.get_motion()
             
             # Always send detection results (even empty) so frontend can clear old boxes
             detection_msg = {
                 "type": "detections",
+                "camera": camera.id,
                 "detections": detections,
+                "motion": motion,
                 "ts": int(time.time())
             }
-            await manager.broadcast_json(detection_msg)
+            await manager.broadcast_json(detection_msg, camera=camera.id)
+        
+        await asyncio.sleep(interval)
+
+
+async def detection_events(camera: Camera):
+    """
+    Photos, events, notifications and event clips for one camera's
+    detections. Runs where the camera itself runs (the only process, or
+    backend/capture.py with the frame bus) - never once per web worker.
+    """
+    from . import frame_dedup
+    from .frame_dedup import ChangeDetector
+
+    streamer = camera.get_streamer()
+    
+    print(f"[detection_events] Watching {camera.id} for people")
+    
+    # Same pace as the live view
+    interval = 1.0 / 5
+    
+    # Two people arriving together shouldn't produce two identical photos. Only
+    # while the one whose photo it is is still there, and only for a few seconds:
+    # someone arriving later gets their own (a person is ~14% of the frame, so
+    # the whole-frame score barely moves)
+    snapshot_filter = ChangeDetector(frame_dedup.SNAPSHOT_MIN_CHANGE)
+    last_snapshot = None  # {"name", "path", "track_id", "ts"}
+    snapshot_reuse_window = 5.0
+    
+    # Motion without a person is logged too (label 'motion'), just less often
+    last_motion_event = 0
+    motion_event_cooldown = 30.0
+    
+    last_heatmap_flush = time.time()
+    
+    while True:
+        # Get streaming frame from rpicam-vid
+        frame = streamer.get_frame()
+        
+        # Get detections from same rpicam-vid process
+        detections = streamer.get_detections() if streamer.is_running() else []
+        
+        if frame:
+            motion = streamer.get_motion()
             
-            # Check for person detection (75%+ confidence) and take action
-            if detections:
-                person_detections = [d for d in detections if d['class'] == 'person']
-                person_count = len(person_detections)
-                
-                if person_count > 0:
-                    current_time = time.time()
-                    if (current_time - last_person_notification) > notification_cooldown:
-                        best_detection = max(person_detections, key=lambda d: d.get('confidence', 0))
-                        confidence = best_detection.get('confidence', 0.0)
-                        snapshot_path = None
+            # Motion-only heatmap events
+            if motion and motion["motion"] and not detections:
+                now = time.time()
+                if now - last_motion_event > motion_event_cooldown:
+                    await asyncio.to_thread(database.add_event, timestamp=int(now), label='motion',
+                                            confidence=motion["score"], camera_id=camera.id)
+                    EVENTS_LOGGED.inc(label='motion')
+                    last_motion_event = now
+            
+            # One photo + event per person (track), when they first show up -
+            # not every few seconds while they stand there
+            for track_event in streamer.pop_track_events():
+                if track_event["type"] == "enter":
+                    current_time = track_event["ts"]
+                    best_detection = track_event["detection"]
+                    confidence = best_detection.get('confidence', 0.0)
+                    snapshot_path = None
+                    scene_changed = snapshot_filter.should_keep(frame, current_time)
+                    reusable = (last_snapshot is not None and not scene_changed
+                                and current_time - last_snapshot["ts"] <= snapshot_reuse_window
+                                and await asyncio.to_thread(photo_store.resolve, last_snapshot["name"]) is not None)
+                    if reusable:
+                        # Near-duplicate of a photo taken moments ago: point the event at that one instead
+                        snapshot_path = last_snapshot["path"]
+                        print(f"[Detection] Scene unchanged (score {snapshot_filter.last_score:.3f}), "
+                              f"reusing track {last_snapshot['track_id']}'s snapshot")
+                    else:
                         try:
-                            # Validate frame is a JPEG
-                            img = Image.open(io.BytesIO(frame))
-                            img.verify()  # Raises if not a valid JPEG
-                            # Save photo
-                            photos_dir = DATA_DIR / "photos"
-                            photos_dir.mkdir(parents=True, exist_ok=True)
-                            fname = f"detection-{int(current_time)}.jpg"
-                            path = photos_dir / fname
-                            with open(path, "wb") as fh:
-                                fh.write(frame)
-                            # Generate thumbnail
-                            thumbs_dir = photos_dir / "thumbs"
-                            thumbs_dir.mkdir(parents=True, exist_ok=True)
-                            try:
-                                img = Image.open(io.BytesIO(frame))
-                                img.thumbnail((300, 200))
-                                thumb_path = thumbs_dir / fname
-                                img.save(thumb_path, format="JPEG", quality=75)
-                            except Exception:
-                                pass  # Continue without thumbnail
-                            # Add to photos database
-                            database.add_photo(int(current_time), str(path))
+                            # Validate, save photo + thumbnail and add to the database (off the event loop)
+                            fname = _photo_name("detection", camera, current_time)
+                            _, photo_id = await scheduler.run("capture", _write_photo, frame, fname, current_time, True, camera.id)
                             snapshot_path = f"/data/photos/{fname}"
+                            last_snapshot = {"name": fname, "path": snapshot_path,
+                                             "track_id": track_event["track_id"], "ts": current_time}
+                            PHOTOS_SAVED.inc(source='detection')
                             print(f"[Detection] Auto-captured photo: {fname}")
                             # Notify frontend of new photo
                             await manager.broadcast_json({
                                 "type": "event",
                                 "name": "photo_taken",
+                                "id": photo_id,
+                                "camera": camera.id,
                                 "path": snapshot_path,
                                 "thumb": f"/data/photos/thumbs/{fname}",
                                 "ts": int(current_time)
                             })
                         except Exception as e:
                             print(f"[Detection] Error saving snapshot: {e}")
-                        
-                        # Log event to database for heatmap tracking (with snapshot path)
-                        database.add_event(
-                            timestamp=int(current_time),
-                            label='person',
-                            confidence=confidence,
-                            snapshot_path=snapshot_path
-                        )
-                        
-                        # Send notification to frontend
-                        notification_msg = {
-                            "type": "notification",
-                            "message": f"👤 Person detected ({int(confidence * 100)}% confidence)!",
-                            "severity": "info",
-                            "ts": int(current_time)
-                        }
-                        await manager.broadcast_json(notification_msg)
-                        last_person_notification = current_time
-                        
-                        # Log detection details
-                        print(f"[Detection] Person detected at {time.strftime('%H:%M:%S')} - confidence={confidence:.0%}")
-                        print(f"  - bbox={best_detection['bbox']}")
-                        if snapshot_path:
-                            print(f"  - Snapshot saved and added to heatmap")
+
+                    # Someone we know? Embedded once per track, on the recognition pool
+                    person = None
+                    if recognizer is not None and recognizer.ready:
+                        try:
+                            person = await scheduler.run("recognition", recognizer.identify, camera.id,
+                                                         track_event["track_id"], frame, best_detection["bbox"])
+                        except Exception as e:
+                            print(f"[Recognition] Error identifying track {track_event['track_id']}: {e}")
+
+                    # Log event to database for heatmap tracking (with snapshot path)
+                    event_id = await asyncio.to_thread(
+                        database.add_event,
+                        timestamp=int(current_time),
+                        label='person',
+                        confidence=confidence,
+                        snapshot_path=snapshot_path,
+                        track_id=track_event["track_id"],
+                        camera_id=camera.id,
+                        enrollment_id=person["enrollment_id"] if person else None
+                    )
+                    EVENTS_LOGGED.inc(label='person')
+
+                    # Start (or extend) the automatic event clip
+                    camera.clip_recorder.trigger(event_id, current_time)
+
+                    # Send notification to frontend
+                    where = f" on {camera.name}" if len(cameras) > 1 else ""
+                    notification_msg = {
+                        "type": "notification",
+                        "camera": camera.id,
+                        "message": f"👤 Person detected{where} ({int(confidence * 100)}% confidence)!",
+                        "severity": "info",
+                        "ts": int(current_time)
+                    }
+                    if person:
+                        notification_msg["message"] = f"👤 {person['name']} is here{where} ({int(person['score'] * 100)}% match)"
+                        notification_msg["person"] = person
+                    await manager.broadcast_json(notification_msg)
+
+                    # Log detection details
+                    print(f"[Detection] Person (track {track_event['track_id']}) entered at {time.strftime('%H:%M:%S')} - confidence={confidence:.0%}")
+                    print(f"  - bbox={best_detection['bbox']}")
+                    if snapshot_path:
+                        print(f"  - Snapshot saved and added to heatmap")
+                elif track_event["type"] in ("zone_enter", "line_cross"):
+                    # Zone entries and tripwire crossings are stored as their own events
+                    await asyncio.to_thread(
+                        database.add_event,
+                        timestamp=int(track_event["ts"]),
+                        label=track_event["type"],
+                        confidence=track_event["detection"].get('confidence', 0.0),
+                        track_id=track_event["track_id"],
+                        zone_id=track_event["zone_id"],
+                        camera_id=camera.id
+                    )
+                    EVENTS_LOGGED.inc(label=track_event["type"])
+                    await manager.broadcast_json({
+                        "type": "event",
+                        "name": track_event["type"],
+                        "camera": camera.id,
+                        "zone_id": track_event["zone_id"],
+                        "track_id": track_event["track_id"],
+                        "direction": track_event.get("direction"),
+                        # Whoever the track was recognised as when it started (no new embedding)
+                        "person": (recognizer.known(camera.id, track_event["track_id"]) or None) if recognizer else None,
+                        "ts": int(track_event["ts"])
+                    })
+                else:
+                    print(f"[Detection] Track {track_event['track_id']} left after {track_event['duration']}s")
+                    if last_snapshot is not None and last_snapshot["track_id"] == track_event["track_id"]:
+                        last_snapshot = None
+                    if recognizer is not None:
+                        recognizer.forget(camera.id, track_event["track_id"])
+            
+            # Flush the spatial heatmap counts once a minute. The table has no
+            # camera column (and cameras can use different grids), so only the
+            # default camera's counts are stored; the others are just drained
+            if time.time() - last_heatmap_flush > 60:
+                cells = streamer.get_zones().drain_heatmap()
+                if cells and camera is cameras.default:
+                    await asyncio.to_thread(database.add_spatial_counts, time.time(), cells)
+                last_heatmap_flush = time.time()
+            
+            # Keep the event clip going while anyone is still in view
+            if detections:
+                camera.clip_recorder.trigger(None, time.time())
         
         await asyncio.sleep(interval)
 
 
+async def _on_clip_saved(msg: dict):
+    retention.request_check()
+    await manager.broadcast_json(msg)
+
+
+def _camera_state(camera: Camera) -> dict:
+    """Camera + startup state for /api/health and the camera_state WebSocket message."""
+    if camera.start_error is not None:
+        # Being retried (see _retry_camera)
+        return {"camera": camera.id, "state": "failed", "error": camera.start_error, "startup": startup.status()}
+    if not startup.ready or not camera.created:
+        # The streamer may not exist yet; don't build it from a request
+        return {"camera": camera.id, "state": "starting", "startup": startup.status()}
+    return {**camera.supervisor.stats(), "startup": startup.status()}
+
+
+def _start_camera(camera: Camera, loop):
+    """Supervisor, event clips and the broadcaster/detection tasks for one camera (call on the loop)."""
+    streamer = camera.get_streamer()
+    if ROLE != "web":
+        # The supervisor does the actual start, and retries if it fails
+        print(f"[startup] Starting camera {camera.id}...")
+        camera.supervisor.start(on_state_change=lambda stats: asyncio.run_coroutine_threadsafe(
+            manager.broadcast_json({"type": "camera_state", **stats, "startup": startup.status()}, camera=camera.id), loop))
+        
+        # Event clips pull their frames from this camera's replay buffer
+        camera.clip_recorder = EventClipRecorder(DATA_DIR / "replays", camera_id=camera.id, scheduler=scheduler)
+        camera.clip_recorder.start(streamer, on_saved=_on_clip_saved)
+        camera.tasks.append(asyncio.create_task(detection_events(camera)))
+        if camera.timelapse is not None:
+            camera.timelapse_recorder = TimelapseRecorder(DATA_DIR / "timelapse", camera.id, scheduler=scheduler,
+                                                          **camera.timelapse)
+            camera.timelapse_recorder.start(streamer)
+    if ROLE != "capture":
+        camera.tasks.append(asyncio.create_task(frame_broadcaster(camera)))
+
+
+async def _publish_camera_status():
+    """Capture process: camera/supervisor/log snapshot for the web workers' health and log endpoints."""
+    while True:
+        for camera in cameras:
+            try:
+                camera.publish_status()
+            except Exception as e:
+                print(f"[FrameBus] Status for {camera.id} failed: {e}")
+        await asyncio.sleep(1.0)
+
+
+async def _relay_bus_events():
+    """Web worker: pass the capture process's WebSocket messages (photos, notifications, camera state) on."""
+    from .frame_bus import EventBus
+    bus, seq, last_check = None, 0, 0.0
+    while True:
+        now = time.time()
+        if bus is None or now - last_check > 5:
+            # Attach once the capture process is up, and again if it was restarted
+            last_check = now
+            try:
+                fresh = EventBus(DEFAULT_PREFIX)
+            except (FileNotFoundError, ValueError):
+                fresh = None
+            if fresh is not None and (bus is None or fresh.ring.created_ns != bus.ring.created_ns):
+                if bus is not None:
+                    bus.close()
+                # Only what's new from here on
+                bus, seq = fresh, fresh.ring.next_seq
+            elif fresh is not None:
+                fresh.close()
+        if bus is not None:
+            messages, seq = bus.read_since(seq)
+            for m in messages:
+                # Events already went through ws_events (or couldn't): just send
+                await manager.deliver(m["msg"], camera=m["camera"])
+        await asyncio.sleep(0.1)
+
+
+async def _until_ok(name: str, attempt):
+    """Run a bring-up step until it works, waiting 2 s, 4 s, ... up to a minute between tries."""
+    delay = 2.0
+    while True:
+        try:
+            with startup.step(name):
+                await attempt()
+            return
+        except Exception:
+            # The error is in /api/health (startup.error / failed_step) meanwhile
+            startup.retry(name, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+
+
+async def _bring_up_camera(camera: Camera, loop) -> bool:
+    """Streamer + services for one camera; a broken one (bad zones file, ...) doesn't hold up the others."""
+    try:
+        await asyncio.to_thread(camera.get_streamer)
+        _start_camera(camera, loop)
+        camera.start_error = None
+        return True
+    except Exception as e:
+        print(f"[startup] Camera {camera.id} failed to start: {e}")
+        camera.start_error = str(e)
+        # Whatever did get started; the next attempt starts from scratch
+        camera.stop()
+        return False
+
+
+async def _retry_camera(camera: Camera, loop):
+    delay = 5.0
+    while True:
+        print(f"[startup] Retrying camera {camera.id} in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        if await _bring_up_camera(camera, loop):
+            print(f"[startup] Camera {camera.id} started")
+            await manager.broadcast_json({"type": "camera_state", **_camera_state(camera)}, camera=camera.id)
+            return
+        delay = min(delay * 2, 300.0)
+
+
+async def _bring_up():
+    """
+    Everything slow happens here, after the app is already serving pages:
+    DB setup, building the streamers (numpy/OpenCV imports), then the cameras
+    themselves, which keep warming up (IMX500 firmware) under their supervisors.
+    A step that fails is retried (and shown in /api/health); a camera that
+    fails is retried on its own while the others run.
+    """
+    # GC progress and camera state changes come from worker threads, so hop back onto the loop to broadcast
+    loop = asyncio.get_running_loop()
+    if ROLE != "capture":
+        await _until_ok("frontend", lambda: asyncio.to_thread(frontend.load))
+
+    async def database_step():
+        await asyncio.to_thread(database.init_db)
+        await asyncio.to_thread(manager.log.load)
+    await _until_ok("database", database_step)
+    if ROLE != "capture":
+        # Events from every process, numbered in ws_events, out to this one's clients
+        asyncio.create_task(manager.log.follow(manager.deliver))
+    with startup.step("cameras"):
+        failed = [camera for camera in cameras if not await _bring_up_camera(camera, loop)]
+    if recognizer is not None:
+        with startup.step("recognition"):
+            try:
+                await asyncio.to_thread(recognizer.load)
+            except Exception as e:
+                # Detections still work, just without names
+                print(f"[Recognition] Couldn't load {recognizer.spec}: {e}")
+
+    async def services_step():
+        if ROLE != "web":
+            # Once per host: web workers leave tombstoned files to the capture
+            # process's GC, which picks them up on its next pass (<= 60 s)
+            storage_gc.start(on_progress=lambda msg: asyncio.run_coroutine_threadsafe(manager.broadcast_json(msg), loop))
+            retention.start(on_freed=storage_gc.wake)
+        if ROLE == "capture":
+            asyncio.create_task(_publish_camera_status())
+        elif ROLE == "web":
+            asyncio.create_task(_relay_bus_events())
+    await _until_ok("services", services_step)
+    startup.done()
+    for camera in failed:
+        asyncio.create_task(_retry_camera(camera, loop))
+    for camera in cameras:
+        await manager.broadcast_json({"type": "camera_state", **_camera_state(camera)}, camera=camera.id)
+
+
 @app.on_event("startup")
 async def startup_event():
-    # Start unified rpicam-vid streamer
-    print("[startup] Starting rpicam-vid streamer...")
-    start_streamer()
-    
-    # kick off background broadcaster
-    asyncio.create_task(frame_broadcaster())
+    loop_watchdog.start()
+    # Don't wait for any of it: pages and the API answer right away and
+    # report "starting" until the bring-up is done
+    asyncio.create_task(_bring_up())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    # Stop rpicam-vid streamer
-    print("[shutdown] Stopping rpicam-vid streamer...")
-    stop_streamer()
+    # Stop the cameras (supervisors, clip recorders, rpicam-vid)
+    print("[shutdown] Stopping cameras...")
+    cameras.stop_all()
+    loop_watchdog.stop()
+    retention.stop()
+    storage_gc.stop()
+    scheduler.shutdown()
+    if ROLE == "capture":
+        manager.bus.close()
+
+
+def _camera(cam_id: Optional[str]) -> Camera:
+    """The camera a route is for: /cam/{cam_id}/... or, for the original routes, the default one."""
+    if cam_id is None:
+        return cameras.default
+    camera = cameras.get(cam_id)
+    if camera is None:
+        raise HTTPException(status_code=404, detail=f"Unknown camera {cam_id}")
+    return camera
+
+
+def _streamer_of(camera: Camera):
+    """The camera's streamer, or 503 while it's still being set up (requests shouldn't build it)."""
+    if camera.start_error is not None:
+        raise HTTPException(status_code=503, detail=f"Camera failed to start: {camera.start_error}")
+    if not camera.created:
+        raise HTTPException(status_code=503, detail="Camera not ready")
+    return camera.get_streamer()
 
 
-def mjpeg_generator():
+async def mjpeg_generator(camera: Camera):
     """MJPEG stream using rpicam_streaming"""
-    streamer = get_streamer()
+    # Async, so a viewer is a coroutine rather than one of the threadpool's 40 threads
     boundary = b"--frame"
     while True:
-        frame = streamer.get_frame()
+        frame = camera.get_streamer().get_frame() if camera.created else None
         if not frame:
-            time.sleep(0.1)
+            await asyncio.sleep(0.1)
             continue
         header = b"Content-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(frame)
         yield boundary + b"\r\n" + header + frame + b"\r\n"
-        time.sleep(0.05)
+        await asyncio.sleep(0.05)
 
 
 @app.get("/stream.mjpg")
-def stream_mjpg():
-    return StreamingResponse(mjpeg_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
+@app.get("/cam/{cam_id}/stream.mjpg")
+def stream_mjpg(cam_id: Optional[str] = None):
+    camera = _camera(cam_id)
+    return StreamingResponse(mjpeg_generator(camera), media_type="multipart/x-mixed-replace; boundary=frame")
+
+
+def _hls_of(camera: Camera):
+    hls = getattr(_streamer_of(camera), "hls", None)
+    if hls is None:
+        raise HTTPException(status_code=404, detail=f"H.264 live view is off for camera {camera.id}")
+    return hls
+
+
+@app.get("/live.m3u8")
+@app.get("/cam/{cam_id}/live.m3u8")
+def hls_playlist(cam_id: Optional[str] = None):
+    """H.264 live view as HLS (see hls.py); segment URIs are relative to this playlist."""
+    playlist = _hls_of(_camera(cam_id)).playlist()
+    if playlist is None:
+        raise HTTPException(status_code=503, detail="No H.264 segments yet")
+    return Response(playlist, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/hls/init.mp4")
+@app.get("/cam/{cam_id}/hls/init.mp4")
+def hls_init(cam_id: Optional[str] = None):
+    init = _hls_of(_camera(cam_id)).init
+    if init is None:
+        raise HTTPException(status_code=503, detail="No H.264 stream yet")
+    return Response(init, media_type="video/mp4", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/hls/{seq}.m4s")
+@app.get("/cam/{cam_id}/hls/{seq}.m4s")
+def hls_segment(seq: int, cam_id: Optional[str] = None):
+    data = _hls_of(_camera(cam_id)).get_segment(seq)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Segment not in the cache")
+    # Sequence numbers restart with the streamer, so only cache briefly
+    return Response(data, media_type="video/iso.segment", headers={"Cache-Control": "max-age=30"})
 
 
 @app.get("/camera/frame")
-def camera_frame():
-    streamer = get_streamer()
+@app.get("/cam/{cam_id}/frame")
+def camera_frame(cam_id: Optional[str] = None):
+    streamer = _streamer_of(_camera(cam_id))
     frame = streamer.get_frame()
     if not frame:
         raise HTTPException(status_code=503, detail="Camera not ready")
@@ -213,33 +765,22 @@ def camera_frame():
 
 
 @app.post("/api/photo")
-async def take_photo(background: BackgroundTasks):
-    streamer = get_streamer()
+@app.post("/api/cam/{cam_id}/photo")
+async def take_photo(background: BackgroundTasks, cam_id: Optional[str] = None):
+    camera = _camera(cam_id)
+    streamer = _streamer_of(camera)
     frame = streamer.get_frame()
     if not frame:
         raise HTTPException(status_code=503, detail="Camera not ready")
-    photos_dir = DATA_DIR / "photos"
-    photos_dir.mkdir(parents=True, exist_ok=True)
-    fname = f"photo-{int(time.time())}.jpg"
-    path = photos_dir / fname
-    with open(path, "wb") as fh:
-        fh.write(frame)
-    # generate a thumbnail to improve gallery load times
-    thumbs_dir = photos_dir / "thumbs"
-    thumbs_dir.mkdir(parents=True, exist_ok=True)
-    try:
-        img = Image.open(io.BytesIO(frame))
-        img.thumbnail((300, 200))
-        thumb_path = thumbs_dir / fname
-        img.save(thumb_path, format="JPEG", quality=75)
-    except Exception:
-        # if thumbnail generation fails, continue without it
-        thumb_path = None
-
-    database.add_photo(int(time.time()), path)
+    fname = _photo_name("photo", camera, time.time())
+    # PIL + disk + SQLite would stall the live view if done on the event loop
+    thumb_ok, photo_id = await scheduler.run("capture", _write_photo, frame, fname, time.time(), False, camera.id)
+    PHOTOS_SAVED.inc(source='manual')
     # push event to websockets
-    await manager.broadcast_json({"type": "event", "name": "photo_taken", "path": f"/data/photos/{fname}", "ts": int(time.time())})
-    return JSONResponse({"path": f"/data/photos/{fname}", "thumb": (f"/data/photos/thumbs/{fname}" if thumb_path else None), "ts": int(time.time())})
+    await manager.broadcast_json({"type": "event", "name": "photo_taken", "id": photo_id, "camera": camera.id,
+                                  "path": f"/data/photos/{fname}",
+                                  "thumb": (f"/data/photos/thumbs/{fname}" if thumb_ok else None), "ts": int(time.time())})
+    return JSONResponse({"path": f"/data/photos/{fname}", "thumb": (f"/data/photos/thumbs/{fname}" if thumb_ok else None), "ts": int(time.time())})
 
 
 @app.get("/api/photos")
@@ -257,28 +798,20 @@ def list_photos():
             fname = None
         public = f"/data/photos/{fname}" if fname else p
         thumb = f"/data/photos/thumbs/{fname}" if fname else None
-        out.append({"id": r.get('id'), "timestamp": r.get('timestamp'), "path": public, "thumb": thumb})
+        out.append({"id": r.get('id'), "timestamp": r.get('timestamp'), "camera": r.get('camera_id'),
+                    "path": public, "thumb": thumb})
     return JSONResponse(out)
 
 
 @app.delete("/api/photo/{photo_id}")
 async def delete_photo(photo_id: int):
-    path = database.delete_photo(photo_id)
+    path = await asyncio.to_thread(database.delete_photo, photo_id)
     if not path:
         raise HTTPException(status_code=404, detail="Photo not found")
     
     # Delete the actual files (photo and thumbnail)
     try:
-        photo_path = Path(path)
-        if photo_path.exists():
-            photo_path.unlink()
-        
-        # Delete thumbnail if it exists
-        photos_dir = DATA_DIR / "photos"
-        thumbs_dir = photos_dir / "thumbs"
-        thumb_path = thumbs_dir / photo_path.name
-        if thumb_path.exists():
-            thumb_path.unlink()
+        await asyncio.to_thread(photo_store.remove, Path(path).name)
     except Exception as e:
         # Log error but still return success since DB entry is deleted
         print(f"Error deleting files: {e}")
@@ -290,40 +823,24 @@ async def delete_photo(photo_id: int):
 
 @app.delete("/api/photos")
 async def delete_all_photos():
-    """Delete all photos and their files"""
-    paths = database.delete_all_photos()
-    deleted_count = 0
-    
-    photos_dir = DATA_DIR / "photos"
-    thumbs_dir = photos_dir / "thumbs"
-    
-    for path in paths:
-        try:
-            photo_path = Path(path)
-            if photo_path.exists():
-                photo_path.unlink()
-            # Delete thumbnail if exists
-            thumb_path = thumbs_dir / photo_path.name
-            if thumb_path.exists():
-                thumb_path.unlink()
-            deleted_count += 1
-        except Exception as e:
-            print(f"Error deleting photo file: {e}")
+    """Delete all photos (files are removed in the background by the GC)"""
+    deleted_count = await asyncio.to_thread(database.tombstone_all_photos)
+    storage_gc.wake()
     
     await manager.broadcast_json({"type": "event", "name": "photos_cleared", "count": deleted_count})
     return JSONResponse({"success": True, "deleted": deleted_count})
 
 
 @app.get("/api/events")
-def get_events(limit: int = 100):
-    rows = database.list_events(limit=limit)
+def get_events(limit: int = 100, camera: Optional[str] = None):
+    rows = database.list_events(limit=limit, camera_id=camera)
     return JSONResponse(rows)
 
 
 @app.delete("/api/events")
 async def clear_all_events():
     """Clear all detection events (reset heatmap)"""
-    deleted = database.clear_all_events()
+    deleted = await asyncio.to_thread(database.clear_all_events)
     await manager.broadcast_json({"type": "event", "name": "events_cleared", "count": deleted})
     return JSONResponse({"success": True, "deleted": deleted})
 
@@ -331,14 +848,154 @@ async def clear_all_events():
 @app.delete("/api/events/invalid")
 async def clear_invalid_events():
     """Clear events without snapshots (old false positives)"""
-    deleted = database.clear_events_without_snapshots()
+    deleted = await asyncio.to_thread(database.clear_events_without_snapshots)
     await manager.broadcast_json({"type": "event", "name": "invalid_events_cleared", "count": deleted})
     return JSONResponse({"success": True, "deleted": deleted})
 
 
+@app.get("/api/storage")
+def get_storage():
+    """Disk usage per data class, with the retention limits that apply to it."""
+    return JSONResponse(retention.usage_report())
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/health")
+def get_health():
+    """One-glance status: camera process, frame freshness, clients and stage latencies."""
+    if not startup.ready:
+        return JSONResponse({
+            "status": "failed" if startup.failed_step else "starting",
+            "uptime": round(time.time() - STARTED_AT),
+            "startup": startup.status(),
+            "websocket_clients": len(manager.active),
+            "event_loop": loop_watchdog.summary(),
+        })
+    per_camera = {camera.id: _camera_health(camera) for camera in cameras}
+    healthy = all(c["healthy"] for c in per_camera.values())
+    default = per_camera[cameras.default.id]
+    return JSONResponse({
+        "status": "ok" if healthy else "degraded",
+        "uptime": round(time.time() - STARTED_AT),
+        # The default camera, as before; all of them (including it) under "cameras"
+        "camera": default,
+        "cameras": per_camera,
+        "startup": startup.status(),
+        "websocket_clients": len(manager.active),
+        "event_loop": loop_watchdog.summary(),
+        "replay_buffer": default.get("replay_buffer"),
+        "work": scheduler.stats(),
+        "ws_events": manager.log.stats(),
+        "recognition": recognizer.stats() if recognizer is not None else None,
+        "latency": {
+            "detection": metrics.histogram_summary("picam_detection_seconds", camera=cameras.default.id),
+            "broadcast_frame": metrics.histogram_summary("ws_broadcast_seconds", type="frame"),
+            "encode": metrics.histogram_summary("video_encode_seconds"),
+        },
+    })
+
+
+def _camera_health(camera: Camera) -> dict:
+    if not camera.created:
+        return {"id": camera.id, "healthy": False, "running": False, "supervisor": _camera_state(camera)}
+    streamer = camera.get_streamer()
+    frame_info = streamer.get_frame_info()
+    running = streamer.is_running()
+    age = frame_info["last_frame_age"]
+    # Running but no frame for a few seconds usually means the camera is wedged
+    stale = age is None or age > 5
+    return {
+        "id": camera.id,
+        "healthy": running and not stale,
+        "source": streamer.source.name,
+        "running": running,
+        "pid": streamer.source.pid,
+        "last_frame_age": age,
+        "frames_seen": frame_info["frames_seen"],
+        "supervisor": camera.supervisor.stats(),
+        "log": streamer.source.log_stats(),
+        "replay_buffer": streamer.get_buffer_stats(),
+        "hls": streamer.hls.stats() if getattr(streamer, "hls", None) is not None else None,
+        "timelapse": camera.timelapse_recorder.stats() if camera.timelapse_recorder is not None else None,
+    }
+
+
+@app.get("/api/cameras")
+def list_cameras():
+    """Configured cameras and what each is doing (see cameras.py)."""
+    return JSONResponse({"default": cameras.default.id, "cameras": [c.describe() for c in cameras]})
+
+
+@app.get("/api/camera/log")
+@app.get("/api/cam/{cam_id}/log")
+def get_camera_log(limit: int = 100, level: str = None, cam_id: Optional[str] = None):
+    """Recent rpicam-vid stderr lines (per-frame lines left out), optionally only warn/error."""
+    source = _streamer_of(_camera(cam_id)).source
+    return JSONResponse({"stats": source.log_stats(), "lines": source.recent_log(limit=limit, level=level)})
+
+
+def _require_debug_token(request: Request):
+    """Debug endpoints are off unless PICAM_DEBUG_TOKEN is set, and then need that token."""
+    expected = os.environ.get("PICAM_DEBUG_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Debug endpoints are disabled")
+    auth = request.headers.get("authorization", "")
+    given = auth[7:] if auth.lower().startswith("bearer ") else request.headers.get("x-debug-token", "")
+    if not hmac.compare_digest(given.encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
+
+
+@app.get("/api/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10, hz: float = 67, format: str = "collapsed",
+                        idle: bool = False, lines: bool = False):
+    """
+    Sample every thread's stack for N seconds. Default output is collapsed
+    stacks for flamegraph.pl / speedscope:
+        curl -H "Authorization: Bearer $PICAM_DEBUG_TOKEN" 'http://pi:8080/api/debug/profile?seconds=15' > cpu.folded
+    """
+    _require_debug_token(request)
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format must be collapsed or json")
+    # Runs in a worker thread so the event loop keeps going (and gets sampled too)
+    try:
+        result = await asyncio.to_thread(profiler.profile, seconds, hz, idle, lines)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    print(f"[profiler] {result['samples']} samples over {result['seconds']}s, overhead {result['overhead_percent']}%")
+    if format == "json":
+        return JSONResponse(result)
+    return Response(result["collapsed"] + "\n", media_type="text/plain", headers={
+        "X-Profile-Samples": str(result["samples"]),
+        "X-Profile-Overhead-Percent": str(result["overhead_percent"]),
+    })
+
+
 @app.get("/api/heatmap")
-def get_heatmap(days: int = 30):
-    return JSONResponse(database.heatmap_last_days(days=days))
+def get_heatmap(days: int = 30, label: str = 'person'):
+    return JSONResponse(database.heatmap_last_days(days=days, label=label))
+
+
+@app.get("/api/heatmap/spatial")
+def get_spatial_heatmap(days: int = 7):
+    """Where in the frame people were (default camera): centroid counts as a grid[gy][gx]."""
+    gw, gh = _streamer_of(cameras.default).get_zones().grid_size
+    grid = [[0] * gw for _ in range(gh)]
+    for (gx, gy), count in database.spatial_heatmap_last_days(days=days).items():
+        if gx < gw and gy < gh:
+            grid[gy][gx] = count
+    return JSONResponse({"width": gw, "height": gh, "days": days, "grid": grid})
+
+
+@app.get("/api/zones")
+@app.get("/api/cam/{cam_id}/zones")
+def get_zones(cam_id: Optional[str] = None):
+    """Configured zones and tripwires (config/zones.json, or the camera's own "zones" file)."""
+    return JSONResponse(_streamer_of(_camera(cam_id)).get_zones().describe())
 
 
 @app.get("/api/heatmap/photos")
@@ -348,6 +1005,82 @@ def get_heatmap_photos(weekday: int, hour: int, days: int = 7, limit: int = 3, l
     return JSONResponse(photos)
 
 
+@app.get("/api/enrollments")
+def get_enrollments():
+    """Known people, with how many images each has."""
+    return JSONResponse(database.list_enrollments())
+
+
+@app.post("/api/enrollments")
+def create_enrollment(name: str):
+    name = name.strip()
+    if not name:
+        raise HTTPException(status_code=400, detail="Name required")
+    return JSONResponse({"id": database.add_enrollment(name), "name": name})
+
+
+@app.post("/api/enrollments/{eid}/images")
+async def add_enrollment_images(eid: int, files: List[UploadFile] = File(...)):
+    """
+    Add pictures of someone, as a normal form upload
+    (curl -F files=@alice1.jpg -F files=@alice2.jpg ...).
+    Best cropped to the person, like the detection crops they're compared with.
+    """
+    if not any(e["id"] == eid for e in await asyncio.to_thread(database.list_enrollments)):
+        raise HTTPException(status_code=404, detail="Unknown enrollment")
+    images = []
+    for f in files:
+        data = await f.read()
+        if not data or len(data) > 10 * 1024 * 1024:
+            raise HTTPException(status_code=400, detail=f"{f.filename}: expected a JPEG of up to 10 MB")
+        images.append((f.filename, data))
+
+    def save():
+        from PIL import Image
+        for name, data in images:
+            try:
+                Image.open(io.BytesIO(data)).verify()
+            except Exception:
+                raise HTTPException(status_code=400, detail=f"{name}: not a valid image")
+        folder = DATA_DIR / "enrollments" / str(eid)
+        folder.mkdir(parents=True, exist_ok=True)
+        saved = []
+        for _, data in images:
+            path = folder / f"{uuid.uuid4().hex[:12]}.jpg"
+            path.write_bytes(data)
+            saved.append({"id": database.add_enrollment_image(eid, path),
+                          "path": f"/data/enrollments/{eid}/{path.name}"})
+        return saved
+
+    saved = await asyncio.to_thread(save)
+    if recognizer is not None and recognizer.ready:
+        # Embed them now; in a web worker the capture process picks them up within 10 s
+        await scheduler.run("recognition", recognizer.sync)
+    return JSONResponse({"images": saved})
+
+
+@app.delete("/api/enrollments/{eid}")
+async def delete_enrollment(eid: int):
+    paths = await asyncio.to_thread(database.delete_enrollment, eid)
+    if paths is None:
+        raise HTTPException(status_code=404, detail="Unknown enrollment")
+
+    def remove():
+        for p in paths:
+            Path(p).unlink(missing_ok=True)
+
+    await asyncio.to_thread(remove)
+    if recognizer is not None and recognizer.ready:
+        await scheduler.run("recognition", recognizer.sync)
+    return JSONResponse({"success": True, "id": eid, "images": len(paths)})
+
+
+@app.get("/api/recognition")
+def get_recognition():
+    """Embedder, index size, cache hits and embed/search latency (null when PICAM_EMBEDDER isn't set)."""
+    return JSONResponse(recognizer.stats() if recognizer is not None else None)
+
+
 @app.get("/data/enrollments/{eid}/{filename}")
 def enroll_image(eid: str, filename: str):
     p = DATA_DIR / "enrollments" / eid / filename
@@ -358,19 +1091,60 @@ def enroll_image(eid: str, filename: str):
 
 @app.get("/data/photos/{filename}")
 def photo_file(filename: str):
-    p = DATA_DIR / "photos" / filename
-    if not p.exists():
+    # Same URL whether the file is in its day folder or still flat
+    p = photo_store.resolve(filename)
+    if p is None:
         raise HTTPException(status_code=404)
     return FileResponse(p)
 
 
+@app.get("/data/photos/thumbs/{filename}")
+def photo_thumb_file(filename: str):
+    p = photo_store.resolve_thumb(filename)
+    if p is None:
+        raise HTTPException(status_code=404)
+    return FileResponse(p)
+
+
+@app.get("/data/replays/{filename}")
+def replay_file(filename: str, request: Request):
+    """Serve replay MP4s with Range support so playback starts right away."""
+    p = DATA_DIR / "replays" / filename
+    if not p.is_file():
+        raise HTTPException(status_code=404)
+    return range_file_response(request, p, "video/mp4")
+
+
+@app.get("/data/timelapse/{cam_id}/{filename}")
+def timelapse_file(cam_id: str, filename: str, request: Request):
+    """Finished daily timelapses, with Range support like the replays."""
+    p = DATA_DIR / "timelapse" / cam_id / filename
+    if not p.is_file() or p.suffix != ".mp4":
+        raise HTTPException(status_code=404)
+    return range_file_response(request, p, "video/mp4")
+
+
+@app.get("/api/timelapse")
+def list_timelapses(camera: Optional[str] = None):
+    """Daily timelapses per camera, newest first (today's shows its segments so far until it's joined)."""
+    days = list_timelapse_days(DATA_DIR / "timelapse")
+    if camera:
+        days = [d for d in days if d["camera"] == camera]
+    return JSONResponse(days)
+
+
 @app.post("/api/replay")
-async def create_replay(seconds: int = 30):
+@app.post("/api/cam/{cam_id}/replay")
+async def create_replay(seconds: int = 30, cam_id: Optional[str] = None):
     """Create and save a replay as MP4 in background, return immediately with status"""
     if seconds <= 0 or seconds > 300:
         raise HTTPException(status_code=400, detail="seconds must be 1..300")
     
-    streamer = get_streamer()
+    camera = _camera(cam_id)
+    # Still starting up: don't build the streamer on the event loop
+    if not camera.created:
+        raise HTTPException(status_code=503, detail="Camera not running")
+    streamer = camera.get_streamer()
     
     # Quick check if buffer has any frames (non-blocking)
     if not streamer.is_running():
@@ -382,7 +1156,7 @@ async def create_replay(seconds: int = 30):
     
     # Generate unique filename
     timestamp = int(time.time())
-    filename = f"replay-{timestamp}-{seconds}s.mp4"
+    filename = f"replay-{camera.id}-{timestamp}-{seconds}s.mp4"
     output_path = replays_dir / filename
     
     # Run everything in background thread to avoid blocking
@@ -390,28 +1164,38 @@ async def create_replay(seconds: int = 30):
         try:
             print(f"[replay] Background task started for {seconds}s replay", flush=True)
             
-            # Get frames in background thread (holds lock briefly)
-            frames = await asyncio.to_thread(streamer.get_recent_frames, seconds)
-            if not frames:
-                print("[replay] No frames available", flush=True)
-                await manager.broadcast_json({
-                    "type": "error",
-                    "message": "No frames available for replay",
-                    "ts": int(time.time())
-                })
-                return
-            
-            # Use the timestamp from the FIRST frame as the video start time
-            # This ensures the displayed time matches the actual video content
-            video_start_timestamp = frames[0][0]
-            
-            print(f"[replay] Got {len(frames)} frames, starting encode...", flush=True)
-            
-            # Run CPU-intensive FFmpeg encoding in thread pool
-            # Use 15fps to match source camera framerate for real-time playback
-            metadata = await asyncio.to_thread(
-                video_utils.frames_to_mp4, frames, output_path, 15
-            )
+            # With the H.264 view on, the clip is just its segments - no encode
+            end = time.time()
+            metadata = None
+            if getattr(streamer, "hls", None) is not None:
+                metadata = await asyncio.to_thread(streamer.clip_from_segments, end - seconds, end, output_path)
+            if metadata is not None:
+                video_start_timestamp = int(metadata["start"])
+                print(f"[replay] Wrote {metadata['frame_count']} frames from H.264 segments", flush=True)
+            else:
+                # Get frames in background thread (holds lock briefly)
+                frames = await asyncio.to_thread(streamer.get_recent_frames, seconds)
+                if not frames:
+                    print("[replay] No frames available", flush=True)
+                    await manager.broadcast_json({
+                        "type": "error",
+                        "message": "No frames available for replay",
+                        "ts": int(time.time())
+                    })
+                    return
+                
+                # Use the timestamp from the FIRST frame as the video start time
+                # This ensures the displayed time matches the actual video content
+                video_start_timestamp = int(frames[0][0])
+                
+                print(f"[replay] Got {len(frames)} frames, starting encode...", flush=True)
+                
+                # Run CPU-intensive FFmpeg encoding on the shared encode pool
+                # Frames are timed from their real capture timestamps (VFR), the
+                # camera framerate is only used for the last frame's duration
+                metadata = await scheduler.run(
+                    "encode", video_utils.frames_to_mp4, frames, output_path, streamer.framerate
+                )
             
             # Save to database with the actual video start time
             replay_id = await asyncio.to_thread(
@@ -420,22 +1204,19 @@ async def create_replay(seconds: int = 30):
                 metadata['duration'],
                 metadata['frame_count'],
                 metadata['file_size'],
-                str(output_path)
+                str(output_path),
+                camera.id
             )
             
-            # Cleanup old replays
-            old_paths = await asyncio.to_thread(database.cleanup_old_replays, 100)
-            for old_path in old_paths:
-                try:
-                    Path(old_path).unlink(missing_ok=True)
-                except Exception:
-                    pass
+            # Let retention drop old replays if this one pushed us over a limit
+            retention.request_check()
             
             # Broadcast completion
             await manager.broadcast_json({
                 "type": "event",
                 "name": "replay_saved",
                 "id": replay_id,
+                "camera": camera.id,
                 "duration": metadata['duration'],
                 "path": f"/data/replays/{filename}",
                 "ts": video_start_timestamp
@@ -466,9 +1247,9 @@ async def create_replay(seconds: int = 30):
 
 
 @app.get("/api/replays")
-def list_replays():
-    """List all saved replays"""
-    rows = database.list_replays(limit=100)
+def list_replays(camera: Optional[str] = None):
+    """List all saved replays (or one camera's)"""
+    rows = database.list_replays(limit=100, camera_id=camera)
     out = []
     for r in rows:
         p = r.get('path')
@@ -478,13 +1259,19 @@ def list_replays():
         except Exception:
             fname = None
         public = f"/data/replays/{fname}" if fname else p
+        # Older replays were saved before posters existed
+        poster = None
+        if fname and video_utils.poster_path_for(Path(p)).exists():
+            poster = f"/data/replays/posters/{Path(fname).stem}.jpg"
         out.append({
             "id": r.get('id'),
             "timestamp": r.get('timestamp'),
+            "camera": r.get('camera_id'),
             "duration": r.get('duration'),
             "frame_count": r.get('frame_count'),
             "file_size": r.get('file_size'),
-            "path": public
+            "path": public,
+            "poster": poster
         })
     return JSONResponse(out)
 
@@ -492,40 +1279,90 @@ def list_replays():
 @app.delete("/api/replay/{replay_id}")
 async def delete_replay(replay_id: int):
     """Delete a replay by ID"""
-    path = database.delete_replay(replay_id)
+    path = await asyncio.to_thread(database.delete_replay, replay_id)
     if not path:
         raise HTTPException(status_code=404, detail="Replay not found")
     
-    # Delete the actual file
+    # Delete the actual file (and its poster)
     try:
-        replay_path = Path(path)
-        if replay_path.exists():
-            replay_path.unlink()
+        await asyncio.to_thread(video_utils.remove_replay_files, path)
     except Exception as e:
         print(f"Error deleting replay file: {e}")
     
+    await manager.broadcast_json({"type": "event", "name": "replay_deleted", "id": replay_id})
     return JSONResponse({"success": True, "id": replay_id})
 
 
 @app.delete("/api/replays")
 async def delete_all_replays():
-    """Delete all replays and their files"""
-    paths = database.delete_all_replays()
-    deleted_count = 0
-    
-    for path in paths:
-        try:
-            replay_path = Path(path)
-            if replay_path.exists():
-                replay_path.unlink()
-            deleted_count += 1
-        except Exception as e:
-            print(f"Error deleting replay file: {e}")
+    """Delete all replays (files are removed in the background by the GC)"""
+    deleted_count = await asyncio.to_thread(database.tombstone_all_replays)
+    storage_gc.wake()
     
     await manager.broadcast_json({"type": "event", "name": "replays_cleared", "count": deleted_count})
     return JSONResponse({"success": True, "deleted": deleted_count})
 
 
+@app.get("/api/export")
+async def export_range(request: Request, start: float, end: Optional[float] = None,
+                       kinds: str = ",".join(export.KINDS), camera: Optional[str] = None, format: str = "zip"):
+    """
+    Photos, thumbnails, replays and events between start and end (unix seconds) as a
+    streamed ZIP (see export.py), or format=ndjson for just the manifest.
+    Pass an explicit end to be able to resume: the same range gives the same archive.
+    """
+    end = time.time() if end is None else end
+    wanted = tuple(k for k in export.KINDS if k in kinds.split(","))
+    if not wanted or end < start:
+        raise HTTPException(status_code=400, detail=f"kinds is a comma list of {', '.join(export.KINDS)}; end >= start")
+    name = f"picam-export-{int(start)}-{int(end)}"
+
+    if format == "ndjson":
+        async def lines():
+            # DB reads off the event loop, a batch of lines at a time
+            it = export.iter_manifest(DATA_DIR, start, end, wanted, camera)
+            while True:
+                batch = await asyncio.to_thread(lambda: [line for _, line in zip(range(500), it)])
+                if not batch:
+                    break
+                yield b"".join(batch)
+        return StreamingResponse(lines(), media_type="application/x-ndjson",
+                                 headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'})
+    if format != "zip":
+        raise HTTPException(status_code=400, detail="format is zip or ndjson")
+
+    archive = await asyncio.to_thread(export.ExportArchive.build, DATA_DIR, start, end, wanted, camera)
+    headers = {
+        "ETag": archive.etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{name}.zip"',
+        "Cache-Control": "no-cache",
+    }
+    first, last, status = 0, archive.size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: only resume if the archive is still the one the client started
+    if range_header and (not if_range or if_range == archive.etag):
+        byte_range = parse_range(range_header, archive.size)
+        if byte_range is None:
+            archive.close()
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{archive.size}"})
+        first, last = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{archive.size}"
+    headers["Content-Length"] = str(last - first + 1)
+
+    async def body():
+        try:
+            async for chunk in archive.stream(first, last):
+                yield chunk
+        finally:
+            archive.close()
+    print(f"[Export] {start:.0f}-{end:.0f} {','.join(wanted)}: {archive.stats()['entries']} entries, "
+          f"{archive.size / 1e6:.1f} MB" + (f" (resuming at {first})" if first else ""))
+    return StreamingResponse(body(), status_code=status, media_type="application/zip", headers=headers)
+
+
 @app.post("/api/test/person-detection")
 async def test_person_detection():
     """Test endpoint to trigger a person detection notification"""
@@ -540,9 +1377,21 @@ async def test_person_detection():
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
-    await manager.connect(ws)
+async def websocket_endpoint(ws: WebSocket, camera: Optional[str] = None, frames: bool = True,
+                             live: bool = True, last_seq: Optional[int] = None):
+    # /ws?camera=<id> picks whose frames and detections to get; events come from all cameras.
+    # frames=0 for pages showing the H.264 view: everything but the JPEG frames.
+    # live=0 for pages that only list things (photos, replays): just the events.
+    # last_seq=N when reconnecting: the events after N first (see event_log.py)
+    cam = cameras.get(camera) if camera else cameras.default
+    if cam is None:
+        await ws.close(code=1008)
+        return
     try:
+        await manager.connect(ws, cam.id, frames, live, last_seq)
+        if live:
+            # Let the page show "camera warming up" straight away instead of a blank view
+            await ws.send_json({"type": "camera_state", **_camera_state(cam)})
         while True:
             # keep connection alive; optionally receive client pings
             data = await ws.receive_text()
@@ -555,11 +1404,6 @@ async def websocket_endpoint(ws: WebSocket):
 if DATA_DIR.exists():
     app.mount("/data", StaticFiles(directory=str(DATA_DIR)), name="data")
 
-# Mount frontend static files at /ui path (NOT "/" to avoid blocking API routes)
-if FRONTEND_DIR.exists():
-    app.mount("/ui", StaticFiles(directory=str(FRONTEND_DIR), html=True), name="frontend")
-
-
 # Redirect root to frontend
 @app.get("/")
 async def root():
@@ -567,21 +1411,38 @@ async def root():
     return RedirectResponse(url="/ui/index.html")
 
 
+# The frontend at /ui/ (NOT "/" to avoid blocking API routes), precompressed
+# and cached from memory - see static_assets.py
+@app.get("/ui/{name:path}")
+def serve_ui(name: str, request: Request):
+    asset = frontend.get(name or "index.html")
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return frontend.response(request, asset)
+
+
+# Fingerprinted assets (/static/style.<hash>.css): the URL changes with the content, so cache forever
+@app.get("/static/{name}")
+def serve_static(name: str, request: Request):
+    asset = frontend.get_fingerprinted(name)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return frontend.response(request, asset, immutable=True)
+
+
 # Serve individual HTML pages at root level for convenience
 @app.get("/{page}.html")
-async def serve_html(page: str):
-    from fastapi.responses import FileResponse
-    html_path = FRONTEND_DIR / f"{page}.html"
-    if html_path.exists():
-        return FileResponse(html_path, media_type="text/html")
-    raise HTTPException(status_code=404, detail="Page not found")
+def serve_html(page: str, request: Request):
+    asset = frontend.get(f"{page}.html")
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return frontend.response(request, asset)
 
 
 # Serve CSS at root level
 @app.get("/style.css")
-async def serve_css():
-    from fastapi.responses import FileResponse
-    css_path = FRONTEND_DIR / "style.css"
-    if css_path.exists():
-        return FileResponse(css_path, media_type="text/css")
-    raise HTTPException(status_code=404, detail="CSS not found")
+def serve_css(request: Request):
+    asset = frontend.get("style.css")
+    if asset is None:
+        raise HTTPException(status_code=404, detail="CSS not found")
+    return frontend.response(request, asset)
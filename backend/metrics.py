@@ -0,0 +1,282 @@
+"""
+Tiny in-process metrics (counters, gauges, histograms) rendered in the
+Prometheus text format at /metrics.
+
+Updates happen on hot paths (every frame in the reader thread, every
+broadcast on the event loop), so they don't take a lock: each thread writes
+to its own shard of the metric and /metrics adds the shards up when it is
+scraped. Gauges that just mirror some existing state (client count, buffer
+size) are callbacks evaluated at scrape time instead of being kept up to date.
+
+No prometheus_client dependency - this is all we need and it's small.
+"""
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets in seconds (1 ms .. 30 s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        # One dict per thread that ever touched this metric: label values -> state
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._shards_lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self) -> Dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: Dict) -> Tuple:
+        if not labels and not self.labelnames:
+            return ()
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _snapshot(self) -> List[Dict]:
+        with self._shards_lock:
+            return list(self._shards)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        return sum(s.get(key, 0) for s in self._snapshot())
+
+    def _totals(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._snapshot():
+            for key, v in list(shard.items()):
+                totals[key] = totals.get(key, 0) + v
+        return totals
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}"
+                for k, v in sorted(self._totals().items())]
+
+
+class Gauge(_Metric):
+    """
+    Either set() directly (last write wins across threads) or built with a
+    callback that returns the current value, or {label tuple: value} when the
+    gauge has labels.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 callback: Optional[Callable] = None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+        self._values: Dict[Tuple, Tuple[float, float]] = {}
+
+    def set(self, value: float, **labels):
+        # (monotonic write time, value) so the newest write wins
+        self._values[self._key(labels)] = (time.monotonic(), value)
+
+    def _current(self) -> Dict[Tuple, float]:
+        if self.callback is not None:
+            try:
+                result = self.callback()
+            except Exception:
+                return {}
+            if isinstance(result, dict):
+                return {tuple(str(x) for x in (k if isinstance(k, tuple) else (k,))): v
+                        for k, v in result.items()}
+            return {(): result} if result is not None else {}
+        return {k: v for k, (_, v) in list(self._values.items())}
+
+    def value(self, **labels) -> Optional[float]:
+        return self._current().get(self._key(labels))
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(float(v))}"
+                for k, v in sorted(self._current().items())]
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "start")
+
+    def __init__(self, hist: "Histogram", labels: Dict):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # per-bucket counts (not cumulative) + [sum, count]
+            state = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """with hist.time(): ... observes the block's wall time in seconds."""
+        return _Timer(self, labels)
+
+    def _merged(self) -> Dict[Tuple, List]:
+        merged: Dict[Tuple, List] = {}
+        for shard in self._snapshot():
+            for key, (counts, total, n) in list(shard.items()):
+                m = merged.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                m[0] = [a + b for a, b in zip(m[0], counts)]
+                m[1] += total
+                m[2] += n
+        return merged
+
+    def summary(self, **labels) -> Dict:
+        """count, mean and approximate p50/p95/p99 (bucket upper bounds) for /api/health."""
+        state = self._merged().get(self._key(labels))
+        if not state or not state[2]:
+            return {"count": 0}
+        counts, total, n = state
+        out = {"count": n, "mean": round(total / n, 6)}
+        for q in (0.5, 0.95, 0.99):
+            target, running = q * n, 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                if running >= target:
+                    out[f"p{int(q * 100)}"] = bound
+                    break
+        return out
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, n) in sorted(self._merged().items()):
+            running = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                running += c
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+def counter(name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+    return Counter(name, help_text, labels)
+
+
+def gauge(name: str, help_text: str, labels: Sequence[str] = (), callback: Optional[Callable] = None) -> Gauge:
+    return Gauge(name, help_text, labels, callback)
+
+
+def histogram(name: str, help_text: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return Histogram(name, help_text, labels, buckets)
+
+
+def get(name: str) -> Optional[_Metric]:
+    with _registry_lock:
+        return next((m for m in _registry if m.name == name), None)
+
+
+def histogram_summary(name: str, **labels) -> Dict:
+    """Histogram.summary() by metric name ({} if it isn't registered)."""
+    hist = get(name)
+    return hist.summary(**labels) if isinstance(hist, Histogram) else {}
+
+
+def render() -> str:
+    """Every registered metric in Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _benchmark(n: int = 200_000):
+    c = Counter("bench_total", "benchmark counter", ("stage",))
+    h = Histogram("bench_seconds", "benchmark histogram")
+    start = time.perf_counter()
+    for _ in range(n):
+        c.inc(stage="split")
+    inc_ns = (time.perf_counter() - start) * 1e9 / n
+    start = time.perf_counter()
+    for i in range(n):
+        h.observe((i % 1000) / 1e4)
+    obs_ns = (time.perf_counter() - start) * 1e9 / n
+    start = time.perf_counter()
+    text = render()
+    render_ms = (time.perf_counter() - start) * 1000
+    print(f"counter.inc: {inc_ns:.0f} ns, histogram.observe: {obs_ns:.0f} ns, "
+          f"render: {render_ms:.2f} ms ({len(text)} bytes)")
+
+
+if __name__ == "__main__":
+    _benchmark()
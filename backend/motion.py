@@ -0,0 +1,137 @@
+"""
+Optional CPU motion detector (OpenCV frame differencing).
+Each JPEG is decoded straight to a 1/4-scale grayscale image (160x120 for our
+640x480 stream), blurred, and compared with a slowly-updating background.
+Pixels that changed enough become "motion", and we report:
+  - score: fraction of the frame that is moving (0.0 - 1.0)
+  - regions: normalized [x1, y1, x2, y2] boxes around the moving blobs
+If OpenCV isn't installed the detector just reports itself as unavailable.
+
+Run `python -m backend.motion` for CPU-per-frame numbers on 640x480 input.
+"""
+
+import importlib.util
+import time
+from typing import Dict, List, Optional
+
+# OpenCV takes a good while to import on a Pi, so it's only loaded when a
+# MotionDetector is actually created (not when this module is imported)
+cv2 = None
+np = None
+
+
+# A pixel counts as moving if it differs from the background by this much (0-255)
+PIXEL_THRESHOLD = 25
+# Blobs smaller than this fraction of the frame are ignored (leaves, noise)
+MIN_REGION_AREA = 0.002
+# Frame counts as "motion" if at least this fraction of it is moving
+MOTION_SCORE_THRESHOLD = 0.005
+# How fast the background adapts (higher = forgets parked objects sooner)
+BACKGROUND_RATE = 0.05
+
+
+def motion_available() -> bool:
+    # find_spec checks it's installed without importing it.
+    # opencv-python-headless is in requirements.txt, but keep the app running without it
+    return cv2 is not None or importlib.util.find_spec("cv2") is not None
+
+
+def _load_cv2() -> bool:
+    global cv2, np
+    if cv2 is None:
+        try:
+            import cv2 as _cv2
+            import numpy as _np
+        except ImportError:
+            return False
+        cv2, np = _cv2, _np
+    return True
+
+
+class MotionDetector:
+    """Frame-differencing motion detector with a running-average background."""
+
+    def __init__(self, threshold: float = MOTION_SCORE_THRESHOLD):
+        if not _load_cv2():
+            raise RuntimeError("OpenCV is not installed")
+        self.threshold = threshold
+        self._background = None
+        self.last_motion_ts = 0.0
+
+    def process(self, jpeg_bytes: bytes, ts: Optional[float] = None) -> Optional[Dict]:
+        """Score one frame. Returns None if the frame couldn't be decoded."""
+        ts = ts if ts is not None else time.time()
+        buf = np.frombuffer(jpeg_bytes, dtype=np.uint8)
+        # IMREAD_REDUCED_GRAYSCALE_4 makes libjpeg do the downscale during decode
+        gray = cv2.imdecode(buf, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if gray is None:
+            return None
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray.astype(np.float32)
+            return {"score": 0.0, "motion": False, "regions": [], "ts": ts}
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+        _, mask = cv2.threshold(diff, PIXEL_THRESHOLD, 255, cv2.THRESH_BINARY)
+        mask = cv2.dilate(mask, None, iterations=2)
+        cv2.accumulateWeighted(gray, self._background, BACKGROUND_RATE)
+
+        h, w = mask.shape
+        score = cv2.countNonZero(mask) / float(w * h)
+        regions: List[List[float]] = []
+        if score > 0:
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for c in contours:
+                x, y, bw, bh = cv2.boundingRect(c)
+                if bw * bh < MIN_REGION_AREA * w * h:
+                    continue
+                regions.append([round(x / w, 3), round(y / h, 3), round((x + bw) / w, 3), round((y + bh) / h, 3)])
+
+        motion = score >= self.threshold and bool(regions)
+        if motion:
+            self.last_motion_ts = ts
+        return {"score": round(score, 4), "motion": motion, "regions": regions, "ts": ts}
+
+    def seconds_since_motion(self, now: Optional[float] = None) -> float:
+        now = now if now is not None else time.time()
+        return now - self.last_motion_ts if self.last_motion_ts else float("inf")
+
+    def reset(self):
+        self._background = None
+
+
+def _benchmark(frames: int = 300):
+    import io
+    import resource
+    from PIL import Image, ImageDraw
+
+    jpegs = []
+    base = Image.radial_gradient("L").resize((640, 480)).convert("RGB")
+    for i in range(30):
+        img = base.copy()
+        x = i * 18
+        ImageDraw.Draw(img).rectangle([x, 120, x + 80, 400], fill=(200, 90, 60))
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=80)
+        jpegs.append(buf.getvalue())
+
+    detector = MotionDetector()
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    wall_start = time.perf_counter()
+    moving = 0
+    for i in range(frames):
+        result = detector.process(jpegs[i % len(jpegs)], ts=i / 15)
+        moving += bool(result and result["motion"])
+    wall = time.perf_counter() - wall_start
+    cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (cpu_end.ru_utime - cpu_start.ru_utime) + (cpu_end.ru_stime - cpu_start.ru_stime)
+
+    print(f"{frames} frames of 640x480 JPEG (decoded at 160x120)")
+    print(f"wall: {wall * 1000 / frames:.2f} ms/frame, CPU: {cpu * 1000 / frames:.2f} ms/frame "
+          f"({cpu * 1000 / frames * 15 / 10:.1f}% of one core at 15 fps)")
+    print(f"frames with motion: {moving}/{frames}")
+
+
+if __name__ == "__main__":
+    _benchmark()
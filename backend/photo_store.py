@@ -0,0 +1,233 @@
+"""
+Where photo files live on disk.
+
+Photos used to go straight into data/photos as <kind>-<camera>-<second>.jpg:
+two captures in the same second overwrote each other, and with tens of
+thousands of files in one folder every listing (and lookup, on FAT) on the
+SD card gets slow. Now they go into a folder per day, with a unique name:
+
+    photos/2026/10/18/detection-main-1792300000-3f9a1c2e.jpg
+    photos/thumbs/2026/10/18/detection-main-1792300000-3f9a1c2e.jpg
+
+The day (UTC) comes from the timestamp in the name, so the public URL stays
+/data/photos/<name> and finding the file needs no DB lookup. Files from
+before are still found in the flat folder, until they're migrated.
+
+PICAM_PHOTO_DEDUP=1: a frame with exactly the same content (sha256) as a
+photo we already have is hard-linked to it instead of written again - stored
+once, and no thumbnail to make. Each name is its own link, so deleting one
+photo leaves the other intact.
+
+Move the old flat files into day folders and fix up the paths in the DB:
+    python -m backend.photo_store migrate [--dry-run]
+Flat vs day folders with lots of files:
+    python -m backend.photo_store bench [--files 50000]
+"""
+
+import hashlib
+import os
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Tuple
+
+from . import database
+
+# The unix timestamp in a photo name: old "photo-1700000000.jpg" and new "...-1700000000-3f9a1c2e.jpg"
+_TS_IN_NAME = re.compile(r"-(\d{9,11})(?:-[0-9a-f]+)?\.jpg$")
+
+
+class PhotoStore:
+    def __init__(self, data_dir: Path, dedup: Optional[bool] = None):
+        self.root = Path(data_dir) / "photos"
+        self.thumbs_root = self.root / "thumbs"
+        self.dedup = os.environ.get("PICAM_PHOTO_DEDUP") == "1" if dedup is None else dedup
+
+    @staticmethod
+    def new_name(kind: str, camera_id: str, timestamp: float) -> str:
+        # The random part keeps two captures in the same second apart
+        return f"{kind}-{camera_id}-{int(timestamp)}-{secrets.token_hex(4)}.jpg"
+
+    @staticmethod
+    def shard(name: str) -> Optional[str]:
+        """"2026/10/18" for a name with a timestamp in it, None otherwise (stays flat)."""
+        m = _TS_IN_NAME.search(name)
+        if not m:
+            return None
+        return time.strftime("%Y/%m/%d", time.gmtime(int(m.group(1))))
+
+    def path_for(self, name: str) -> Path:
+        """Where a photo with this name goes."""
+        shard = self.shard(name)
+        return self.root / shard / name if shard else self.root / name
+
+    def thumb_path_for(self, name: str) -> Path:
+        shard = self.shard(name)
+        return self.thumbs_root / shard / name if shard else self.thumbs_root / name
+
+    def resolve(self, name: str) -> Optional[Path]:
+        """The photo file for a name: in its day folder, or flat if it's from before."""
+        for p in (self.path_for(name), self.root / name):
+            if p.is_file():
+                return p
+        return None
+
+    def resolve_thumb(self, name: str) -> Optional[Path]:
+        for p in (self.thumb_path_for(name), self.thumbs_root / name):
+            if p.is_file():
+                return p
+        return None
+
+    def save(self, name: str, frame: bytes,
+             make_thumb: Callable[[bytes], Optional[bytes]]) -> Tuple[Path, bool, Optional[str]]:
+        """
+        Store a JPEG and its thumbnail under `name`.
+        Returns (path, whether there's a thumbnail, content hash if deduplicating).
+        """
+        path = self.path_for(name)
+        thumb = self.thumb_path_for(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        thumb.parent.mkdir(parents=True, exist_ok=True)
+        digest = None
+        if self.dedup:
+            digest = hashlib.sha256(frame).hexdigest()
+            existing = database.find_photo_by_hash(digest)
+            src = self.resolve(Path(existing).name) if existing else None
+            if src is not None:
+                try:
+                    os.link(src, path)
+                    src_thumb = self.resolve_thumb(src.name)
+                    if src_thumb is not None:
+                        os.link(src_thumb, thumb)
+                        return path, True, digest
+                    return path, self._write_thumb(thumb, frame, make_thumb), digest
+                except OSError:
+                    # No hard links here (FAT), or the original just went away: write it out
+                    path.unlink(missing_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(frame)
+        return path, self._write_thumb(thumb, frame, make_thumb), digest
+
+    @staticmethod
+    def _write_thumb(thumb: Path, frame: bytes, make_thumb) -> bool:
+        try:
+            data = make_thumb(frame)
+        except Exception:
+            # if thumbnail generation fails, continue without it
+            data = None
+        if not data:
+            return False
+        with open(thumb, "wb") as fh:
+            fh.write(data)
+        return True
+
+    def remove(self, name: str):
+        """Delete a photo and its thumbnail, wherever they are."""
+        for p in (self.path_for(name), self.root / name, self.thumb_path_for(name), self.thumbs_root / name):
+            p.unlink(missing_ok=True)
+
+    def iter_files(self) -> Iterator[Path]:
+        """Every photo and thumbnail file: day folders and flat ones."""
+        for dirpath, _, filenames in os.walk(self.root):
+            for f in filenames:
+                if f.endswith(".jpg"):
+                    yield Path(dirpath) / f
+
+    def migrate(self, dry_run: bool = False) -> dict:
+        """
+        Move flat photos/thumbnails into day folders, then point the photos
+        table at where the files are now and events at the public URLs.
+        Safe to run again (or while the app runs: new photos already go to day folders).
+        """
+        moved = 0
+        for folder, target in ((self.root, self.path_for), (self.thumbs_root, self.thumb_path_for)):
+            if not folder.is_dir():
+                continue
+            with os.scandir(folder) as it:
+                names = [e.name for e in it if e.is_file() and e.name.endswith(".jpg")]
+            for name in names:
+                dst = target(name)
+                if dst.parent == folder:
+                    continue  # no timestamp in the name - stays where it is
+                if not dry_run:
+                    dst.parent.mkdir(parents=True, exist_ok=True)
+                    # Same filesystem, so this is a rename: no copying
+                    os.replace(folder / name, dst)
+                moved += 1
+        updates = []
+        for r in database.list_live_paths("photos"):
+            name = Path(r["path"]).name
+            now = self.path_for(name) if dry_run else self.resolve(name)
+            if now is not None and str(now) != r["path"]:
+                updates.append((r["id"], now))
+        events = 0
+        if not dry_run:
+            database.set_photo_paths(updates)
+            events = database.normalize_snapshot_paths()
+        return {"files_moved": moved, "rows_updated": len(updates), "events_updated": events, "dry_run": dry_run}
+
+
+def _bench(files: int = 50000):
+    """Create N photos flat and in day folders (~300/day), then time the operations the app does on them."""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PhotoStore(Path(tmp) / "sharded", dedup=False)
+        flat = Path(tmp) / "flat" / "photos"
+        flat.mkdir(parents=True)
+        t0 = 1_700_000_000
+        names = [store.new_name("detection", "main", t0 + i * 288) for i in range(files)]
+        frame = os.urandom(2000)
+
+        def timed(label, fn):
+            start = time.perf_counter()
+            n = fn()
+            elapsed = time.perf_counter() - start
+            return label, elapsed, n
+
+        results = {}
+        for layout, path_of, today in (
+            ("flat", lambda n: flat / n, flat),
+            ("day folders", store.path_for, store.path_for(names[-1]).parent),
+        ):
+            def create():
+                for n in names:
+                    p = path_of(n)
+                    p.parent.mkdir(parents=True, exist_ok=True)
+                    p.write_bytes(frame)
+                return len(names)
+
+            def lookup():
+                for n in names[::10]:
+                    path_of(n).stat()
+                return len(names[::10])
+
+            def list_today():
+                # e.g. a day's photos for the gallery / an export
+                return sum(1 for _ in os.scandir(today))
+
+            results[layout] = [timed("create", create), timed("stat", lookup), timed("list one day", list_today)]
+        print(f"{files} photos:")
+        for layout, rows in results.items():
+            print(f"  {layout:12s} " + "   ".join(
+                f"{label}: {elapsed * 1e6 / max(n, 1):7.1f} us/file ({n} files)" if label != "list one day"
+                else f"{label}: {elapsed * 1000:6.2f} ms ({n} entries)" for label, elapsed, n in rows))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("migrate", help="move flat photos into day folders and update the DB")
+    m.add_argument("--dry-run", action="store_true")
+    b = sub.add_parser("bench")
+    b.add_argument("--files", type=int, default=50000)
+    args = parser.parse_args()
+    if args.cmd == "migrate":
+        data_dir = database.DB_PATH.parent
+        print(f"[PhotoStore] Migrating {data_dir / 'photos'}")
+        print(f"[PhotoStore] {PhotoStore(data_dir).migrate(dry_run=args.dry_run)}")
+    else:
+        _bench(args.files)
@@ -0,0 +1,333 @@
+"""
+Offline benchmark of the whole camera pipeline - no Pi or IMX500 needed.
+Feeds a recording (or a generated synthetic one) through FileReplaySource
+and the real RPiCamStreaming, then times each stage on its own:
+
+  split      MJPEG byte stream -> frames (the reader thread, incl. dedup/motion)
+  detect     metadata JSON -> tensor parse -> tracker -> zones
+  broadcast  base64 + JSON encode of a frame message, per WebSocket client
+  capture    auto-capture photo: verify, write JPEG, thumbnail
+  encode     frames -> MP4 (skipped if ffmpeg isn't installed)
+
+Usage:
+    python -m backend.pipeline_bench                       # synthetic 20 s recording
+    python -m backend.pipeline_bench --mjpeg rec.mjpeg --metadata rec.json
+    python -m backend.pipeline_bench --generate /tmp/rec   # just write a synthetic recording
+"""
+
+import argparse
+import base64
+import io
+import json
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw
+
+
+def generate_recording(out_prefix: Path, seconds: int = 20, fps: int = 15) -> Tuple[Path, Path]:
+    """
+    Write a synthetic rec.mjpeg + rec.json pair: a static scene where a
+    "person" walks across for part of the time, with matching SSD tensors.
+    """
+    out_prefix = Path(out_prefix)
+    out_prefix.parent.mkdir(parents=True, exist_ok=True)
+    mjpeg_path = out_prefix.with_suffix(".mjpeg")
+    meta_path = out_prefix.with_suffix(".json")
+    base = Image.radial_gradient("L").resize((640, 480)).convert("RGB")
+    count = seconds * fps
+    with open(mjpeg_path, "wb") as mj, open(meta_path, "w") as meta:
+        meta.write("[\n")
+        for i in range(count):
+            img = base.copy()
+            tensor = [0.0] * 600
+            walking = count * 0.3 <= i < count * 0.7
+            if walking:
+                x = 0.05 + 0.7 * (i - count * 0.3) / (count * 0.4)
+                box = (x, 0.2, x + 0.2, 0.9)
+                ImageDraw.Draw(img).rectangle([box[0] * 640, box[1] * 480, box[2] * 640, box[3] * 480],
+                                              fill=(200, 90, 60))
+                tensor[0:4] = [box[1], box[0], box[3], box[2]]  # y1, x1, y2, x2
+                tensor[400] = 0.6
+                tensor[500] = 0.0
+                tensor[501] = 100.0
+            else:
+                tensor[500] = 100.0
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=80)
+            mj.write(buf.getvalue())
+            frame_meta = {"SensorTimestamp": int(i * 1e9 / fps), "CnnOutputTensor": tensor}
+            meta.write(json.dumps(frame_meta) + ",\n")
+        meta.write("]\n")
+    return mjpeg_path, meta_path
+
+
+def generate_h264_recording(out_prefix: Path, seconds: int = 20, fps: int = 15,
+                            width: int = 640, height: int = 480, gop: int = 30) -> Path:
+    """
+    Write an Annex B rec.h264 with a keyframe every `gop` frames: ffmpeg's
+    test pattern through libx264 if ffmpeg is installed, otherwise a
+    bit-exact but uncompressed stream written here (I_PCM keyframes of a
+    moving bar, P frames that skip every macroblock).
+    """
+    out_path = Path(out_prefix).with_suffix(".h264")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if shutil.which("ffmpeg"):
+        import subprocess
+        subprocess.run([
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size={width}x{height}:rate={fps}", "-t", str(seconds),
+            "-c:v", "libx264", "-g", str(gop), "-bf", "0", "-pix_fmt", "yuv420p", "-f", "h264", str(out_path),
+        ], check=True)
+        return out_path
+    out_path.write_bytes(_pcm_h264(seconds * fps, width, height, gop))
+    return out_path
+
+
+class _BitWriter:
+    def __init__(self):
+        self.out = bytearray()
+        self._acc = 0
+        self._n = 0
+
+    def u(self, n: int, value: int):
+        for i in range(n - 1, -1, -1):
+            self._acc = (self._acc << 1) | ((value >> i) & 1)
+            self._n += 1
+            if self._n == 8:
+                self.out.append(self._acc)
+                self._acc = self._n = 0
+
+    def ue(self, value: int):
+        value += 1
+        self.u(2 * value.bit_length() - 1, value)
+
+    def align(self):
+        if self._n:
+            self.u(8 - self._n, 0)
+
+    def raw(self, data: bytes):
+        self.out += data  # only when aligned
+
+    def trailing(self) -> bytes:
+        self.u(1, 1)
+        self.align()
+        return bytes(self.out)
+
+
+def _nal(header: int, rbsp: bytes) -> bytes:
+    """Start code + header + RBSP with emulation prevention bytes."""
+    out = bytearray([0, 0, 0, 1, header])
+    zeros = 0
+    for b in rbsp:
+        if zeros >= 2 and b <= 3:
+            out.append(3)
+            zeros = 0
+        out.append(b)
+        zeros = zeros + 1 if b == 0 else 0
+    return bytes(out)
+
+
+def _pcm_h264(frames: int, width: int, height: int, gop: int) -> bytes:
+    mbs_w, mbs_h = width // 16, height // 16
+    sps = _BitWriter()
+    sps.u(8, 66); sps.u(8, 0xC0); sps.u(8, 30)   # baseline, constrained, level 3.0
+    sps.ue(0); sps.ue(0); sps.ue(2); sps.ue(1)   # sps id, log2_max_frame_num-4, poc type 2, 1 ref
+    sps.u(1, 0); sps.ue(mbs_w - 1); sps.ue(mbs_h - 1)
+    sps.u(1, 1); sps.u(1, 1); sps.u(1, 0); sps.u(1, 0)  # frame_mbs_only, direct_8x8, no crop, no VUI
+    pps = _BitWriter()
+    pps.ue(0); pps.ue(0); pps.u(1, 0); pps.u(1, 0); pps.ue(0); pps.ue(0); pps.ue(0)
+    pps.u(1, 0); pps.u(2, 0); pps.ue(0); pps.ue(0); pps.ue(0)  # (se 0 == ue 0)
+    pps.u(1, 1); pps.u(1, 0); pps.u(1, 0)                       # deblocking control present
+    parameter_sets = _nal(0x67, sps.trailing()) + _nal(0x68, pps.trailing())
+    out = bytearray()
+    chroma = bytes([128]) * 128
+    for i in range(frames):
+        s = _BitWriter()
+        if i % gop == 0:
+            out += parameter_sets
+            s.ue(0); s.ue(7); s.ue(0); s.u(4, 0); s.ue((i // gop) % 2)  # I slice, frame_num 0, idr_pic_id
+            s.u(1, 0); s.u(1, 0); s.ue(0); s.ue(1)                      # ref marking, qp delta, no deblock
+            bar = (i // gop * 3) % mbs_w
+            for mb in range(mbs_w * mbs_h):
+                s.ue(25)  # I_PCM
+                s.align()
+                luma = 220 if mb % mbs_w in (bar, (bar + 1) % mbs_w) else 40 + 4 * (mb // mbs_w)
+                s.raw(bytes([min(luma, 235)]) * 256 + chroma)
+            out += _nal(0x65, s.trailing())
+        else:
+            s.ue(0); s.ue(5); s.ue(0); s.u(4, (i % gop) % 16)  # P slice, frame_num
+            s.u(1, 0); s.u(1, 0); s.u(1, 0); s.ue(0); s.ue(1)   # no overrides/reordering/marking, qp, no deblock
+            s.ue(mbs_w * mbs_h)                                  # skip every macroblock
+            out += _nal(0x41, s.trailing())
+    return bytes(out)
+
+
+def _stats(samples: List[float]) -> Dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+        "per_s": round(len(samples) / sum(samples), 1) if sum(samples) else None,
+    }
+
+
+def _timed(fn):
+    """Run fn() with tracemalloc on; returns (result, seconds, peak bytes)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_split(mjpeg: Path, metadata: Path) -> Dict:
+    from .frame_sources import FileReplaySource
+    from .rpicam_streaming import RPiCamStreaming
+
+    source = FileReplaySource(mjpeg, metadata, realtime=False)
+    with tempfile.TemporaryDirectory() as tmp:
+        streamer = RPiCamStreaming(source=source, metadata_file=str(Path(tmp) / "meta.json"))
+
+        def run():
+            streamer.start()
+            source.finished.wait()
+            # Let the reader drain the pipe
+            while streamer._stream_thread.is_alive():
+                time.sleep(0.01)
+            return streamer.get_buffer_stats()
+
+        stats, elapsed, peak = _timed(run)
+        streamer.stop()
+    return {
+        "frames": source.frame_count,
+        "fps": round(source.frame_count / elapsed, 1),
+        "ms_per_frame": round(elapsed * 1000 / source.frame_count, 3),
+        "buffer_frames": stats["frames"],
+        "buffer_bytes": stats["bytes"],
+        "peak_alloc_bytes": peak,
+    }
+
+
+def bench_detect(metadata: Path) -> Dict:
+    from .frame_sources import read_metadata_lines
+    from .rpicam_streaming import parse_person_detections
+    from .tracker import PersonTracker
+    from .zones import ZoneAnalyzer
+
+    lines = read_metadata_lines(metadata)
+    tracker = PersonTracker()
+    zones = ZoneAnalyzer.from_file()
+    json_t, parse_t, track_t = [], [], []
+
+    def run():
+        for i, line in enumerate(lines):
+            t0 = time.perf_counter()
+            frame_data = json.loads(line)
+            t1 = time.perf_counter()
+            detections = parse_person_detections(frame_data.get("CnnOutputTensor") or [])
+            t2 = time.perf_counter()
+            tracked, _ = tracker.update(detections, i / 15)
+            zones.process(tracked, i / 15)
+            t3 = time.perf_counter()
+            json_t.append(t1 - t0)
+            parse_t.append(t2 - t1)
+            track_t.append(t3 - t2)
+
+    _, _, peak = _timed(run)
+    return {"json": _stats(json_t), "parse": _stats(parse_t), "track+zones": _stats(track_t),
+            "peak_alloc_bytes": peak}
+
+
+def bench_broadcast(frames: List[bytes], clients: int) -> Dict:
+    samples = []
+
+    def run():
+        for frame in frames:
+            t0 = time.perf_counter()
+            b64 = base64.b64encode(frame).decode('ascii')
+            msg = {"type": "frame", "data": b64, "ts": int(time.time())}
+            # Starlette's send_json serializes once per client
+            for _ in range(clients):
+                json.dumps(msg)
+            samples.append(time.perf_counter() - t0)
+
+    _, _, peak = _timed(run)
+    return {"clients": clients, **_stats(samples), "peak_alloc_bytes": peak}
+
+
+def bench_capture(frames: List[bytes], count: int = 30) -> Dict:
+    samples = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        (tmp / "thumbs").mkdir()
+
+        def run():
+            for i, frame in enumerate(frames[:count]):
+                t0 = time.perf_counter()
+                Image.open(io.BytesIO(frame)).verify()
+                (tmp / f"{i}.jpg").write_bytes(frame)
+                img = Image.open(io.BytesIO(frame))
+                img.thumbnail((300, 200))
+                img.save(tmp / "thumbs" / f"{i}.jpg", format="JPEG", quality=75)
+                samples.append(time.perf_counter() - t0)
+
+        _, _, peak = _timed(run)
+    return {**_stats(samples), "peak_alloc_bytes": peak}
+
+
+def bench_encode(frames: List[bytes], fps: int = 15) -> Dict:
+    from . import video_utils
+
+    if not shutil.which("ffmpeg"):
+        return {"skipped": "ffmpeg not installed"}
+    timed_frames = [(i / fps, f) for i, f in enumerate(frames)]
+    with tempfile.TemporaryDirectory() as tmp:
+        meta, elapsed, peak = _timed(lambda: video_utils.frames_to_mp4(timed_frames, Path(tmp) / "out.mp4", fps))
+    return {"frames": len(frames), "seconds": round(elapsed, 2),
+            "x_realtime": round(meta["duration"] / elapsed, 1), "peak_alloc_bytes": peak}
+
+
+def run_all(mjpeg: Path, metadata: Path, clients: int = 4) -> Dict:
+    from .frame_sources import split_mjpeg
+
+    frames = split_mjpeg(Path(mjpeg).read_bytes())
+    results = {
+        "split": bench_split(mjpeg, metadata),
+        "detect": bench_detect(metadata),
+        "broadcast": bench_broadcast(frames, clients),
+        "capture": bench_capture(frames),
+        "encode": bench_encode(frames),
+    }
+    # ru_maxrss is KiB on Linux
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the camera pipeline offline")
+    parser.add_argument("--mjpeg", help="recorded MJPEG stream")
+    parser.add_argument("--metadata", help="matching rpicam-vid metadata JSON")
+    parser.add_argument("--clients", type=int, default=4, help="simulated WebSocket clients")
+    parser.add_argument("--generate", metavar="PREFIX", help="only write a synthetic recording to PREFIX.mjpeg/.json")
+    args = parser.parse_args()
+
+    if args.generate:
+        print(generate_recording(Path(args.generate)))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            if args.mjpeg:
+                mjpeg, metadata = Path(args.mjpeg), Path(args.metadata)
+            else:
+                mjpeg, metadata = generate_recording(Path(tmp) / "synthetic")
+            print(json.dumps(run_all(mjpeg, metadata, args.clients), indent=2))
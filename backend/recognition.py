@@ -0,0 +1,526 @@
+"""
+Known-person matching against the enrollments.
+
+The people in the enrollments table each have a few images
+(data/enrollments/<id>/*.jpg). An embedder turns each image into a vector;
+the vectors live in one float32 matrix on disk, memory-mapped, next to a
+small JSON id map:
+
+    data/enrollments/index.json          model, dim, which row is which image/person
+    data/enrollments/embeddings-3.f32    rows x dim float32, each row L2-normalised
+
+When a person track starts, their crop from the frame is embedded once and
+compared with every row in one matrix product (cosine similarity, since the
+rows are normalised). The best row above the threshold names the person. The
+result is kept per track, so zone and tripwire events for the same person
+don't embed again.
+
+The embedder is pluggable and runs on the CPU:
+    PICAM_EMBEDDER=/path/model.onnx        any ONNX model image -> vector (OpenCV DNN),
+                                           PICAM_EMBEDDER_SIZE=128x256 input (w x h),
+                                           e.g. a person re-identification model
+    PICAM_EMBEDDER=package.module:Class    your own Embedder subclass
+    PICAM_EMBEDDER=stub                    StubEmbedder: no model, for trying it out
+Unset (the default): no recognition, every person gets the same alert as before.
+PICAM_RECOGNITION_THRESHOLD=0.6 is the cosine similarity needed for a match.
+
+The index follows the enrollments table by itself (checked every 10 s), and
+is rebuilt when the model changes. By hand:
+    python -m backend.recognition sync
+Search latency with 1k-100k synthetic embeddings, and the stub end to end:
+    python -m backend.recognition bench [--dim 512]
+    python -m backend.recognition demo
+tests/test_recognition.py checks enrolling, matching and the index file with the stub.
+"""
+
+import importlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import database
+from . import metrics
+
+RECOGNITION_SECONDS = metrics.histogram("recognition_seconds", "Time to embed a person crop / search the enrollments",
+                                        ("stage",), buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+RECOGNITION_RESULTS = metrics.counter("recognition_results_total", "Person tracks looked up in the enrollments", ("result",))
+
+
+class Embedder:
+    """
+    Turns image crops (BGR uint8 arrays, any size) into one vector each.
+    `name` is stored with the index: vectors from a different model don't
+    compare, so a new name means everything is embedded again.
+    """
+    name = "embedder"
+    dim = 0
+
+    def embed(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class OnnxEmbedder(Embedder):
+    """An ONNX model image -> vector, run on the CPU with OpenCV's DNN module (no extra dependency)."""
+
+    def __init__(self, path: str, size: Tuple[int, int] = (128, 256),
+                 mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)):
+        import cv2
+
+        self.net = cv2.dnn.readNetFromONNX(str(path))
+        self.size = size
+        self.mean = np.array(mean, dtype=np.float32)
+        self.std = np.array(std, dtype=np.float32)
+        st = os.stat(path)
+        self.name = f"onnx:{Path(path).name}:{st.st_size}:{int(st.st_mtime)}"
+        self.dim = int(self.embed([np.zeros((size[1], size[0], 3), dtype=np.uint8)]).shape[1])
+
+    def embed(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        import cv2
+
+        batch = []
+        for crop in crops:
+            # BGR -> RGB, ImageNet normalisation, like most torchvision-trained models expect
+            img = cv2.resize(crop, self.size)[:, :, ::-1].astype(np.float32) / 255.0
+            batch.append((img - self.mean) / self.std)
+        self.net.setInput(np.ascontiguousarray(np.stack(batch).transpose(0, 3, 1, 2)))
+        return self.net.forward().reshape(len(batch), -1).astype(np.float32)
+
+
+class StubEmbedder(Embedder):
+    """
+    No model: a fixed random projection of a 16x16 grayscale thumbnail. The
+    same picture gives the same vector and similar pictures similar ones,
+    which is enough to try out enrolling and matching - it does NOT tell
+    people apart in real life.
+    """
+    name = "stub"
+
+    def __init__(self, dim: int = 128, seed: int = 0):
+        self.dim = dim
+        self._proj = np.random.default_rng(seed).standard_normal((16 * 16, dim)).astype(np.float32)
+
+    def embed(self, crops: Sequence[np.ndarray]) -> np.ndarray:
+        import cv2
+
+        rows = []
+        for crop in crops:
+            gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+            rows.append(cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32).ravel())
+        x = np.stack(rows)
+        # Centred, so brightness alone doesn't make everything look alike
+        x -= x.mean(axis=1, keepdims=True)
+        return x @ self._proj
+
+
+def load_embedder(spec: str) -> Embedder:
+    """PICAM_EMBEDDER -> an Embedder (see the top of this file)."""
+    if spec == "stub":
+        return StubEmbedder()
+    if spec.endswith(".onnx"):
+        w, h = (int(v) for v in os.environ.get("PICAM_EMBEDDER_SIZE", "128x256").lower().split("x"))
+        return OnnxEmbedder(spec, size=(w, h))
+    module, _, cls = spec.partition(":")
+    if not cls:
+        raise ValueError(f"PICAM_EMBEDDER={spec!r}: expected stub, a .onnx file or package.module:Class")
+    return getattr(importlib.import_module(module), cls)()
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    x = np.atleast_2d(np.asarray(x, dtype=np.float32))
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+class EmbeddingIndex:
+    """
+    The enrollment embeddings: a float32 matrix file, memory-mapped, and
+    index.json saying which image and person each row is.
+
+    Adding appends rows to the file and then rewrites index.json (rows past
+    the count in index.json are ignored, so a crash in between just loses the
+    new rows). Removing writes a new embeddings-<n>.f32 and switches
+    index.json over to it; searches still running keep the old mapping.
+    Other processes pick up changes on reload() (index.json's mtime).
+    """
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self.meta_path = self.root / "index.json"
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.model: Optional[str] = None
+        self.dim = 0
+        self.file: Optional[str] = None
+        self.generation = 0
+        self.image_ids = np.zeros(0, dtype=np.int64)
+        self.enrollment_ids = np.zeros(0, dtype=np.int64)
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.reload()
+
+    def __len__(self) -> int:
+        return len(self.image_ids)
+
+    def reload(self):
+        """Map the matrix again if index.json changed (cheap when it didn't: one stat)."""
+        try:
+            mtime = self.meta_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        meta = json.loads(self.meta_path.read_text())
+        count = len(meta["image_ids"])
+        matrix = np.zeros((0, meta["dim"]), dtype=np.float32)
+        if count:
+            matrix = np.memmap(self.root / meta["file"], dtype=np.float32, mode="r", shape=(count, meta["dim"]))
+        with self._lock:
+            self.model, self.dim, self.file = meta["model"], meta["dim"], meta["file"]
+            self.generation = meta.get("generation", 0)
+            self.image_ids = np.array(meta["image_ids"], dtype=np.int64)
+            self.enrollment_ids = np.array(meta["enrollment_ids"], dtype=np.int64)
+            self.matrix = matrix
+            self._mtime = mtime
+
+    def reset(self, model: str, dim: int):
+        """Start over, empty, for another model."""
+        self._write(model, dim, np.zeros((0, dim), dtype=np.float32), [], [], new_file=True)
+
+    def add(self, image_ids: Sequence[int], enrollment_ids: Sequence[int], vectors: np.ndarray):
+        vectors = _normalize(vectors)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding has {vectors.shape[1]} dims, the index {self.dim}")
+        with open(self.root / self.file, "r+b" if (self.root / self.file).exists() else "wb") as fh:
+            # After the rows index.json knows about (anything past that is from an interrupted add)
+            fh.seek(len(self) * self.dim * 4)
+            fh.write(vectors.tobytes())
+            fh.truncate()
+        self._write_meta(self.model, self.dim, self.file,
+                         self.image_ids.tolist() + [int(i) for i in image_ids],
+                         self.enrollment_ids.tolist() + [int(i) for i in enrollment_ids])
+
+    def remove(self, image_ids: Sequence[int]):
+        drop = np.isin(self.image_ids, np.asarray(list(image_ids), dtype=np.int64))
+        if not drop.any():
+            return
+        keep = ~drop
+        self._write(self.model, self.dim, np.asarray(self.matrix[keep]),
+                    self.image_ids[keep].tolist(), self.enrollment_ids[keep].tolist(), new_file=True)
+
+    def _write(self, model, dim, matrix, image_ids, enrollment_ids, new_file: bool):
+        self.root.mkdir(parents=True, exist_ok=True)
+        old = self.file
+        name = f"embeddings-{self.generation + 1}.f32" if new_file else self.file
+        tmp = self.root / (name + ".tmp")
+        tmp.write_bytes(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+        os.replace(tmp, self.root / name)
+        self._write_meta(model, dim, name, image_ids, enrollment_ids, generation=self.generation + 1)
+        if old and old != name:
+            (self.root / old).unlink(missing_ok=True)
+
+    def _write_meta(self, model, dim, file, image_ids, enrollment_ids, generation=None):
+        meta = {"model": model, "dim": dim, "file": file,
+                "generation": self.generation if generation is None else generation,
+                "image_ids": list(image_ids), "enrollment_ids": list(enrollment_ids)}
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self.meta_path)
+        self._mtime = None
+        self.reload()
+
+    def search(self, queries: np.ndarray, k: int = 5) -> List[List[Tuple[int, int, float]]]:
+        """
+        The k most similar rows for each query vector, best first, as
+        (enrollment_id, image_id, cosine similarity).
+        """
+        q = _normalize(queries)
+        with self._lock:
+            matrix, enrollment_ids, image_ids = self.matrix, self.enrollment_ids, self.image_ids
+        n = len(image_ids)
+        if n == 0:
+            return [[] for _ in range(len(q))]
+        # (Q, N) in one BLAS call, straight from the mapped file
+        scores = q @ matrix.T
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [[(int(enrollment_ids[j]), int(image_ids[j]), float(s)) for j, s in zip(row, row_scores)]
+                for row, row_scores in zip(top, top_scores)]
+
+
+def crop_jpeg(frame: bytes, bbox: Sequence[float], margin: float = 0.0) -> Optional[np.ndarray]:
+    """The part of a JPEG inside a normalised [x1, y1, x2, y2] box (+ margin on each side), as BGR."""
+    import cv2
+
+    img = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    x1, y1, x2, y2 = bbox
+    mx, my = (x2 - x1) * margin, (y2 - y1) * margin
+    left, right = int(max(0.0, x1 - mx) * w), int(min(1.0, x2 + mx) * w)
+    top, bottom = int(max(0.0, y1 - my) * h), int(min(1.0, y2 + my) * h)
+    if right - left < 16 or bottom - top < 16:
+        return None
+    return img[top:bottom, left:right]
+
+
+class Recognizer:
+    """
+    Names person tracks from the enrollments. identify() is blocking (decode +
+    embed + search): run it on the scheduler's "recognition" pool.
+    """
+
+    def __init__(self, spec: str, root: Path, threshold: float = 0.6, k: int = 5,
+                 cache_size: int = 256, track_ttl: float = 600.0):
+        self.spec = spec
+        self.root = Path(root)
+        self.threshold = threshold
+        self.k = k
+        self.embedder: Optional[Embedder] = None
+        self.index = EmbeddingIndex(self.root)
+        self.names: Dict[int, str] = {}
+        # (camera, track id) -> (when, result): each person is embedded once per track
+        self._tracks: "OrderedDict[Tuple[str, int], Tuple[float, Optional[Dict]]]" = OrderedDict()
+        self.cache_size = cache_size
+        # Track ids start over when the streamer does: don't trust an old entry forever
+        self.track_ttl = track_ttl
+        self._lock = threading.Lock()
+        self._synced_at = 0.0
+        self.counts = {"embedded": 0, "cache_hits": 0, "matched": 0}
+
+    @classmethod
+    def from_env(cls, root: Path) -> Optional["Recognizer"]:
+        """None unless PICAM_EMBEDDER is set. Cheap: the model is loaded by load()."""
+        spec = os.environ.get("PICAM_EMBEDDER")
+        if not spec:
+            return None
+        return cls(spec, root, threshold=float(os.environ.get("PICAM_RECOGNITION_THRESHOLD", "0.6")))
+
+    @property
+    def ready(self) -> bool:
+        return self.embedder is not None
+
+    def load(self, embedder: Optional[Embedder] = None):
+        """Load the model and bring the index up to date (blocking: model load + embedding new images)."""
+        self.embedder = embedder or load_embedder(self.spec)
+        print(f"[Recognition] Embedder {self.embedder.name} ({self.embedder.dim} dims)")
+        print(f"[Recognition] {self.sync()}")
+
+    def sync(self) -> Dict:
+        """Embed enrollment images the index doesn't have yet and drop the ones that are gone."""
+        with self._lock:
+            self._synced_at = time.monotonic()
+            self.index.reload()
+            if self.index.model != self.embedder.name or self.index.dim != self.embedder.dim:
+                if len(self.index):
+                    print(f"[Recognition] Model changed ({self.index.model} -> {self.embedder.name}), embedding everything again")
+                self.index.reset(self.embedder.name, self.embedder.dim)
+            rows = database.list_enrollment_images()
+            self.names = {r["id"]: r["name"] for r in database.list_enrollments()}
+            wanted = {r["id"]: r for r in rows}
+            have = set(self.index.image_ids.tolist())
+            gone = have - wanted.keys()
+            if gone:
+                self.index.remove(gone)
+            added, failed = 0, 0
+            new = [r for i, r in wanted.items() if i not in have]
+            for start in range(0, len(new), 16):
+                batch, crops = [], []
+                for r in new[start:start + 16]:
+                    img = _read_image(r["path"])
+                    if img is None:
+                        failed += 1
+                        continue
+                    batch.append(r)
+                    crops.append(img)
+                if crops:
+                    self.index.add([r["id"] for r in batch], [r["enrollment_id"] for r in batch],
+                                   self.embedder.embed(crops))
+                    added += len(crops)
+            if gone or added:
+                # Someone's images changed: look again at the people in view
+                self._tracks.clear()
+            return {"people": len(self.names), "embeddings": len(self.index), "added": added,
+                    "removed": len(gone), "unreadable": failed}
+
+    def identify(self, camera_id: str, track_id: int, frame: bytes, bbox: Sequence[float]) -> Optional[Dict]:
+        """
+        {"enrollment_id", "name", "score"} for the person in `bbox`, or None if
+        it's nobody we know. Embeds only the first time for each track.
+        """
+        if not self.ready:
+            return None
+        cached = self.known(camera_id, track_id)
+        if cached is not False:
+            self.counts["cache_hits"] += 1
+            return cached
+        if time.monotonic() - self._synced_at > 10:
+            self.sync()
+        result = None
+        crop = crop_jpeg(frame, bbox)
+        if crop is not None and len(self.index):
+            with self._lock:
+                with RECOGNITION_SECONDS.time(stage="embed"):
+                    vector = self.embedder.embed([crop])
+                self.counts["embedded"] += 1
+            with RECOGNITION_SECONDS.time(stage="search"):
+                hits = self.index.search(vector, self.k)[0]
+            if hits and hits[0][2] >= self.threshold:
+                enrollment_id, _, score = hits[0]
+                result = {"enrollment_id": enrollment_id, "name": self.names.get(enrollment_id),
+                          "score": round(score, 3)}
+                self.counts["matched"] += 1
+        RECOGNITION_RESULTS.inc(result="known" if result else ("unknown" if crop is not None else "no_crop"))
+        with self._lock:
+            self._tracks[(camera_id, track_id)] = (time.monotonic(), result)
+            while len(self._tracks) > self.cache_size:
+                self._tracks.popitem(last=False)
+        return result
+
+    def known(self, camera_id: str, track_id: int):
+        """What identify() found for this track: the match, None (nobody we know), or False if not asked yet."""
+        with self._lock:
+            entry = self._tracks.get((camera_id, track_id))
+            if entry is None or time.monotonic() - entry[0] > self.track_ttl:
+                return False
+            self._tracks.move_to_end((camera_id, track_id))
+            return entry[1]
+
+    def forget(self, camera_id: str, track_id: int):
+        """The track ended."""
+        with self._lock:
+            self._tracks.pop((camera_id, track_id), None)
+
+    def stats(self) -> Dict:
+        return {"embedder": self.embedder.name if self.embedder else None, "people": len(self.names),
+                "embeddings": len(self.index), "threshold": self.threshold, "tracks_cached": len(self._tracks),
+                **self.counts, "latency": {"embed": RECOGNITION_SECONDS.summary(stage="embed"),
+                                           "search": RECOGNITION_SECONDS.summary(stage="search")}}
+
+
+def _read_image(path: str) -> Optional[np.ndarray]:
+    import cv2
+
+    try:
+        return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except (OSError, ValueError):
+        return None
+
+
+def _bench(dim: int = 512, sizes=(1000, 10000, 100000), queries: int = 200):
+    """Search latency over synthetic unit vectors: one query (a track starting), and a batch of 16."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    print(f"{dim}-dim float32 embeddings, top-5 cosine search:")
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = EmbeddingIndex(Path(tmp))
+            index.reset("synthetic", dim)
+            start = time.perf_counter()
+            for lo in range(0, n, 10000):
+                count = min(10000, n - lo)
+                index.add(range(lo, lo + count), rng.integers(0, max(n // 5, 1), count),
+                          rng.standard_normal((count, dim), dtype=np.float32))
+            build = time.perf_counter() - start
+            # Queries near a known row, so the answer can be checked
+            targets = rng.integers(0, n, queries)
+            q = np.asarray(index.matrix[targets]) + 0.05 * rng.standard_normal((queries, dim), dtype=np.float32)
+            index.search(q[:1])
+            times = []
+            correct = 0
+            for i in range(queries):
+                t0 = time.perf_counter()
+                hits = index.search(q[i])
+                times.append(time.perf_counter() - t0)
+                correct += hits[0][0][1] == targets[i]
+            t0 = time.perf_counter()
+            for i in range(0, queries, 16):
+                index.search(q[i:i + 16])
+            batched = (time.perf_counter() - t0) / queries
+            times.sort()
+            mb = n * dim * 4 / 1e6
+            print(f"  {n:>7} ({mb:6.1f} MB): p50 {times[len(times) // 2] * 1000:7.2f} ms  "
+                  f"p99 {times[int(len(times) * 0.99)] * 1000:7.2f} ms  batched {batched * 1000:6.2f} ms/query  "
+                  f"top-1 correct {correct}/{queries}  (built in {build:.2f} s)")
+            if n <= 10000:
+                # The same search one row at a time, as a plain loop would
+                t0 = time.perf_counter()
+                rows = np.asarray(index.matrix)
+                qn = _normalize(q[0])[0]
+                best = max(range(n), key=lambda j: float(np.dot(rows[j], qn)))
+                loop = time.perf_counter() - t0
+                print(f"  {'':>7} {'':>11}  row-by-row loop: {loop * 1000:7.2f} ms (best {best == targets[0]})")
+
+
+def _demo():
+    """Enroll three synthetic 'people' with the stub embedder, then identify tracks in synthetic frames."""
+    import tempfile
+
+    import cv2
+
+    rng = np.random.default_rng(1)
+
+    def person(seed):
+        # A blocky pattern per person, so the stub's thumbnails differ
+        blocks = np.random.default_rng(seed).integers(0, 255, (8, 4, 3), dtype=np.uint8)
+        return cv2.resize(blocks, (96, 192), interpolation=cv2.INTER_NEAREST)
+
+    def frame_with(img):
+        frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+        noisy = np.clip(img.astype(np.int16) + rng.integers(-12, 12, img.shape), 0, 255).astype(np.uint8)
+        frame[200:392, 300:396] = noisy
+        return cv2.imencode(".jpg", frame)[1].tobytes()
+
+    bbox = [300 / 640, 200 / 480, 396 / 640, 392 / 480]
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = Path(tmp) / "database.db"
+        root = Path(tmp) / "enrollments"
+        for name, seed in (("alice", 1), ("bob", 2), ("carol", 3)):
+            eid = database.add_enrollment(name)
+            (root / str(eid)).mkdir(parents=True)
+            for i in range(2):
+                path = root / str(eid) / f"{i}.jpg"
+                cv2.imwrite(str(path), person(seed))
+                database.add_enrollment_image(eid, path)
+        recognizer = Recognizer("stub", root, threshold=0.8)
+        recognizer.load()
+        for track_id, (label, img) in enumerate((("alice", person(1)), ("bob", person(2)),
+                                                 ("stranger", person(99)), ("alice again", person(1))), 1):
+            frame = frame_with(img)
+            found = recognizer.identify("main", track_id, frame, bbox)
+            # The same track over the next frames: from the cache
+            for _ in range(10):
+                recognizer.identify("main", track_id, frame_with(img), bbox)
+            print(f"  track {track_id} ({label}): {found}")
+        print(f"  {recognizer.stats()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("sync", help="embed new enrollment images for PICAM_EMBEDDER, drop removed ones")
+    b = sub.add_parser("bench")
+    b.add_argument("--dim", type=int, default=512)
+    b.add_argument("--sizes", default="1000,10000,100000")
+    sub.add_parser("demo")
+    args = parser.parse_args()
+    if args.cmd == "sync":
+        recognizer = Recognizer.from_env(database.DB_PATH.parent / "enrollments")
+        if recognizer is None:
+            raise SystemExit("Set PICAM_EMBEDDER first (see backend/recognition.py)")
+        recognizer.load()
+    elif args.cmd == "bench":
+        _bench(args.dim, tuple(int(s) for s in args.sizes.split(",")))
+    else:
+        _demo()
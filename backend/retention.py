@@ -0,0 +1,202 @@
+"""
+Storage retention: keeps photos, replays and events from filling the SD card.
+Each data class has its own limits (max bytes, max age, max count). A
+low-priority background thread checks the running usage totals in SQLite and
+marks the oldest rows as deleted when a limit is hit; the storage GC then
+removes the files.
+"""
+
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from . import database
+from .photo_store import PhotoStore
+
+
+class RetentionPolicy:
+    """Limits for one data class. None means "no limit"."""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_age_days: Optional[float] = None,
+                 max_count: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.max_count = max_count
+
+    def to_dict(self) -> dict:
+        return {"max_bytes": self.max_bytes, "max_age_days": self.max_age_days, "max_count": self.max_count}
+
+
+GB = 1024 ** 3
+
+# Defaults sized for a 32 GB SD card. Replays keep the old "newest 100" rule.
+DEFAULT_POLICIES = {
+    "photos": RetentionPolicy(max_bytes=4 * GB, max_age_days=30, max_count=20000),
+    "replays": RetentionPolicy(max_bytes=8 * GB, max_age_days=30, max_count=100),
+    "events": RetentionPolicy(max_age_days=90, max_count=100000),
+}
+
+
+class RetentionManager:
+    """
+    Enforces the policies on a background thread.
+    `on_freed` is called (from that thread) after rows were marked deleted,
+    main.py uses it to wake the storage GC.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        policies: Optional[Dict[str, RetentionPolicy]] = None,
+        min_free_bytes: int = 512 * 1024 ** 2,
+        interval: float = 300.0,
+    ):
+        self.data_dir = Path(data_dir)
+        self.policies = policies or DEFAULT_POLICIES
+        # Last line of defence: if the card is this close to full, drop the oldest media
+        self.min_free_bytes = min_free_bytes
+        self.interval = interval
+
+        self.on_freed: Optional[Callable[[], None]] = None
+        self.last_run: Optional[float] = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_freed: Optional[Callable[[], None]] = None):
+        if self._running:
+            return
+        self.on_freed = on_freed
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="Retention")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+
+    def request_check(self):
+        """Check limits now (e.g. right after a new replay was saved)."""
+        self._wake.set()
+
+    def _run(self):
+        # Linux threads are scheduled on their own, so this only lowers *our* priority
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        print("[Retention] Started")
+        while self._running:
+            try:
+                self._backfill_photo_sizes()
+                self.enforce()
+            except Exception as e:
+                print(f"[Retention] Error: {e}")
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+        print("[Retention] Stopped")
+
+    def _backfill_photo_sizes(self):
+        """Photos from before size tracking get their size filled in (one-time)."""
+        store = PhotoStore(self.data_dir)
+        while True:
+            rows = database.photos_missing_size(500)
+            if not rows:
+                return
+            sizes = []
+            for r in rows:
+                name = Path(r["path"]).name
+                size = 0
+                for p in (store.resolve(name), store.resolve_thumb(name)):
+                    if p is None:
+                        continue
+                    try:
+                        size += p.stat().st_size
+                    except OSError:
+                        pass
+                sizes.append((r["id"], size))
+            database.set_photo_sizes(sizes)
+
+    def enforce(self) -> dict:
+        """Apply every policy once. Returns how many rows were marked per class."""
+        now = time.time()
+        usage = database.get_storage_usage()
+        marked = {"photos": 0, "replays": 0, "events": 0}
+
+        for kind in ("photos", "replays"):
+            policy = self.policies.get(kind)
+            if not policy:
+                continue
+            if policy.max_age_days is not None:
+                marked[kind] += database.tombstone_older_than(kind, now - policy.max_age_days * 86400)
+            usage = database.get_storage_usage()
+            live = usage.get(kind, {"bytes": 0, "count": 0})
+            if policy.max_count is not None and live["count"] > policy.max_count:
+                rows, _ = database.tombstone_oldest(kind, count=live["count"] - policy.max_count)
+                marked[kind] += rows
+                live = database.get_storage_usage().get(kind, live)
+            if policy.max_bytes is not None and live["bytes"] > policy.max_bytes:
+                rows, _ = database.tombstone_oldest(kind, free_bytes=live["bytes"] - policy.max_bytes)
+                marked[kind] += rows
+
+        events = self.policies.get("events")
+        if events:
+            if events.max_age_days is not None:
+                marked["events"] += database.delete_events_older_than(now - events.max_age_days * 86400)
+            count = database.get_storage_usage().get("events", {"count": 0})["count"]
+            if events.max_count is not None and count > events.max_count:
+                marked["events"] += database.delete_oldest_events(count - events.max_count)
+
+        marked_media = marked["photos"] + marked["replays"]
+        marked_media += self._enforce_free_space()
+
+        self.last_run = now
+        if any(marked.values()):
+            print(f"[Retention] Marked for deletion: {marked}")
+        if marked_media and self.on_freed:
+            self.on_freed()
+        return marked
+
+    def _enforce_free_space(self) -> int:
+        """If the disk is nearly full, drop the oldest replays first (biggest), then photos."""
+        try:
+            free = shutil.disk_usage(self.data_dir).free
+        except OSError:
+            return 0
+        # What's already marked frees up once the GC gets to it - a check right
+        # after the last one (request_check after each replay) shouldn't mark it all again
+        pending = sum(database.tombstoned_bytes(table) for table in database.GC_TABLES)
+        shortfall = self.min_free_bytes - free - pending
+        if shortfall <= 0:
+            return 0
+        print(f"[Retention] Low disk space ({free // 1024 ** 2} MB free, "
+              f"{pending // 1024 ** 2} MB waiting for the GC), removing oldest media")
+        rows, freed = database.tombstone_oldest("replays", free_bytes=shortfall)
+        if freed < shortfall:
+            more, _ = database.tombstone_oldest("photos", free_bytes=shortfall - freed)
+            rows += more
+        return rows
+
+    def usage_report(self) -> dict:
+        """Usage + limits per data class, for the API."""
+        usage = database.get_storage_usage()
+        report = {}
+        for kind in ("photos", "replays", "events"):
+            policy = self.policies.get(kind)
+            report[kind] = {
+                **usage.get(kind, {"bytes": 0, "count": 0}),
+                "policy": policy.to_dict() if policy else None,
+            }
+        try:
+            disk = shutil.disk_usage(self.data_dir)
+            report["disk"] = {"total": disk.total, "used": disk.used, "free": disk.free,
+                              "min_free": self.min_free_bytes}
+        except OSError:
+            report["disk"] = None
+        report["last_run"] = self.last_run
+        return report
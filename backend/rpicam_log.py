@@ -0,0 +1,157 @@
+"""
+Parses rpicam-vid's stderr into something we can look at.
+rpicam-vid (and libcamera under it) log a line per frame plus warnings to
+stderr. RPiCamVidSource drains that pipe on a thread and feeds each line
+through RPiCamLogParser, which:
+  - pulls the real frame rate out of the per-frame "#123 (14.98 fps) exp ..." lines
+  - counts libcamera warnings/errors, and dropped/late frames (dequeue
+    timeouts, "dropped" messages, and gaps in the frame counter)
+  - follows the IMX500 network firmware upload ("Network Firmware Upload: 45%")
+  - keeps the last few hundred lines for /api/camera/log
+
+Example lines it understands:
+    #1234 (15.01 fps) exp 33251.00 ag 8.00 dg 1.00
+    [0:00:12.345678901] [1234]  WARN V4L2 v4l2_videodevice.cpp:2095 /dev/video0[13:cap]: Dequeue timer of 1000000.00us has expired!
+    NOTICE: Loading network firmware onto the IMX500 can take several minutes.
+    Network Firmware Upload: 100%
+    ERROR: *** no cameras available ***
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from . import metrics
+
+FRAME_RE = re.compile(r"^#(\d+)\s+\((\d+(?:\.\d+)?)\s*fps\)")
+# libcamera log lines: [uptime] [pid] LEVEL Category file:line message
+LIBCAMERA_RE = re.compile(r"^\[[\d:.]+\]\s+\[\d+\]\s+(DEBUG|INFO|WARN|ERROR|FATAL)\s+(\S+)\s+(.*)$")
+UPLOAD_RE = re.compile(r"Network Firmware Upload:\s*(\d+)%")
+DROP_RE = re.compile(r"drop|Dequeue timer .* expired", re.IGNORECASE)
+
+STDERR_LINES = metrics.counter("rpicam_log_lines_total", "rpicam-vid stderr lines by level", ("level",))
+DROPPED_FRAMES = metrics.counter("rpicam_dropped_frames_total",
+                                 "Frames rpicam-vid/libcamera reported dropped or late, plus frame counter gaps")
+
+_LEVELS = {"DEBUG": "debug", "INFO": "info", "WARN": "warn", "WARNING": "warn", "ERROR": "error", "FATAL": "error"}
+
+
+class RPiCamLogParser:
+    def __init__(self, max_lines: int = 300):
+        self._lines: deque = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self.fps: Optional[float] = None
+        self.last_frame_number: Optional[int] = None
+        self.frames_logged = 0
+        self.dropped_frames = 0
+        self.warnings = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        # IMX500 network: unknown -> uploading -> loaded (or error)
+        self.network_state = "unknown"
+        self.network_upload_percent: Optional[int] = None
+        self.last_line_at: Optional[float] = None
+
+    def new_run(self):
+        """rpicam-vid was (re)started: its frame counter and network state start over."""
+        self.last_frame_number = None
+        self.fps = None
+        self.network_state = "unknown"
+        self.network_upload_percent = None
+
+    def feed(self, line: str):
+        line = line.strip()
+        if not line:
+            return
+        now = time.time()
+        self.last_line_at = now
+
+        m = FRAME_RE.match(line)
+        if m:
+            # One of these per frame - too many to keep in the ring, just take the numbers
+            number, fps = int(m.group(1)), float(m.group(2))
+            if self.last_frame_number is not None and number > self.last_frame_number + 1:
+                gap = number - self.last_frame_number - 1
+                self.dropped_frames += gap
+                DROPPED_FRAMES.inc(gap)
+            self.last_frame_number = number
+            self.fps = fps
+            self.frames_logged += 1
+            if self.network_state == "uploading":
+                # Frames flowing again after the upload means the network is running
+                self.network_state = "loaded"
+            return
+
+        level = "info"
+        lc = LIBCAMERA_RE.match(line)
+        if lc:
+            level = _LEVELS[lc.group(1)]
+        elif line.startswith(("ERROR", "FATAL")) or "***" in line:
+            level = "error"
+        elif line.startswith(("WARN", "WARNING")):
+            level = "warn"
+
+        up = UPLOAD_RE.search(line)
+        if up:
+            self.network_upload_percent = int(up.group(1))
+            self.network_state = "loaded" if self.network_upload_percent >= 100 else "uploading"
+        elif "Loading network firmware" in line:
+            self.network_state = "uploading"
+        elif "imx500" in line.lower() and level == "error":
+            self.network_state = "error"
+
+        if DROP_RE.search(line):
+            self.dropped_frames += 1
+            DROPPED_FRAMES.inc()
+
+        if level == "warn":
+            self.warnings += 1
+        elif level == "error":
+            self.errors += 1
+            self.last_error = line
+        STDERR_LINES.inc(level=level)
+
+        # Upload progress lines repeat a lot; only keep the latest one
+        with self._lock:
+            if up and self._lines and UPLOAD_RE.search(self._lines[-1]["line"]):
+                self._lines.pop()
+            self._lines.append({"ts": round(now, 3), "level": level, "line": line})
+
+    def feed_bytes(self, buffer: bytes, data: bytes) -> bytes:
+        """
+        Feed raw stderr bytes; returns the unfinished tail to pass back in next
+        time. Progress bars end lines with a bare \\r, so that counts as a line break too.
+        """
+        buffer += data
+        parts = re.split(rb"[\r\n]", buffer)
+        for raw in parts[:-1]:
+            self.feed(raw.decode("utf-8", "replace"))
+        tail = parts[-1]
+        # A runaway line without any newline shouldn't grow forever
+        if len(tail) > 8192:
+            self.feed(tail.decode("utf-8", "replace"))
+            tail = b""
+        return tail
+
+    def recent(self, limit: int = 100, level: Optional[str] = None) -> List[Dict]:
+        order = ["debug", "info", "warn", "error"]
+        with self._lock:
+            lines = list(self._lines)
+        if level in order:
+            lines = [l for l in lines if order.index(l["level"]) >= order.index(level)]
+        return lines[-limit:]
+
+    def stats(self) -> Dict:
+        return {
+            "fps": self.fps,
+            "frames_logged": self.frames_logged,
+            "dropped_frames": self.dropped_frames,
+            "warnings": self.warnings,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "network_state": self.network_state,
+            "network_upload_percent": self.network_upload_percent,
+            "last_line_age": round(time.time() - self.last_line_at, 1) if self.last_line_at else None,
+        }
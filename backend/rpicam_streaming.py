@@ -3,17 +3,20 @@
 This file is the heart of our camera streaming and AI detection.
 We use rpicam-vid for both MJPEG streaming and IMX500 person detection.
 No need for separate processes—it's all in one place.
+(The frames can also come from a recording, see frame_sources.py.)
 """
 
-import subprocess
+import base64
 import threading
 import time
 import json
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, BinaryIO, List, Dict, Optional
 from collections import deque
-import signal
-import os
+
+from . import metrics
+from .motion import motion_available
+from .frame_sources import FrameSource, RPiCamVidSource
 
 
 # List of COCO class names (for detection labels)
@@ -31,6 +34,112 @@ COCO_CLASSES = [
     "teddy bear", "hair drier", "toothbrush"
 ]
 
+if TYPE_CHECKING:
+    from .motion import MotionDetector
+    from .zones import ZoneAnalyzer
+
+# Pipeline metrics (see /metrics)
+FRAMES_READ = metrics.counter("picam_frames_total", "JPEG frames read from the frame source", ("camera",))
+FRAME_BYTES = metrics.counter("picam_frame_bytes_total", "Bytes of JPEG frames read from the frame source", ("camera",))
+FRAMES_THINNED = metrics.counter("picam_frames_thinned_total", "Static frames left out of the replay buffer", ("camera",))
+READ_ERRORS = metrics.counter("picam_read_errors_total", "MJPEG stream read errors", ("camera",))
+MOTION_SECONDS = metrics.histogram("picam_motion_seconds", "Motion detector time per frame", ("camera",))
+METADATA_FRAMES = metrics.counter("picam_metadata_frames_total", "Metadata frames by outcome", ("camera", "result"))
+DETECTION_SECONDS = metrics.histogram("picam_detection_seconds", "Tensor parse + tracking + zones per metadata frame", ("camera",))
+
+
+def parse_person_detections(tensor: List[float], debug_log: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Decode a MobileNet-SSD CnnOutputTensor into person detections.
+    Kept outside the class so recorded metadata can be replayed offline.
+    """
+    if debug_log is None:
+        debug_log = []
+    
+    # MobileNet-SSD tensor format (100 detections max):
+    # [0-399]: bounding boxes (100 x 4 values: y1, x1, y2, x2)
+    # [400-499]: confidence scores (100 values, 0.0-1.0)
+    # [500-599]: class IDs (100 values, terminated by 100.0)
+
+    NUM_DETECTIONS = 100
+    BBOX_START = 0
+    CONF_START = NUM_DETECTIONS * 4  # 400
+    CLASS_START = CONF_START + NUM_DETECTIONS  # 500
+
+    # Minimum confidence threshold for person detection
+    # Model outputs low confidence for person, but we need some threshold
+    # Combined with strict bbox size filtering to reduce false positives
+    MIN_CONFIDENCE = 0.10
+
+    detections = []
+
+    for i in range(NUM_DETECTIONS):
+        # Check if we have valid data
+        class_val = tensor[CLASS_START + i] if CLASS_START + i < len(tensor) else None
+        confidence = tensor[CONF_START + i] if CONF_START + i < len(tensor) else None
+        bbox_idx = BBOX_START + (i * 4)
+        y1 = tensor[bbox_idx] if bbox_idx < len(tensor) else None
+        x1 = tensor[bbox_idx + 1] if bbox_idx + 1 < len(tensor) else None
+        y2 = tensor[bbox_idx + 2] if bbox_idx + 2 < len(tensor) else None
+        x2 = tensor[bbox_idx + 3] if bbox_idx + 3 < len(tensor) else None
+        width = (x2 - x1) if (x2 is not None and x1 is not None) else None
+        height = (y2 - y1) if (y2 is not None and y1 is not None) else None
+        area = (width * height) if (width is not None and height is not None) else None
+
+        debug_log.append(f"Detection {i}: class={class_val} conf={confidence} bbox=({x1},{y1},{x2},{y2}) w={width} h={height} area={area}")
+
+        # 100.0 marks end of valid detections
+        if class_val is None or class_val == 100.0:
+            break
+
+        class_id = int(class_val)
+
+        # ONLY detect persons (class_id 0)
+        if class_id != 0:
+            continue
+
+        # Get confidence for this detection
+        if confidence is None or confidence < MIN_CONFIDENCE:
+            continue
+
+        # Get bounding box (format: y1, x1, y2, x2)
+        if None in (x1, y1, x2, y2):
+            continue
+
+        # Validate bbox values are in range 0-1
+        if not (0 <= x1 <= 1 and 0 <= y1 <= 1 and 0 <= x2 <= 1 and 0 <= y2 <= 1):
+            continue
+
+        # Ensure proper ordering (x2 > x1, y2 > y1)
+        if x2 <= x1 or y2 <= y1:
+            continue
+
+        # Calculate width and height
+        width = x2 - x1
+        height = y2 - y1
+
+        # Filter tiny detections (noise) - require reasonable person-sized bbox
+        # Model outputs low confidence for person, so we rely on size filtering
+        # A real person should take up significant frame space
+        # Width can be narrow (5%) for partial/side views, but height should be 20%+
+        if width < 0.05 or height < 0.20:
+            continue
+
+        # Require at least 4% of frame area
+        # This filters out small noise boxes that pass width/height checks
+        area = width * height
+        if area < 0.04:
+            continue
+
+        detections.append({
+            'class': 'person',
+            'class_id': 0,
+            'confidence': round(confidence, 2),
+            'bbox': [round(x1, 3), round(y1, 3), round(x2, 3), round(y2, 3)]
+        })
+    
+    return detections
+
 
 class RPiCamStreaming:
     """
@@ -43,37 +152,102 @@ class RPiCamStreaming:
         width: int = 640,
         height: int = 480,
         framerate: int = 15,
-        metadata_file: str = "/tmp/imx500_stream_detections.json"
+        metadata_file: str = "/tmp/imx500_stream_detections.json",
+        thin_static_frames: bool = True,
+        motion_detection: bool = True,
+        source: Optional[FrameSource] = None,
+        camera_id: str = "main",
+        zones_file: Optional[Path] = None,
+        h264: bool = False,
+        h264_file: Optional[Path] = None
     ):
+        # The tracker, zones and motion detector pull in numpy/OpenCV (and
+        # frame_dedup PIL), so they're imported here instead of at the top:
+        # importing this module (and so main.py) stays quick, and the streamer
+        # is built off the event loop
+        from . import frame_dedup
+        from .frame_dedup import ChangeDetector
+        from .motion import MotionDetector
+        from .tracker import PersonTracker
+        from .zones import ZoneAnalyzer
+        
+        # Which camera this is (see cameras.py); labels metrics and thread names
+        self.camera_id = camera_id
         self.width = width
         self.height = height
         self.framerate = framerate
         self.metadata_file = Path(metadata_file)
 
-        self._process: Optional[subprocess.Popen] = None
+        # Real camera by default; tests/benchmarks pass a FileReplaySource
+        self.source = source or RPiCamVidSource()
+        self._stdout: Optional[BinaryIO] = None
         self._running = False
         self._latest_detections: List[Dict] = []
         self._detection_lock = threading.Lock()
         self._monitor_thread: Optional[threading.Thread] = None
 
-        # Only count detections that show up in several frames (avoids false positives)
-        self._detection_history: deque = deque(maxlen=5)  # Last 5 frames
-        self._consecutive_person_frames = 0
-        self._min_consecutive_frames = 3  # Require 3+ consecutive frames with person
+        # Track people across frames: a new person only counts after 3 frames
+        # in a row (avoids false positives), then keeps a stable track ID
+        self._tracker = PersonTracker(min_hits=3)
+        # The metadata thread, the frame reader and the supervisor all move it on (see age_tracks())
+        self._tracker_lock = threading.Lock()
+        self._tracker_updated_at = 0.0
+        # enter/exit events for main.py to pick up
+        self._track_events: deque = deque(maxlen=100)
+        # Zones/tripwires from config/zones.json, checked on every detection frame
+        self._zones = ZoneAnalyzer.from_file(zones_file) if zones_file else ZoneAnalyzer.from_file()
 
         # MJPEG streaming state
         self._current_frame: Optional[bytes] = None
+        self._started_at: Optional[float] = None
+        self._first_frame_at: Optional[float] = None
+        self._last_frame_at: Optional[float] = None
         self._frame_lock = threading.Lock()
         self._stream_thread: Optional[threading.Thread] = None
 
         # Buffer last 5 minutes of frames for replay (at 15fps = 4500 frames)
+        self._buffer_seconds = 300
         self._frame_buffer = deque(maxlen=4500)
         self._buffer_lock = threading.Lock()
 
+        # When nothing moves, only keep ~1 frame per second in the replay buffer.
+        # Timestamps are kept, so the VFR encoder still plays it back at real speed.
+        self._buffer_filter = (
+            ChangeDetector(frame_dedup.REPLAY_MIN_CHANGE, frame_dedup.REPLAY_MAX_GAP)
+            if thin_static_frames else None
+        )
+        self._frames_seen = 0
+        self._frames_thinned = 0
+
+        # Optional H.264 live view (hls.py): our JPEGs go through an encoder
+        # (or an Annex B recording is replayed) and get cut into fMP4 segments,
+        # which also serve as a no-encode replay buffer
+        self.hls = None
+        self._h264_file = Path(h264_file) if h264_file else None
+        self._h264 = None
+        if h264 or h264_file:
+            from .hls import HLSSegmenter
+            self.hls = HLSSegmenter(camera_id, keep_seconds=self._buffer_seconds)
+
+        # Set by attach_bus() in the capture process: frames, the replay buffer
+        # and detections then go to shared memory for the web workers (frame_bus.py)
+        self.bus = None
+
+        # Optional OpenCV motion prefilter: while the scene is still we skip
+        # decoding the detection tensor altogether
+        self._motion: Optional["MotionDetector"] = None
+        if motion_detection and motion_available():
+            self._motion = MotionDetector()
+        elif motion_detection:
+            print("[RPiCamStreaming] OpenCV not available, motion prefilter disabled")
+        self._latest_motion: Optional[Dict] = None
+        self._motion_hold = 5.0  # keep decoding detections this long after motion stops
+        self._tensors_skipped = 0
+
         print(f"[RPiCamStreaming] Initialized {width}x{height} @ {framerate}fps")
     
     def start(self):
-        """Start rpicam-vid with MJPEG streaming and IMX500 detection."""
+        """Start the frame source (rpicam-vid by default) and the reader threads."""
         if self._running:
             print("[RPiCamStreaming] Already running")
             return
@@ -82,44 +256,24 @@ class RPiCamStreaming:
         if self.metadata_file.exists():
             self.metadata_file.unlink()
         
-        # Use custom config WITHOUT object_detect_draw_cv (no boxes burned into stream)
-        # The default /usr/share/rpi-camera-assets/imx500_mobilenet_ssd.json draws on video
-        config_path = Path(__file__).resolve().parents[1] / "config" / "imx500_person_detection.json"
-        
-        # Build command: stream MJPEG to stdout, metadata to file
-        cmd = [
-            "rpicam-vid",
-            "--post-process-file", str(config_path),
-            "--width", str(self.width),
-            "--height", str(self.height),
-            "--framerate", str(self.framerate),
-            "--nopreview",
-            "--codec", "mjpeg",
-            "--metadata", str(self.metadata_file),
-            "--metadata-format", "json",
-            "-t", "0",  # Run indefinitely
-            "-o", "-",  # MJPEG to stdout
-        ]
-        
-        print(f"[RPiCamStreaming] Starting rpicam-vid...")
-        print(f"[RPiCamStreaming] Command: {' '.join(cmd)}")
+        print(f"[RPiCamStreaming] Starting {self.source.name}...")
         
         try:
-            # Start subprocess
-            self._process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                preexec_fn=os.setsid
-            )
+            # The source gives us the MJPEG byte stream and writes metadata to our file
+            self._stdout = self.source.start(self.width, self.height, self.framerate, self.metadata_file)
             
             self._running = True
+            # Per-start timing, so the supervisor can tell "still warming up" from "stalled"
+            with self._frame_lock:
+                self._started_at = time.time()
+                self._first_frame_at = None
+                self._last_frame_at = None
             
             # Start MJPEG frame reader thread
             self._stream_thread = threading.Thread(
                 target=self._read_mjpeg_stream,
                 daemon=True,
-                name="RPiCam-MJPEGReader"
+                name=f"RPiCam-MJPEGReader-{self.camera_id}"
             )
             self._stream_thread.start()
             
@@ -127,12 +281,16 @@ class RPiCamStreaming:
             self._monitor_thread = threading.Thread(
                 target=self._monitor_metadata,
                 daemon=True,
-                name="RPiCam-MetadataMonitor"
+                name=f"RPiCam-MetadataMonitor-{self.camera_id}"
             )
             self._monitor_thread.start()
             
-            print(f"[RPiCamStreaming] Started (PID: {self._process.pid})")
-            print("[RPiCamStreaming] Loading IMX500 firmware (this takes ~30 seconds)...")
+            if self.hls is not None:
+                self._start_h264()
+            
+            print(f"[RPiCamStreaming] Started (PID: {self.source.pid})")
+            if isinstance(self.source, RPiCamVidSource):
+                print("[RPiCamStreaming] Loading IMX500 firmware (this takes ~30 seconds)...")
             
         except Exception as e:
             print(f"[RPiCamStreaming] Failed to start: {e}")
@@ -140,24 +298,18 @@ class RPiCamStreaming:
             raise
     
     def stop(self):
-        """Stop rpicam-vid."""
+        """Stop the frame source and reader threads."""
         if not self._running:
             return
         
         print("[RPiCamStreaming] Stopping...")
         self._running = False
         
-        # Kill process group
-        if self._process:
-            try:
-                os.killpg(os.getpgid(self._process.pid), signal.SIGTERM)
-                self._process.wait(timeout=5)
-                print("[RPiCamStreaming] Process terminated")
-            except subprocess.TimeoutExpired:
-                os.killpg(os.getpgid(self._process.pid), signal.SIGKILL)
-                self._process.wait()
-            except Exception as e:
-                print(f"[RPiCamStreaming] Stop error: {e}")
+        # Stop the camera process (or recording)
+        self.source.stop()
+        if self._h264 is not None:
+            self._h264.stop()
+            self._h264 = None
         
         # Wait for threads
         if self._stream_thread and self._stream_thread.is_alive():
@@ -171,15 +323,28 @@ class RPiCamStreaming:
         
         print("[RPiCamStreaming] Stopped")
     
+    def _start_h264(self):
+        """Encoder (or recording) feeding the HLS segmenter. Failing here only costs the H.264 view."""
+        from .hls import H264Encoder, H264FileFeed
+        try:
+            if self._h264_file is not None:
+                feed = H264FileFeed(self.hls, self._h264_file, self.framerate)
+            else:
+                feed = H264Encoder(self.hls, self.framerate)
+            feed.start()
+            self._h264 = feed
+        except Exception as e:
+            print(f"[RPiCamStreaming] H.264 live view unavailable: {e}")
+    
     def _read_mjpeg_stream(self):
         """Read MJPEG frames from stdout."""
         print("[RPiCamStreaming] MJPEG reader started")
         
         buffer = b""
         
-        while self._running and self._process:
+        while self._running and self._stdout:
             try:
-                chunk = self._process.stdout.read(4096)
+                chunk = self._stdout.read(4096)
                 if not chunk:
                     break
                 
@@ -193,24 +358,99 @@ class RPiCamStreaming:
                     if end > start:
                         frame = buffer[start:end]
                         buffer = buffer[end:]
+                        captured_at = time.time()
                         
                         # Store frame
                         with self._frame_lock:
                             self._current_frame = frame
+                            self._last_frame_at = captured_at
+                            if self._first_frame_at is None:
+                                self._first_frame_at = captured_at
+                        FRAMES_READ.inc(camera=self.camera_id)
+                        FRAME_BYTES.inc(len(frame), camera=self.camera_id)
+                        if self.bus is not None:
+                            self.bus.publish_frame(frame, captured_at)
+                        if self._h264 is not None:
+                            self._h264.feed(captured_at, frame)
+                        
+                        if self._motion is not None:
+                            with MOTION_SECONDS.time(camera=self.camera_id):
+                                result = self._motion.process(frame, captured_at)
+                            if result is not None:
+                                self._latest_motion = result
+                                self._publish_detections()
                         
-                        # Add to buffer for replay
-                        with self._buffer_lock:
-                            self._frame_buffer.append((time.time(), frame))
+                        # Add to buffer for replay (unless it's a near-copy of the last kept frame)
+                        self._buffer_frame(captured_at, frame)
+                        # No detection metadata lately? Let the tracks end anyway
+                        self.age_tracks(captured_at)
                     else:
                         break
                         
             except Exception as e:
                 if self._running:
+                    READ_ERRORS.inc(camera=self.camera_id)
                     print(f"[RPiCamStreaming] MJPEG read error: {e}")
                 break
         
         print("[RPiCamStreaming] MJPEG reader stopped")
     
+    def _buffer_frame(self, captured_at: float, frame: bytes):
+        """Append a frame to the replay buffer, thinning static scenes and dropping old frames."""
+        self._frames_seen += 1
+        moving = bool(self._latest_motion and self._latest_motion["motion"])
+        if self._buffer_filter is not None and not self._buffer_filter.should_keep(frame, captured_at) and not moving:
+            self._frames_thinned += 1
+            FRAMES_THINNED.inc(camera=self.camera_id)
+            return
+        if self.bus is not None:
+            # The shared-memory ring is the replay buffer now (it drops the oldest frames by itself)
+            self.bus.buffer_frame(captured_at, frame)
+            return
+        with self._buffer_lock:
+            self._frame_buffer.append((captured_at, frame))
+            # maxlen is a hard cap; thinned buffers are trimmed by age instead
+            cutoff = captured_at - self._buffer_seconds
+            while self._frame_buffer and self._frame_buffer[0][0] < cutoff:
+                self._frame_buffer.popleft()
+    
+    def attach_bus(self, bus):
+        """Publish to a frame_bus.FrameBus from now on (capture process)."""
+        self.bus = bus
+    
+    def _publish_detections(self):
+        if self.bus is not None:
+            from .frame_bus import STATE_DETECTIONS
+            self.bus.publish_state(STATE_DETECTIONS, {"detections": self.get_detections(), "motion": self._latest_motion})
+    
+    def get_motion(self) -> Optional[Dict]:
+        """Latest motion result (score, motion flag, regions), or None if motion detection is off."""
+        return self._latest_motion
+    
+    def has_recent_motion(self, seconds: float = 5.0) -> bool:
+        """True if there was motion in the last N seconds (always True without a motion detector)."""
+        if self._motion is None:
+            return True
+        return self._motion.seconds_since_motion() <= seconds
+    
+    def get_buffer_stats(self) -> Dict:
+        """Replay buffer size and how many frames were skipped as duplicates."""
+        if self.bus is not None:
+            ring = self.bus.replay.stats()
+            count, size = ring["frames"], ring["bytes"]
+        else:
+            with self._buffer_lock:
+                count = len(self._frame_buffer)
+                size = sum(len(f) for _, f in self._frame_buffer)
+        return {
+            "frames": count,
+            "bytes": size,
+            "frames_seen": self._frames_seen,
+            "frames_thinned": self._frames_thinned,
+            "last_change_score": round(self._buffer_filter.last_score, 4) if self._buffer_filter else None,
+            "tensors_skipped": self._tensors_skipped,
+        }
+    
     def _monitor_metadata(self):
         """Monitor metadata file for detections."""
         print("[RPiCamStreaming] Metadata monitor started")
@@ -260,6 +500,7 @@ class RPiCamStreaming:
                     if isinstance(frame_data, dict):
                         self._extract_detections(frame_data)
                 except json.JSONDecodeError:
+                    METADATA_FRAMES.inc(camera=self.camera_id, result="bad_json")
                     continue
                     
         except Exception as e:
@@ -271,168 +512,154 @@ class RPiCamStreaming:
             if "CnnOutputTensor" not in frame_data:
                 return
             
+            # Nothing has moved for a while and nobody is being tracked: a person
+            # can't have appeared, so don't bother decoding the tensor
+            if (self._motion is not None
+                    and not self._tracker.has_tracks()
+                    and self._motion.seconds_since_motion() > self._motion_hold):
+                self._tensors_skipped += 1
+                METADATA_FRAMES.inc(camera=self.camera_id, result="skipped")
+                return
+            
             tensor = frame_data["CnnOutputTensor"]
             if not tensor or len(tensor) < 600:  # Need at least bbox + conf + class data
+                METADATA_FRAMES.inc(camera=self.camera_id, result="short_tensor")
                 return
             
-            # MobileNet-SSD tensor format (100 detections max):
-            # [0-399]: bounding boxes (100 x 4 values: y1, x1, y2, x2)
-            # [400-499]: confidence scores (100 values, 0.0-1.0)
-            # [500-599]: class IDs (100 values, terminated by 100.0)
-            
-            NUM_DETECTIONS = 100
-            BBOX_START = 0
-            CONF_START = NUM_DETECTIONS * 4  # 400
-            CLASS_START = CONF_START + NUM_DETECTIONS  # 500
-            
-            # Minimum confidence threshold for person detection
-            # Model outputs low confidence for person, but we need some threshold
-            # Combined with strict bbox size filtering to reduce false positives
-            MIN_CONFIDENCE = 0.10
-            
-            detections = []
-            debug_log = []
-            
-            for i in range(NUM_DETECTIONS):
-                # Check if we have valid data
-                class_val = tensor[CLASS_START + i] if CLASS_START + i < len(tensor) else None
-                confidence = tensor[CONF_START + i] if CONF_START + i < len(tensor) else None
-                bbox_idx = BBOX_START + (i * 4)
-                y1 = tensor[bbox_idx] if bbox_idx < len(tensor) else None
-                x1 = tensor[bbox_idx + 1] if bbox_idx + 1 < len(tensor) else None
-                y2 = tensor[bbox_idx + 2] if bbox_idx + 2 < len(tensor) else None
-                x2 = tensor[bbox_idx + 3] if bbox_idx + 3 < len(tensor) else None
-                width = (x2 - x1) if (x2 is not None and x1 is not None) else None
-                height = (y2 - y1) if (y2 is not None and y1 is not None) else None
-                area = (width * height) if (width is not None and height is not None) else None
-                
-                debug_log.append(f"Detection {i}: class={class_val} conf={confidence} bbox=({x1},{y1},{x2},{y2}) w={width} h={height} area={area}")
-                
-                # 100.0 marks end of valid detections
-                if class_val is None or class_val == 100.0:
-                    break
-                
-                class_id = int(class_val)
-                
-                # ONLY detect persons (class_id 0)
-                if class_id != 0:
-                    continue
-                
-                # Get confidence for this detection
-                if confidence is None or confidence < MIN_CONFIDENCE:
-                    continue
-                
-                # Get bounding box (format: y1, x1, y2, x2)
-                if None in (x1, y1, x2, y2):
-                    continue
-                
-                # Validate bbox values are in range 0-1
-                if not (0 <= x1 <= 1 and 0 <= y1 <= 1 and 0 <= x2 <= 1 and 0 <= y2 <= 1):
-                    continue
+            with DETECTION_SECONDS.time(camera=self.camera_id):
+                debug_log = []
+                detections = parse_person_detections(tensor, debug_log)
                 
-                # Ensure proper ordering (x2 > x1, y2 > y1)
-                if x2 <= x1 or y2 <= y1:
-                    continue
-                
-                # Calculate width and height
-                width = x2 - x1
-                height = y2 - y1
-                
-                # Filter tiny detections (noise) - require reasonable person-sized bbox
-                # Model outputs low confidence for person, so we rely on size filtering
-                # A real person should take up significant frame space
-                # Width can be narrow (5%) for partial/side views, but height should be 20%+
-                if width < 0.05 or height < 0.20:
-                    continue
-                
-                # Require at least 4% of frame area
-                # This filters out small noise boxes that pass width/height checks
-                area = width * height
-                if area < 0.04:
-                    continue
-                
-                detections.append({
-                    'class': 'person',
-                    'class_id': 0,
-                    'confidence': round(confidence, 2),
-                    'bbox': [round(x1, 3), round(y1, 3), round(x2, 3), round(y2, 3)]
-                })
-            
-            # Apply temporal filtering: only report detections if consistent across frames
-            has_person = len(detections) > 0
-            self._detection_history.append(has_person)
-            
-            if has_person:
-                self._consecutive_person_frames += 1
-            else:
-                self._consecutive_person_frames = 0
+                # Temporal filtering + IDs: match against the people we're already tracking
+                tracked = self._update_tracks(detections, time.time())
+            METADATA_FRAMES.inc(camera=self.camera_id, result="decoded")
             
-            print(f"[Detection] Frame: {len(detections)} person(s) detected. Consecutive: {self._consecutive_person_frames}")
-            for log_entry in debug_log:
-                print(f"[Detection] {log_entry}")
-            
-            # Only report detections if we have consistent detection across multiple frames
-            # This prevents single-frame false positives
-            with self._detection_lock:
-                if self._consecutive_person_frames >= self._min_consecutive_frames:
-                    self._latest_detections = detections
-                else:
-                    # Not enough consistent frames yet, report empty
-                    self._latest_detections = []
+            if detections or tracked:
+                print(f"[Detection] Frame: {len(detections)} person(s) detected, {len(tracked)} tracked")
+                for log_entry in debug_log:
+                    print(f"[Detection] {log_entry}")
                     
         except Exception as e:
             print(f"[Detection] Error parsing tensor: {e}")
     
+    def _update_tracks(self, detections: List[Dict], now: float) -> List[Dict]:
+        """One tracker + zones step; stores the confirmed tracks and queues their events."""
+        with self._tracker_lock:
+            tracked, events = self._tracker.update(detections, now)
+            events += self._zones.process(tracked, now)
+            self._tracker_updated_at = now
+        for event in events:
+            print(f"[Detection] Track {event['track_id']} {event['type']} {event.get('zone_id') or ''}")
+        
+        # Only confirmed tracks are reported, so single-frame false positives never show up
+        with self._detection_lock:
+            self._latest_detections = tracked
+            self._track_events.extend(events)
+        self._publish_detections()
+        return tracked
+    
+    def age_tracks(self, now: Optional[float] = None):
+        """
+        Move the tracker on with no detections when no usable metadata has
+        come for a while (metadata stopped, or only short tensors), so people
+        still leave: "exit" fires and their boxes go away. Cheap when there's
+        nothing to do; called per frame and from the supervisor's tick.
+        """
+        now = now if now is not None else time.time()
+        if now - self._tracker_updated_at < self._tracker.report_gap or not self._tracker.has_tracks():
+            return
+        self._update_tracks([], now)
+    
     def get_frame(self) -> Optional[bytes]:
         """Get latest JPEG frame."""
         with self._frame_lock:
             return self._current_frame
     
+    def get_frame_info(self) -> Dict:
+        """Frames read so far and when the latest one arrived (for health checks and skip counts)."""
+        with self._frame_lock:
+            last = self._last_frame_at
+            started = self._started_at
+            first = self._first_frame_at
+        return {
+            "frames_seen": self._frames_seen,
+            "started_at": started,
+            "first_frame_at": first,
+            "last_frame_at": last,
+            "last_frame_age": round(time.time() - last, 2) if last else None,
+        }
+    
     def get_detections(self) -> List[Dict]:
         """Get latest detections."""
         with self._detection_lock:
             return self._latest_detections.copy()
     
-    def get_recent_frames(self, seconds: int) -> List[tuple]:
+    def pop_track_events(self) -> List[Dict]:
+        """Get (and clear) the enter/exit and zone events since the last call."""
+        with self._detection_lock:
+            events = list(self._track_events)
+            self._track_events.clear()
+        return events
+    
+    def get_zones(self) -> "ZoneAnalyzer":
+        return self._zones
+    
+    def get_frame_base64(self) -> Optional[str]:
+        """Latest frame as base64 (for the WebSocket)."""
+        frame = self.get_frame()
+        return base64.b64encode(frame).decode("ascii") if frame else None
+    
+    def get_recent_frames(self, seconds: float) -> List[tuple]:
         """Get frames from the last N seconds as (timestamp, jpeg_bytes) tuples."""
+        if self.bus is not None:
+            return self.bus.replay.between(time.time() - seconds, float("inf"))
         cutoff_time = time.time() - seconds
         frames = []
         
         with self._buffer_lock:
             for timestamp, frame in self._frame_buffer:
                 if timestamp >= cutoff_time:
-                    # Return as (timestamp_int, jpeg_bytes) tuple
-                    frames.append((int(timestamp), frame))
+                    # Keep the full float capture time so replays can be timed exactly
+                    frames.append((timestamp, frame))
         
         return frames
     
+    def get_frames_between(self, start: float, end: float) -> List[tuple]:
+        """Get buffered frames captured between two timestamps (inclusive)."""
+        if self.bus is not None:
+            return self.bus.replay.between(start, end)
+        with self._buffer_lock:
+            return [(ts, frame) for ts, frame in self._frame_buffer if start <= ts <= end]
+    
+    def clip_from_segments(self, start: float, end: float, output_path: Path) -> Optional[Dict]:
+        """
+        A replay/event clip made of the H.264 segments (no encode), or None
+        without the H.264 view. Same metadata as video_utils.frames_to_mp4,
+        plus "start". Blocks up to a segment's length for the one covering `end`.
+        """
+        if self.hls is None or self._h264 is None:
+            return None
+        deadline = time.time() + self.hls.target_seconds + 1.0
+        while self.hls.covered_until() < end and time.time() < deadline:
+            time.sleep(0.1)
+        metadata = self.hls.write_clip(start, end, output_path)
+        if metadata is None:
+            return None
+        # Poster from the JPEG replay buffer, like the encoded clips
+        frames = self.get_frames_between(metadata["start"], end)
+        if frames:
+            from . import video_utils
+            try:
+                video_utils.save_poster(frames[len(frames) // 2][1], video_utils.poster_path_for(output_path))
+            except Exception as e:
+                print(f"[RPiCamStreaming] Poster failed for {Path(output_path).name}: {e}")
+        return metadata
+    
+    @property
+    def started(self) -> bool:
+        """start() succeeded and stop() hasn't been called (the process may have died since: see is_running())."""
+        return self._running
+
     def is_running(self) -> bool:
         """Check if running."""
-        return self._running and self._process is not None and self._process.poll() is None
-
-
-# Global instance
-_streamer: Optional[RPiCamStreaming] = None
-
-
-def get_streamer() -> RPiCamStreaming:
-    """Get global streamer instance."""
-    global _streamer
-    if _streamer is None:
-        _streamer = RPiCamStreaming()
-    return _streamer
-
-
-def start_streamer():
-    """Start global streamer."""
-    streamer = get_streamer()
-    if not streamer.is_running():
-        streamer.start()
-
-
-def stop_streamer():
-    """Stop global streamer."""
-    global _streamer
-    if _streamer:
-        _streamer.stop()
-        _streamer = None
+        return self._running and self.source.is_alive()
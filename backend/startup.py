@@ -0,0 +1,215 @@
+"""
+Startup orchestration and the cold-start benchmark.
+
+The app starts serving as soon as uvicorn has imported main.py. Everything
+slow - creating the DB tables, importing numpy/OpenCV and building the
+streamer, starting the camera (IMX500 firmware upload, ~30 s) - happens in
+main.py's bring-up task afterwards, one named step at a time. StartupTracker
+records those steps so /api/health and the WebSocket can say "warming up"
+instead of the page just hanging - or which step failed, and when it's
+retried.
+
+Benchmark (import time via `python -X importtime`, plus time until the app
+answers its first request), with optional regression check:
+    python -m backend.startup                      # report
+    python -m backend.startup --save startup.json  # store as baseline
+    python -m backend.startup --baseline startup.json --tolerance 0.2
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+
+class StartupTracker:
+    def __init__(self):
+        self.started_at = time.time()
+        self.phase = "starting"
+        self.ready_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.steps: List[Dict] = []
+        # Set while a step that failed waits for its retry (see retry())
+        self.failed_step: Optional[str] = None
+        self.retry_at: Optional[float] = None
+
+    @contextmanager
+    def step(self, name: str):
+        self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+            if self.failed_step == name:
+                self.failed_step = self.retry_at = self.error = None
+        except Exception as e:
+            self.error = f"{name}: {e}"
+            print(f"[startup] {name} failed: {e}")
+            raise
+        finally:
+            seconds = round(time.perf_counter() - start, 3)
+            self.steps.append({"step": name, "seconds": seconds})
+            print(f"[startup] {name} took {seconds:.2f}s")
+
+    def retry(self, name: str, delay: float):
+        """A step failed (step() has the error); it's tried again in `delay` seconds."""
+        self.phase = "failed"
+        self.failed_step = name
+        self.retry_at = time.time() + delay
+        print(f"[startup] Retrying {name} in {delay:.0f}s")
+
+    def done(self):
+        self.phase = "ready"
+        self.ready_at = time.time()
+        print(f"[startup] Ready after {self.ready_at - self.started_at:.2f}s")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def status(self) -> Dict:
+        return {
+            "phase": self.phase,
+            "ready": self.ready,
+            "seconds": round((self.ready_at or time.time()) - self.started_at, 2),
+            "steps": list(self.steps),
+            "error": self.error,
+            "failed_step": self.failed_step,
+            "retry_in": round(max(0.0, self.retry_at - time.time()), 1) if self.retry_at else None,
+        }
+
+
+# ---- benchmark ----
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Rows of `python -X importtime` output as {module, self_us, cumulative_us}."""
+    rows = []
+    for line in stderr.splitlines():
+        # "import time:       523 |      37542 |   numpy._typing" (the header row says "self [us]")
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        rows.append({
+            "module": parts[2].strip(),
+            "self_us": int(parts[0]),
+            "cumulative_us": int(parts[1]),
+        })
+    return rows
+
+
+def measure_import(module: str = "backend.main", runs: int = 3) -> Dict:
+    """Median import time of `module` in a fresh interpreter, with the slowest imports."""
+    import statistics
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    root = Path(__file__).resolve().parents[1]
+    totals, rows = [], []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              cwd=root, capture_output=True, text=True, timeout=120)
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+        rows = parse_importtime(proc.stderr)
+        top = next((r for r in rows if r["module"] == module), None)
+        totals.append(top["cumulative_us"] if top else 0)
+    slowest = sorted(rows, key=lambda r: r["self_us"], reverse=True)[:10]
+    ours = sorted((r for r in rows if r["module"].startswith("backend.")),
+                  key=lambda r: r["cumulative_us"], reverse=True)
+    return {
+        "module": module,
+        "import_ms": round(statistics.median(totals) / 1000, 1),
+        "slowest_self_ms": {r["module"]: round(r["self_us"] / 1000, 1) for r in slowest},
+        "backend_cumulative_ms": {r["module"]: round(r["cumulative_us"] / 1000, 1) for r in ours},
+    }
+
+
+_FIRST_RESPONSE_SCRIPT = """
+import time, json
+t0 = time.perf_counter()
+from fastapi.testclient import TestClient
+import backend.main as main
+t_import = time.perf_counter()
+with TestClient(main.app) as client:
+    t_started = time.perf_counter()
+    client.get('/api/health')
+    t_first = time.perf_counter()
+    deadline = time.time() + 60
+    while not main.startup.ready and time.time() < deadline:
+        time.sleep(0.01)
+    t_ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": round((t_import - t0) * 1000, 1),
+    "startup_handler_ms": round((t_started - t_import) * 1000, 1),
+    "first_response_ms": round((t_first - t0) * 1000, 1),
+    "backend_ready_ms": round((t_ready - t0) * 1000, 1),
+}))
+"""
+
+
+def measure_first_response() -> Dict:
+    """
+    Fresh process: import the app, run its startup and time the first
+    /api/health response and the end of the bring-up task. Runs off a
+    synthetic recording with a throwaway data dir, so it's safe on a live Pi.
+    """
+    import json
+    import os
+    import subprocess
+    import sys
+    import tempfile
+    from pathlib import Path
+
+    from .pipeline_bench import generate_recording
+
+    root = Path(__file__).resolve().parents[1]
+    with tempfile.TemporaryDirectory() as tmp:
+        mjpeg, meta = generate_recording(Path(tmp) / "rec", seconds=2)
+        # A missing PICAM_CAMERAS file means the single default camera, even if config/cameras.json exists
+        env = dict(os.environ, PICAM_REPLAY_MJPEG=str(mjpeg), PICAM_REPLAY_METADATA=str(meta),
+                   PICAM_DATA_DIR=str(Path(tmp) / "data"), PICAM_CAMERAS=str(Path(tmp) / "no-cameras.json"))
+        proc = subprocess.run([sys.executable, "-c", _FIRST_RESPONSE_SCRIPT], cwd=root, env=env,
+                              capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Timings that got more than `tolerance` slower than the baseline."""
+    regressions = []
+    for section in ("import", "first_response"):
+        for key, old in baseline.get(section, {}).items():
+            new = result.get(section, {}).get(key)
+            # Only the totals: the per-module breakdowns (dicts) are there to read, not to gate on
+            if not key.endswith("_ms") or not isinstance(old, (int, float)) or not old or new is None:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append(f"{section}.{key}: {old} ms -> {new} ms (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Measure import time and time to first response")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--save", help="write the result as a baseline JSON file")
+    parser.add_argument("--baseline", help="compare against a saved baseline and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    result = {"import": measure_import(runs=args.runs), "first_response": measure_first_response()}
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = _compare(result, json.load(f), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        sys.exit(1 if regressions else 0)
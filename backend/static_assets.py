@@ -0,0 +1,305 @@
+"""
+The PiDoorCam frontend, served from memory.
+Every page load used to send each .html and style.css in full (FileResponse,
+no caching, no compression) - over a slow VPN link that's most of the wait.
+Instead, at startup every file in PiDoorCam/ is read once and:
+
+  - precompressed: gzip, plus brotli if the `brotli` package is installed
+    (whichever the browser's Accept-Encoding prefers; identity otherwise)
+  - given an ETag from its content, so a revisit is a 304 with no body
+  - non-HTML assets (style.css, ...) also get a fingerprinted URL,
+    /static/style.<hash>.css, served as immutable; the pages' references to
+    them are rewritten to it, so the browser doesn't even ask again until
+    the file changes
+
+Edits on disk are picked up (checked at most once a second), same as before.
+
+Measure page loads over a throttled link (1 Mbit/s, 100 ms RTT by default):
+    python -m backend.static_assets [--kbps 1000] [--rtt 100]
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Server preference when the browser likes several equally
+_PREFERENCE = ("br", "gzip", "identity")
+
+
+class Asset:
+    def __init__(self, name: str, body: bytes, media_type: str):
+        self.name = name
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.variants: Dict[str, bytes] = {"identity": body}
+        if len(body) > 256:
+            # Only keep an encoding if it actually saves something
+            compressed = {"gzip": gzip.compress(body, 9, mtime=0)}
+            if brotli is not None:
+                compressed["br"] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = data
+
+    @property
+    def fingerprinted(self) -> str:
+        """style.css -> style.<hash>.css"""
+        stem, dot, ext = self.name.rpartition(".")
+        return f"{stem}.{self.digest}.{ext}" if dot else f"{self.name}.{self.digest}"
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.digest}"' if encoding == "identity" else f'"{self.digest}-{encoding}"'
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    """Pick an encoding from an Accept-Encoding header (q-values honoured, identity as fallback)."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    best, best_q = "identity", weights.get("identity", weights.get("*", 0.001))
+    for encoding in _PREFERENCE:
+        if encoding not in available or encoding == "identity":
+            continue
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > 0 and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class StaticAssets:
+    def __init__(self, root: Path):
+        self.root = Path(root)
+        self._assets: Dict[str, Asset] = {}
+        self._by_fingerprint: Dict[str, Asset] = {}
+        self._mtimes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    def load(self):
+        """Read and compress everything (again). Cheap: the whole frontend is ~60 KB."""
+        files = sorted(p for p in self.root.iterdir() if p.is_file()) if self.root.exists() else []
+        mtimes = {p.name: p.stat().st_mtime_ns for p in files}
+        raw = {p.name: p.read_bytes() for p in files}
+        assets = {
+            name: Asset(name, body, mimetypes.guess_type(name)[0] or "application/octet-stream")
+            for name, body in raw.items() if not name.endswith(".html")
+        }
+        if assets:
+            # href="style.css" / "style.css?v=4" -> the fingerprinted URL
+            refs = re.compile(r'(href|src)="/?(%s)(\?[^"]*)?"' % "|".join(re.escape(n) for n in assets))
+            for name, body in raw.items():
+                if name.endswith(".html"):
+                    text = refs.sub(lambda m: f'{m.group(1)}="/static/{assets[m.group(2)].fingerprinted}"',
+                                    body.decode("utf-8"))
+                    assets[name] = Asset(name, text.encode("utf-8"), "text/html; charset=utf-8")
+        with self._lock:
+            self._assets = assets
+            self._by_fingerprint = {a.fingerprinted: a for a in assets.values() if not a.name.endswith(".html")}
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
+        encodings = "gzip + brotli" if brotli is not None else "gzip (pip install brotli for br)"
+        print(f"[StaticAssets] {len(assets)} files from {self.root.name}/, {encodings}")
+
+    def _fresh(self):
+        """Load on first use, and reload if a file changed (checked at most once a second)."""
+        if not self._assets:
+            with self._lock:
+                loaded = bool(self._assets)
+            if not loaded:
+                self.load()
+            return
+        if time.monotonic() - self._checked_at < 1.0:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            mtimes = {p.name: p.stat().st_mtime_ns for p in self.root.iterdir() if p.is_file()}
+        except OSError:
+            return
+        if mtimes != self._mtimes:
+            self.load()
+
+    def get(self, name: str) -> Optional[Asset]:
+        self._fresh()
+        return self._assets.get(name)
+
+    def get_fingerprinted(self, name: str) -> Optional[Asset]:
+        self._fresh()
+        return self._by_fingerprint.get(name)
+
+    def response(self, request: Request, asset: Asset, immutable: bool = False) -> Response:
+        """The asset in the best encoding the client takes, or 304 if it already has it."""
+        encoding = negotiate(request.headers.get("accept-encoding", ""), asset.variants)
+        headers = {
+            "ETag": asset.etag(encoding),
+            "Vary": "Accept-Encoding",
+            # Pages always revalidate (cheap 304); fingerprinted assets never need to
+            "Cache-Control": IMMUTABLE if immutable else "no-cache",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            if "*" in tags or asset.etag(encoding) in tags:
+                return Response(status_code=304, headers=headers)
+        return Response(asset.variants[encoding], media_type=asset.media_type, headers=headers)
+
+    def stats(self) -> Dict:
+        self._fresh()
+        return {
+            name: {encoding: len(body) for encoding, body in asset.variants.items()}
+            for name, asset in self._assets.items()
+        }
+
+
+def _bench(kbps: int = 1000, rtt_ms: int = 100, port: int = 18090):
+    """
+    Load every page (plus its CSS) through a throttling TCP proxy in front of
+    a real uvicorn: first visit and repeat visit, as the old server behaved
+    (everything in full) and with compression + ETags + immutable assets.
+    """
+    import asyncio
+    import http.client
+    import os
+    import subprocess
+    import sys
+    import tempfile
+
+    root = Path(__file__).resolve().parents[1]
+    proxy_port = port + 1
+    bytes_per_s = kbps * 1000 / 8
+
+    async def pipe(reader, writer):
+        # The link's bandwidth, in both directions
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                await asyncio.sleep(len(data) / bytes_per_s)
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(client_r, client_w):
+        # One connection per request here, so one round trip of latency each
+        await asyncio.sleep(rtt_ms / 1000)
+        server_r, server_w = await asyncio.open_connection("127.0.0.1", port)
+        await asyncio.gather(pipe(client_r, server_w), pipe(server_r, client_w))
+
+    def run_proxy(ready: threading.Event):
+        async def main():
+            server = await asyncio.start_server(handle, "127.0.0.1", proxy_port)
+            ready.set()
+            async with server:
+                await server.serve_forever()
+        asyncio.run(main())
+
+    def fetch(path: str, headers: Dict) -> Tuple[int, int, Dict]:
+        conn = http.client.HTTPConnection("127.0.0.1", proxy_port, timeout=30)
+        conn.request("GET", path, headers=headers)
+        r = conn.getresponse()
+        body = r.read()
+        conn.close()
+        return r.status, len(body), {k.lower(): v for k, v in r.getheaders()}
+
+    def page_load(page: str, modern: bool, cache: Dict) -> Tuple[int, float, int]:
+        """One page plus the stylesheet it links: (bytes, seconds, requests)."""
+        headers = {"Accept-Encoding": "br, gzip" if modern else "identity"}
+        start = time.perf_counter()
+        total, requests = 0, 0
+        for path in [f"/{page}"] + css_links(page, modern):
+            if modern and path.startswith("/static/") and path in cache:
+                continue  # immutable: the browser doesn't ask
+            h = dict(headers)
+            if modern and path in cache:
+                h["If-None-Match"] = cache[path]
+            status, size, resp = fetch(path, h)
+            requests += 1
+            total += size
+            if "etag" in resp:
+                cache[path] = resp["etag"]
+        return total, time.perf_counter() - start, requests
+
+    def css_links(page: str, modern: bool) -> List[str]:
+        if not modern:
+            return ["/style.css"]
+        # Straight to the server: this is bookkeeping, not part of the page load
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.request("GET", f"/{page}")
+        html = conn.getresponse().read().decode()
+        conn.close()
+        return re.findall(r'href="(/static/[^"]+)"', html)
+
+    frontend = root / "PiDoorCam"
+    pages = sorted(p.name for p in frontend.glob("*.html"))
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PICAM_DATA_DIR=tmp, PICAM_CAMERAS=str(Path(tmp) / "no-cameras.json"),
+                   PICAM_REPLAY_MJPEG=str(Path(tmp) / "missing.mjpeg"))
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port),
+                                   "--log-level", "warning"], cwd=root, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        ready = threading.Event()
+        threading.Thread(target=run_proxy, args=(ready,), daemon=True).start()
+        ready.wait()
+        try:
+            for _ in range(100):
+                try:
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                    conn.request("GET", "/index.html")
+                    conn.getresponse().read()
+                    break
+                except OSError:
+                    time.sleep(0.2)
+            print(f"Link: {kbps} kbit/s, {rtt_ms} ms RTT; pages: {', '.join(pages)}")
+            for label, modern in (("before (full, uncompressed)", False), ("after", True)):
+                cache: Dict[str, str] = {}
+                first = [page_load(p, modern, cache) for p in pages]
+                repeat = [page_load(p, modern, cache) for p in pages]
+                for visit, loads in (("first visit", first), ("repeat visit", repeat)):
+                    size = sum(b for b, _, _ in loads)
+                    secs = sum(s for _, s, _ in loads)
+                    reqs = sum(r for _, _, r in loads)
+                    print(f"  {label:28s} {visit:13s} {size / 1024:7.1f} KB in {reqs:2d} requests, "
+                          f"{secs:5.2f} s total ({secs / len(pages) * 1000:.0f} ms/page)")
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kbps", type=int, default=1000)
+    parser.add_argument("--rtt", type=int, default=100)
+    args = parser.parse_args()
+    _bench(args.kbps, args.rtt)
@@ -0,0 +1,173 @@
+"""
+Background garbage collection for photos and replays.
+The "clear all" endpoints only mark rows as deleted (one quick UPDATE), and
+this worker thread deletes the actual files in batches afterwards. If the
+server dies halfway, the rows are still marked, so the next run finishes
+the job instead of leaving orphaned files behind.
+Every so often it also reconciles the data folders with the database:
+files nobody points to, and rows whose file is gone, get cleaned up.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import database
+from . import video_utils
+from .photo_store import PhotoStore
+
+
+class StorageGC:
+    """
+    Deletes files for tombstoned rows on a worker thread.
+    `on_progress` is called from that thread with a dict, main.py turns it
+    into a WebSocket message.
+    """
+
+    def __init__(
+        self,
+        data_dir: Path,
+        batch_size: int = 200,
+        workers: int = 4,
+        reconcile_interval: float = 3600.0,
+        orphan_grace: float = 600.0,
+    ):
+        self.photos = PhotoStore(data_dir)
+        self.replays_dir = Path(data_dir) / "replays"
+        self.batch_size = batch_size
+        self.workers = workers
+        self.reconcile_interval = reconcile_interval
+        # Files newer than this may still be waiting for their DB row (photo
+        # just written, replay still encoding), so reconcile leaves them alone
+        self.orphan_grace = orphan_grace
+
+        self.on_progress: Optional[Callable[[dict], None]] = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_progress: Optional[Callable[[dict], None]] = None):
+        if self._running:
+            return
+        self.on_progress = on_progress
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="StorageGC")
+        self._thread.start()
+        # Pick up anything left over from a previous run
+        self.wake()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+
+    def wake(self):
+        """Ask the worker to collect now instead of waiting for the next reconcile."""
+        self._wake.set()
+
+    def _run(self):
+        print("[StorageGC] Started")
+        last_reconcile = 0.0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="StorageGC-unlink") as pool:
+            while self._running:
+                try:
+                    if time.time() - last_reconcile >= self.reconcile_interval:
+                        self.reconcile()
+                        last_reconcile = time.time()
+                    self.collect(pool)
+                except Exception as e:
+                    print(f"[StorageGC] Error: {e}")
+                self._wake.wait(timeout=60)
+                self._wake.clear()
+        print("[StorageGC] Stopped")
+
+    def collect(self, pool: ThreadPoolExecutor):
+        """Delete files for all tombstoned rows, one batch at a time."""
+        for table in database.GC_TABLES:
+            total = database.count_tombstoned(table)
+            if not total:
+                continue
+            done = 0
+            while True:
+                rows = database.list_tombstoned(table, self.batch_size)
+                if not rows:
+                    break
+                unlink = self._unlink_photo if table == "photos" else self._unlink_replay
+                # SD card deletes are mostly waiting on I/O, so a few at once helps
+                list(pool.map(unlink, [r["path"] for r in rows]))
+                database.purge_rows(table, [r["id"] for r in rows])
+                done += len(rows)
+                self._report({"name": "gc_progress", "kind": table, "deleted": done, "total": total})
+            print(f"[StorageGC] Removed {done} {table}")
+            self._report({"name": "gc_done", "kind": table, "deleted": done})
+
+    def _unlink_photo(self, path: str):
+        # Rows store absolute paths from wherever the app ran at the time,
+        # so go by file name inside our own data folder
+        name = Path(path).name
+        try:
+            self.photos.remove(name)
+        except Exception as e:
+            print(f"[StorageGC] Error deleting photo {name}: {e}")
+
+    def _unlink_replay(self, path: str):
+        try:
+            video_utils.remove_replay_files(self.replays_dir / Path(path).name)
+        except Exception as e:
+            print(f"[StorageGC] Error deleting replay {Path(path).name}: {e}")
+
+    def reconcile(self):
+        """Remove files with no row and tombstone rows with no file."""
+        removed_files = 0
+        cutoff = time.time() - self.orphan_grace
+
+        photo_rows = database.list_live_paths("photos")
+        photo_names = {Path(r["path"]).name for r in photo_rows}
+        missing = [r["id"] for r in photo_rows if self.photos.resolve(Path(r["path"]).name) is None]
+        # Photos and thumbnails, in day folders and flat
+        removed_files += self._remove_orphans(self.photos.iter_files(), photo_names, cutoff)
+
+        replay_rows = database.list_live_paths("replays")
+        replay_names = {Path(r["path"]).name for r in replay_rows}
+        missing_replays = [r["id"] for r in replay_rows if not (self.replays_dir / Path(r["path"]).name).exists()]
+        removed_files += self._remove_orphans(self._glob(self.replays_dir, "*.mp4"), replay_names, cutoff)
+        poster_names = {f"{Path(n).stem}.jpg" for n in replay_names}
+        removed_files += self._remove_orphans(self._glob(self.replays_dir / "posters", "*.jpg"), poster_names, cutoff)
+
+        if missing:
+            database.tombstone_rows("photos", missing)
+        if missing_replays:
+            database.tombstone_rows("replays", missing_replays)
+        if removed_files or missing or missing_replays:
+            print(f"[StorageGC] Reconcile: {removed_files} orphaned files, "
+                  f"{len(missing) + len(missing_replays)} rows without files")
+            self._report({"name": "gc_reconciled", "files": removed_files,
+                          "rows": len(missing) + len(missing_replays)})
+
+    @staticmethod
+    def _glob(folder: Path, pattern: str):
+        return folder.glob(pattern) if folder.is_dir() else []
+
+    def _remove_orphans(self, files, known: set, cutoff: float) -> int:
+        removed = 0
+        for f in files:
+            if f.name in known:
+                continue
+            try:
+                if f.stat().st_mtime > cutoff:
+                    continue
+                f.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _report(self, msg: dict):
+        if self.on_progress:
+            try:
+                self.on_progress({"type": "event", **msg, "ts": int(time.time())})
+            except Exception:
+                pass
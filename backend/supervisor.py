@@ -0,0 +1,183 @@
+"""
+Keeps the camera running.
+Without this, if rpicam-vid dies (or wedges and stops sending frames) the
+reader thread just ends and the app keeps serving the last frame forever.
+
+The supervisor thread checks the streamer twice a second and restarts it when:
+  - the source has exited (rpicam-vid crashed, recording ended)
+  - no first frame arrived within `first_frame_timeout` (IMX500 firmware
+    upload normally takes ~30 s, so this is generous)
+  - frames were flowing but none came for `stall_timeout` seconds
+Restarts back off exponentially (1 s, 2 s, 4 s ... up to `max_backoff`), and
+the backoff resets once a run has stayed healthy for `stable_after` seconds.
+
+tests/test_supervisor.py runs it against a recording that stalls
+(FileReplaySource with stall_after) and checks the backoff schedule.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from . import metrics
+
+RESTARTS = metrics.counter("picam_restarts_total", "Camera restarts by reason", ("camera", "reason"))
+FIRST_FRAME_SECONDS = metrics.histogram(
+    "picam_time_to_first_frame_seconds", "Time from starting the camera to its first frame",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 45, 60, 90)
+)
+
+
+class StreamSupervisor:
+    def __init__(
+        self,
+        get_streamer: Callable,
+        stall_timeout: float = 10.0,
+        first_frame_timeout: float = 90.0,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        stable_after: float = 120.0,
+        check_interval: float = 0.5,
+        camera_id: str = "main",
+    ):
+        # A callable rather than the streamer itself, since Camera.stop() drops it and a new one gets built
+        self.get_streamer = get_streamer
+        self.camera_id = camera_id
+        self.stall_timeout = stall_timeout
+        self.first_frame_timeout = first_frame_timeout
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.check_interval = check_interval
+
+        self.on_state_change: Optional[Callable[[Dict], None]] = None
+        self.state = "stopped"
+        self.restart_count = 0
+        self.last_restart_reason: Optional[str] = None
+        self.last_restart_at: Optional[float] = None
+        self.time_to_first_frame: Optional[float] = None
+        self._backoff = initial_backoff
+        self._next_attempt = 0.0
+        self._first_frame_recorded = False
+        self._created_at = time.time()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, on_state_change: Optional[Callable[[Dict], None]] = None):
+        """Start the camera (retrying if that fails) and keep watching it."""
+        if self._running:
+            return
+        self.on_state_change = on_state_change
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"RPiCam-Supervisor-{self.camera_id}")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self._set_state("stopped")
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        print(f"[Supervisor] Camera {self.camera_id} {state}")
+        if self.on_state_change:
+            try:
+                self.on_state_change(self.stats())
+            except Exception as e:
+                print(f"[Supervisor] State callback failed: {e}")
+
+    def _run(self):
+        print("[Supervisor] Started")
+        while self._running:
+            try:
+                self._check()
+            except Exception as e:
+                print(f"[Supervisor] Error: {e}")
+            time.sleep(self.check_interval)
+        print("[Supervisor] Stopped")
+
+    def _check(self):
+        streamer = self.get_streamer()
+        now = time.time()
+
+        if not streamer.started:
+            # Never started, or the last start attempt failed
+            if now >= self._next_attempt:
+                self._start(streamer)
+            return
+
+        # Detection metadata can stop on its own (or with the frames): still end the tracks
+        streamer.age_tracks(now)
+
+        info = streamer.get_frame_info()
+        reason = None
+        if not streamer.source.is_alive():
+            code = streamer.source.exit_code
+            reason = "exited" if code is None else f"exited ({code})"
+        elif info["first_frame_at"] is None:
+            self._set_state("warming_up")
+            if info["started_at"] and now - info["started_at"] > self.first_frame_timeout:
+                reason = "no_frames"
+        elif info["last_frame_age"] is not None and info["last_frame_age"] > self.stall_timeout:
+            reason = "stalled"
+        else:
+            if not self._first_frame_recorded:
+                self._first_frame_recorded = True
+                self.time_to_first_frame = round(info["first_frame_at"] - info["started_at"], 2)
+                FIRST_FRAME_SECONDS.observe(self.time_to_first_frame)
+                print(f"[Supervisor] First frame after {self.time_to_first_frame}s")
+            self._set_state("streaming")
+            # Healthy for a while: the next failure starts with a short backoff again
+            if now - info["started_at"] > self.stable_after:
+                self._backoff = self.initial_backoff
+
+        if reason:
+            self._restart(streamer, reason)
+
+    def _start(self, streamer):
+        self._set_state("starting")
+        self._first_frame_recorded = False
+        try:
+            streamer.start()
+        except Exception as e:
+            # e.g. rpicam-vid not installed, camera busy - try again later
+            print(f"[Supervisor] Start failed: {e}, retrying in {self._backoff:.0f}s")
+            self._schedule_retry()
+            self._set_state("failed")
+
+    def _restart(self, streamer, reason: str):
+        log_tail = streamer.source.recent_log(limit=5)
+        print(f"[Supervisor] Restarting camera {self.camera_id}: {reason}")
+        for entry in log_tail:
+            print(f"[Supervisor]   {entry['line']}")
+        RESTARTS.inc(camera=self.camera_id, reason=reason.split(" ")[0])
+        self.restart_count += 1
+        self.last_restart_reason = reason
+        self.last_restart_at = time.time()
+        self._set_state("restarting")
+        streamer.stop()
+        # Wait out the backoff before the next start (checked in _check)
+        self._schedule_retry()
+
+    def _schedule_retry(self):
+        self._next_attempt = time.time() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def stats(self) -> Dict:
+        streamer = self.get_streamer()
+        info = streamer.get_frame_info()
+        started = info["started_at"] if streamer.started else None
+        return {
+            "camera": self.camera_id,
+            "state": self.state,
+            "uptime": round(time.time() - started, 1) if started else 0.0,
+            "restarts": self.restart_count,
+            "last_restart_reason": self.last_restart_reason,
+            "last_restart_at": self.last_restart_at,
+            "time_to_first_frame": self.time_to_first_frame,
+            "next_backoff": self._backoff,
+        }
+
@@ -0,0 +1,408 @@
+"""
+A timelapse per camera per day, built up during the day from the live stream,
+so reviewing a day is a few minutes of video instead of hundreds of snapshots.
+
+Every `interval` seconds the latest frame is sampled - every `active_interval`
+while someone is detected or there's motion, so the busy parts of the day get
+more of the video. Every `segment_frames` samples are encoded into a short
+segment:
+
+    timelapse/<camera>/2026-10-18/seg-1792300000000.mp4
+    timelapse/<camera>/2026-10-18/seg-1792300600000.mp4 ...
+
+and when the day is over its segments are joined into
+timelapse/<camera>/2026-10-18.mp4 with ffmpeg's concat demuxer - a stream copy,
+nothing is encoded again. So the encoding is a couple of seconds of work every
+few minutes, spread across the day, instead of one big encode at midnight.
+Segments go through their own one-worker scheduler pool, and ffmpeg runs at
+nice 19 with one thread, so live view, detections and event clips come first.
+
+Turn it on per camera in cameras.json: "timelapse": true, or e.g.
+{"interval": 10, "active_interval": 2, "segment_frames": 60, "fps": 25, "keep_days": 30};
+or PICAM_TIMELAPSE=1 (PICAM_TIMELAPSE_INTERVAL=10) for the default camera.
+Frames still waiting for their segment are lost on shutdown (at most one segment's worth).
+
+Demo - a simulated day, compared with encoding it all in one go at the end:
+    python -m backend.timelapse [--frames 1440]
+"""
+
+import asyncio
+import os
+import shutil
+import subprocess
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from . import metrics
+
+SEGMENT_SECONDS = metrics.histogram("timelapse_segment_seconds", "Time to encode one timelapse segment",
+                                    buckets=(0.5, 1, 2, 5, 10, 20, 60))
+SAMPLED_FRAMES = metrics.counter("timelapse_frames_total", "Frames sampled into timelapses", ("camera",))
+
+
+def _niced(cmd: List[str], nice: int) -> List[str]:
+    return ["nice", "-n", str(nice)] + cmd if nice and shutil.which("nice") else cmd
+
+
+def _part(path: Path) -> Path:
+    # Written under this name and renamed when complete, so a crash never leaves half a segment
+    return path.with_name(f"{path.stem}.part{path.suffix}")
+
+
+def encode_segment(frames: List[bytes], output_path: Path, fps: int = 25, nice: int = 19) -> Dict:
+    """JPEG frames -> an H.264 MP4 at a fixed frame rate (piped in, no temp files). Blocking."""
+    if not frames:
+        raise ValueError("No frames provided")
+    tmp = _part(output_path)
+    cmd = _niced([
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "image2pipe", "-framerate", str(fps), "-c:v", "mjpeg", "-i", "-",
+        # x264 needs even dimensions
+        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "26", "-pix_fmt", "yuv420p",
+        # One thread: the Pi has better things to do with the other cores
+        "-threads", "1", "-g", str(fps),
+        "-y", str(tmp),
+    ], nice)
+    try:
+        with SEGMENT_SECONDS.time():
+            subprocess.run(cmd, input=b"".join(frames), capture_output=True, timeout=60 + len(frames), check=True)
+    except subprocess.CalledProcessError as e:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.decode(errors='replace')[-500:]}")
+    except subprocess.TimeoutExpired:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError("ffmpeg segment encode timeout")
+    os.replace(tmp, output_path)
+    return {"frames": len(frames), "file_size": output_path.stat().st_size}
+
+
+def concat_segments(segments: List[Path], output_path: Path, nice: int = 19) -> Dict:
+    """Join MP4s with the same encoding into one, without re-encoding. Blocking."""
+    tmp = _part(output_path)
+    list_path = output_path.with_suffix(".txt")
+    list_path.write_text("".join(f"file '{p.resolve()}'\n" for p in segments))
+    cmd = _niced([
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "concat", "-safe", "0", "-i", str(list_path),
+        "-c", "copy", "-movflags", "+faststart",
+        "-y", str(tmp),
+    ], nice)
+    try:
+        subprocess.run(cmd, capture_output=True, timeout=600, check=True)
+    except subprocess.CalledProcessError as e:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"ffmpeg concat failed: {e.stderr.decode(errors='replace')[-500:]}")
+    finally:
+        list_path.unlink(missing_ok=True)
+    os.replace(tmp, output_path)
+    return {"segments": len(segments), "file_size": output_path.stat().st_size}
+
+
+def _segments_in(day_dir: Path) -> List[Path]:
+    # seg-<unix time in ms>.mp4, so sorting by name is sorting by time
+    return sorted(p for p in day_dir.glob("seg-*.mp4") if not p.name.endswith(".part.mp4"))
+
+
+def list_days(root: Path) -> List[Dict]:
+    """Finished days and the one(s) still being built, per camera, newest first. Reads the disk only."""
+    out = []
+    root = Path(root)
+    if not root.is_dir():
+        return out
+    for cam_dir in sorted(p for p in root.iterdir() if p.is_dir()):
+        days: Dict[str, Dict] = {}
+        for p in cam_dir.iterdir():
+            if p.is_file() and p.suffix == ".mp4" and ".part" not in p.name:
+                days.setdefault(p.stem, {})["file"] = p
+            elif p.is_dir():
+                days.setdefault(p.name, {})["segments"] = len(_segments_in(p))
+        for day, info in days.items():
+            f = info.get("file")
+            out.append({
+                "camera": cam_dir.name,
+                "day": day,
+                "path": f"/data/timelapse/{cam_dir.name}/{f.name}" if f else None,
+                "size": f.stat().st_size if f else None,
+                # Still being recorded (or waiting to be joined)
+                "pending_segments": info.get("segments", 0),
+            })
+    out.sort(key=lambda d: (d["day"], d["camera"]), reverse=True)
+    return out
+
+
+class TimelapseRecorder:
+    """
+    Samples one camera's stream into daily timelapses.
+    sample() is cheap (it only keeps the JPEG); segments are encoded and days
+    joined one job at a time in a background task, on the scheduler's
+    "timelapse" pool when there's a scheduler.
+    """
+
+    def __init__(
+        self,
+        output_dir: Path,
+        camera_id: str,
+        interval: float = 10.0,
+        active_interval: float = 2.0,
+        segment_frames: int = 60,
+        fps: int = 25,
+        keep_days: int = 30,
+        nice: int = 19,
+        max_pending: int = 8,
+        scheduler=None,
+    ):
+        self.output_dir = Path(output_dir) / camera_id
+        self.camera_id = camera_id
+        self.interval = interval
+        self.active_interval = min(active_interval, interval)
+        self.segment_frames = segment_frames
+        self.fps = fps
+        self.keep_days = keep_days
+        self.nice = nice
+        self.max_pending = max_pending
+        self.scheduler = scheduler
+
+        self._streamer = None
+        self._day: Optional[str] = None
+        self._frames: List[bytes] = []
+        self._first_ts = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending_segments = 0
+        self._tasks: List[asyncio.Task] = []
+        self.sampled = 0
+        self.active_samples = 0
+        self.segments = 0
+        self.dropped_segments = 0
+        self.last_error: Optional[str] = None
+
+    def start(self, streamer=None):
+        """Start the encoder task, and the sampling task if there's a streamer (call from the event loop)."""
+        self._streamer = streamer
+        self._tasks = [asyncio.create_task(self._encode_worker())]
+        if streamer is not None:
+            self._tasks.append(asyncio.create_task(self._sample_loop()))
+        # Days left unjoined by a restart (today's segments just carry on)
+        today = self.day_of(time.time())
+        if self.output_dir.is_dir():
+            for p in sorted(self.output_dir.iterdir()):
+                if p.is_dir() and p.name < today:
+                    self._queue.put_nowait(("finalize", p.name))
+        print(f"[Timelapse] {self.camera_id}: a frame every {self.interval:g}s "
+              f"({self.active_interval:g}s with activity), {self.segment_frames} frames per segment")
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    @staticmethod
+    def day_of(ts: float) -> str:
+        return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+    def _active(self) -> bool:
+        streamer = self._streamer
+        if streamer.get_detections():
+            return True
+        motion = streamer.get_motion()
+        return bool(motion and motion.get("motion"))
+
+    async def _sample_loop(self):
+        while True:
+            active = False
+            try:
+                # A camera that stopped sending frames shouldn't fill the day with the same picture
+                age = self._streamer.get_frame_info().get("last_frame_age")
+                if age is not None and age <= max(self.active_interval, 5.0):
+                    active = self._active()
+                    self.sample(self._streamer.get_frame(), time.time(), active)
+            except Exception as e:
+                print(f"[Timelapse] {self.camera_id}: sampling failed: {e}")
+            await asyncio.sleep(self.active_interval if active else self.interval)
+
+    def sample(self, frame: Optional[bytes], ts: float, active: bool = False):
+        """Add a frame taken at `ts`. A new day closes the old day's last segment and queues joining it."""
+        if not frame:
+            return
+        day = self.day_of(ts)
+        if self._day is not None and day != self._day:
+            self._cut_segment()
+            self._queue.put_nowait(("finalize", self._day))
+        self._day = day
+        if not self._frames:
+            self._first_ts = ts
+        self._frames.append(frame)
+        self.sampled += 1
+        self.active_samples += int(active)
+        SAMPLED_FRAMES.inc(camera=self.camera_id)
+        if len(self._frames) >= self.segment_frames:
+            self._cut_segment()
+
+    def _cut_segment(self):
+        frames, self._frames = self._frames, []
+        if not frames:
+            return
+        if self._pending_segments >= self.max_pending:
+            # Encoding can't keep up (CPU busy all day?) - lose a few minutes rather than pile up memory
+            self.dropped_segments += 1
+            print(f"[Timelapse] {self.camera_id}: encoder behind, dropping {len(frames)} frames")
+            return
+        self._pending_segments += 1
+        self._queue.put_nowait(("segment", self._day, self._first_ts, frames))
+
+    async def flush(self):
+        """Encode what's been sampled so far and wait for the queue to drain."""
+        self._cut_segment()
+        await self._queue.join()
+
+    async def _run(self, fn, *args):
+        if self.scheduler is not None:
+            return await self.scheduler.run("timelapse", fn, *args)
+        return await asyncio.to_thread(fn, *args)
+
+    async def _encode_worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                if job[0] == "segment":
+                    _, day, first_ts, frames = job
+                    self._pending_segments -= 1
+                    await self._run(self._encode, day, first_ts, frames)
+                else:
+                    await self._run(self.finalize_day, job[1])
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[Timelapse] {self.camera_id}: {job[0]} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _encode(self, day: str, first_ts: float, frames: List[bytes]):
+        day_dir = self.output_dir / day
+        day_dir.mkdir(parents=True, exist_ok=True)
+        encode_segment(frames, day_dir / f"seg-{int(first_ts * 1000)}.mp4", self.fps, self.nice)
+        self.segments += 1
+
+    def finalize_day(self, day: str) -> Optional[Dict]:
+        """Join a day's segments into <day>.mp4 and delete them. Blocking."""
+        day_dir = self.output_dir / day
+        segments = _segments_in(day_dir) if day_dir.is_dir() else []
+        out = self.output_dir / f"{day}.mp4"
+        if not segments:
+            shutil.rmtree(day_dir, ignore_errors=True)
+            return None
+        # Joined before, and more segments turned up since (clock change, restart): keep what's there
+        inputs = ([out] if out.exists() else []) + segments
+        info = concat_segments(inputs, out, self.nice)
+        shutil.rmtree(day_dir, ignore_errors=True)
+        print(f"[Timelapse] {self.camera_id}: {day} done, {len(segments)} segments, {info['file_size'] / 1e6:.1f} MB")
+        self._prune()
+        return info
+
+    def _prune(self):
+        days = sorted(p for p in self.output_dir.glob("*.mp4") if ".part" not in p.name)
+        for p in days[:max(len(days) - self.keep_days, 0)]:
+            p.unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        return {
+            "interval": self.interval,
+            "active_interval": self.active_interval,
+            "sampled": self.sampled,
+            "active_samples": self.active_samples,
+            "buffered_frames": len(self._frames),
+            "segments": self.segments,
+            "queued": self._queue.qsize(),
+            "dropped_segments": self.dropped_segments,
+            "last_error": self.last_error,
+        }
+
+
+def _demo(frames_per_day: int = 1440):
+    """
+    Sample a simulated day (and the first frames of the next) from a synthetic
+    recording, then compare the incremental encode with one encode of the
+    whole day: the biggest single chunk of work, and total CPU.
+    """
+    import io
+    import resource
+    import tempfile
+
+    from PIL import Image
+
+    from .pipeline_bench import generate_recording
+
+    if not shutil.which("ffmpeg"):
+        print("ffmpeg not installed")
+        return
+
+    def children_cpu() -> float:
+        r = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return r.ru_utime + r.ru_stime
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mjpeg, _ = generate_recording(Path(tmp) / "rec", seconds=20)
+        data = mjpeg.read_bytes()
+        frames, pos = [], 0
+        while True:
+            end = data.find(b"\xff\xd9", pos)
+            if end < 0:
+                break
+            frames.append(data[pos:end + 2])
+            pos = end + 2
+        w, h = Image.open(io.BytesIO(frames[0])).size
+        # The person walks across in the middle 40% of the recording
+        walking = range(int(len(frames) * 0.3), int(len(frames) * 0.7))
+
+        recorder = TimelapseRecorder(Path(tmp) / "timelapse", "demo")
+        day_start = time.mktime(time.strptime("2026-10-17", "%Y-%m-%d"))
+        step = 86400 / frames_per_day
+
+        async def run():
+            recorder.start()
+            cpu0 = children_cpu()
+            ts, i = day_start, 0
+            while ts < day_start + 86400 + 60:
+                active = (i % len(frames)) in walking
+                recorder.sample(frames[i % len(frames)], ts, active)
+                ts += step / 5 if active else step
+                i += 1
+                if not recorder._frames:
+                    # A segment was just cut: in real life there are minutes until the next one
+                    await recorder._queue.join()
+            await recorder.flush()
+            recorder.stop()
+            return children_cpu() - cpu0
+
+        cpu = asyncio.run(run())
+        day_file = recorder.output_dir / "2026-10-17.mp4"
+        summary = SEGMENT_SECONDS.summary()
+        print(f"{w}x{h} frames, one every {step:.0f}s ({step / 5:.0f}s with activity): "
+              f"{recorder.sampled} samples, {recorder.active_samples} during activity")
+        print(f"  incremental: {recorder.segments} segments, {summary.get('mean', 0):.2f}s each on average "
+              f"(<= {summary.get('p99')}s), then a stream-copy join; ffmpeg CPU {cpu:.1f}s total")
+        print(f"  day file {day_file.name}: {day_file.stat().st_size / 1e6:.1f} MB, "
+              f"segments left for the next day: {[d['pending_segments'] for d in list_days(recorder.output_dir.parent) if d['day'] == '2026-10-18']}")
+
+        # The alternative: keep every sample and encode the day in one go at midnight
+        day_frames = []
+        ts, i = day_start, 0
+        while ts < day_start + 86400:
+            active = (i % len(frames)) in walking
+            day_frames.append(frames[i % len(frames)])
+            ts += step / 5 if active else step
+            i += 1
+        cpu0 = children_cpu()
+        started = time.perf_counter()
+        encode_segment(day_frames, Path(tmp) / "whole-day.mp4", recorder.fps, recorder.nice)
+        print(f"  whole day at once: one {time.perf_counter() - started:.1f}s encode, "
+              f"ffmpeg CPU {children_cpu() - cpu0:.1f}s, holding {sum(map(len, day_frames)) / 1e6:.0f} MB of JPEGs")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=1440, help="samples per simulated day without activity")
+    args = parser.parse_args()
+    _demo(args.frames)
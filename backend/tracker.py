@@ -0,0 +1,229 @@
+"""
+Lightweight multi-person tracker (IoU + centroid matching in NumPy).
+Every detection frame is matched against the people we are already tracking,
+so each person keeps the same track ID while they're in view. A missed frame
+or two doesn't end the track, and two people are two tracks.
+
+The tracker emits "enter" when a track is confirmed (seen in a few frames in a
+row, like the old consecutive-frame check) and "exit" when it disappears, so
+events and photos can be logged once per person instead of every few seconds.
+
+Replay a recorded metadata log (rpicam-vid --metadata output) through the
+parser + tracker with:
+    python -m backend.tracker /tmp/imx500_stream_detections.json [--fps 15]
+tests/test_tracker.py does the same with a short recording in tests/fixtures/.
+"""
+
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU between every box in a (N,4) and b (M,4), boxes as [x1, y1, x2, y2]."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def _greedy_match(score: np.ndarray, min_score: float) -> List[Tuple[int, int]]:
+    """Best pairs first; each row and column used at most once."""
+    pairs = []
+    if score.size == 0:
+        return pairs
+    order = np.argsort(-score, axis=None)
+    used_rows, used_cols = set(), set()
+    for flat in order:
+        r, c = divmod(int(flat), score.shape[1])
+        if score[r, c] < min_score:
+            break
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        pairs.append((r, c))
+    return pairs
+
+
+class Track:
+    def __init__(self, track_id: int, bbox: np.ndarray, confidence: float, ts: float):
+        self.id = track_id
+        self.bbox = bbox.astype(np.float32)
+        self.confidence = confidence
+        self.max_confidence = confidence
+        self.first_seen = ts
+        self.last_seen = ts
+        self.hits = 1
+        self.confirmed = False
+
+    def update(self, bbox: np.ndarray, confidence: float, ts: float, smoothing: float):
+        # Exponential smoothing keeps the box from jittering frame to frame
+        self.bbox = smoothing * self.bbox + (1 - smoothing) * bbox
+        self.confidence = confidence
+        self.max_confidence = max(self.max_confidence, confidence)
+        self.last_seen = ts
+        self.hits += 1
+
+    def to_detection(self) -> Dict:
+        return {
+            'class': 'person',
+            'class_id': 0,
+            'track_id': self.id,
+            'confidence': round(float(self.confidence), 2),
+            'bbox': [round(float(v), 3) for v in self.bbox],
+        }
+
+
+class PersonTracker:
+    """
+    Call update() once per metadata frame with that frame's detections.
+    It returns the confirmed tracks (as detection dicts with a track_id) and
+    any enter/exit events that happened on this frame.
+    """
+
+    def __init__(
+        self,
+        min_hits: int = 3,
+        max_gap: float = 1.5,
+        iou_threshold: float = 0.3,
+        max_centroid_distance: float = 0.15,
+        smoothing: float = 0.5,
+        report_gap: float = 0.5,
+    ):
+        self.min_hits = min_hits  # frames in a row before a new track counts (false positive filter)
+        self.max_gap = max_gap  # seconds a confirmed track survives without detections
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance  # fallback for fast movers (normalized units)
+        self.smoothing = smoothing
+        self.report_gap = report_gap  # confirmed tracks missed for less than this are still drawn
+        self._tracks: List[Track] = []
+        self._next_id = 1
+
+    def has_tracks(self) -> bool:
+        return bool(self._tracks)
+
+    def update(self, detections: List[Dict], ts: Optional[float] = None) -> Tuple[List[Dict], List[Dict]]:
+        ts = ts if ts is not None else time.time()
+        events: List[Dict] = []
+
+        det_boxes = np.array([d['bbox'] for d in detections], dtype=np.float32).reshape(-1, 4)
+        det_conf = [d.get('confidence', 0.0) for d in detections]
+        track_boxes = np.array([t.bbox for t in self._tracks], dtype=np.float32).reshape(-1, 4)
+
+        # 1) match on overlap
+        pairs = _greedy_match(iou_matrix(track_boxes, det_boxes), self.iou_threshold)
+        matched_tracks = {r for r, _ in pairs}
+        matched_dets = {c for _, c in pairs}
+
+        # 2) leftovers: match on centroid distance (someone moving fast between frames)
+        rest_t = [i for i in range(len(self._tracks)) if i not in matched_tracks]
+        rest_d = [j for j in range(len(detections)) if j not in matched_dets]
+        if rest_t and rest_d:
+            ct = (track_boxes[rest_t, :2] + track_boxes[rest_t, 2:]) / 2
+            cd = (det_boxes[rest_d, :2] + det_boxes[rest_d, 2:]) / 2
+            dist = np.linalg.norm(ct[:, None, :] - cd[None, :, :], axis=2)
+            closeness = 1.0 - dist / self.max_centroid_distance
+            for r, c in _greedy_match(closeness, 0.0):
+                pairs.append((rest_t[r], rest_d[c]))
+                matched_tracks.add(rest_t[r])
+                matched_dets.add(rest_d[c])
+
+        for r, c in pairs:
+            track = self._tracks[r]
+            track.update(det_boxes[c], det_conf[c], ts, self.smoothing)
+            if not track.confirmed and track.hits >= self.min_hits:
+                track.confirmed = True
+                events.append({"type": "enter", "track_id": track.id, "ts": ts,
+                               "detection": track.to_detection()})
+
+        # Drop tracks we've lost. Unconfirmed ones go on their first miss
+        # (that's the "consecutive frames" false-positive filter).
+        kept = []
+        for i, track in enumerate(self._tracks):
+            if i in matched_tracks:
+                kept.append(track)
+            elif track.confirmed and ts - track.last_seen <= self.max_gap:
+                kept.append(track)
+            elif track.confirmed:
+                events.append({"type": "exit", "track_id": track.id, "ts": ts,
+                               "duration": round(track.last_seen - track.first_seen, 2),
+                               "max_confidence": round(float(track.max_confidence), 2)})
+        self._tracks = kept
+
+        for j in range(len(detections)):
+            if j not in matched_dets:
+                self._tracks.append(Track(self._next_id, det_boxes[j], det_conf[j], ts))
+                self._next_id += 1
+                if self.min_hits <= 1:
+                    self._tracks[-1].confirmed = True
+                    events.append({"type": "enter", "track_id": self._tracks[-1].id, "ts": ts,
+                                   "detection": self._tracks[-1].to_detection()})
+
+        visible = [t.to_detection() for t in self._tracks
+                   if t.confirmed and ts - t.last_seen <= self.report_gap]
+        return visible, events
+
+
+def replay_metadata_log(path: str, fps: float = 15.0, tracker: Optional[PersonTracker] = None) -> Dict:
+    """
+    Run a recorded rpicam-vid metadata file through the detection parser and
+    the tracker. Frames are timed at `fps` since the log has no timestamps.
+    Returns the events plus some counts, so tracker changes can be compared
+    on the same recording.
+    """
+    from .rpicam_streaming import parse_person_detections
+
+    tracker = tracker or PersonTracker()
+    events = []
+    frames = frames_with_people = 0
+    with open(path) as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if not line or line in ('[', ']'):
+                continue
+            try:
+                frame_data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            tensor = frame_data.get("CnnOutputTensor") if isinstance(frame_data, dict) else None
+            if not tensor or len(tensor) < 600:
+                continue
+            ts = frames / fps
+            frames += 1
+            visible, frame_events = tracker.update(parse_person_detections(tensor), ts)
+            frames_with_people += bool(visible)
+            events.extend(frame_events)
+    # Close out whoever is still in view at the end of the log
+    _, final_events = tracker.update([], frames / fps + tracker.max_gap + 1)
+    events.extend(final_events)
+    return {
+        "frames": frames,
+        "frames_with_people": frames_with_people,
+        "tracks": sum(1 for e in events if e["type"] == "enter"),
+        "events": events,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay a recorded metadata log through the person tracker")
+    parser.add_argument("log", help="rpicam-vid --metadata JSON file")
+    parser.add_argument("--fps", type=float, default=15.0)
+    args = parser.parse_args()
+
+    result = replay_metadata_log(args.log, args.fps)
+    for e in result["events"]:
+        extra = f" duration={e['duration']}s" if e["type"] == "exit" else ""
+        print(f"[{e['ts']:8.2f}s] track {e['track_id']} {e['type']}{extra}")
+    print(f"{result['frames']} frames, {result['frames_with_people']} with people, {result['tracks']} tracks")
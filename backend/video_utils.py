@@ -2,41 +2,110 @@
 This file handles turning a bunch of JPEG frames into an MP4 video file.
 We use ffmpeg for the heavy lifting because it's fast and reliable.
 """
+import io
 import subprocess
 import tempfile
 import os
 from pathlib import Path
 from typing import List, Tuple
 
+
+from . import metrics
+
+ENCODE_SECONDS = metrics.histogram("video_encode_seconds", "ffmpeg MP4 encode time per clip",
+                                   buckets=(0.5, 1, 2, 5, 10, 20, 30, 60))
+ENCODED_FRAMES = metrics.counter("video_encoded_frames_total", "Frames written into MP4 clips")
+ENCODE_FAILURES = metrics.counter("video_encode_failures_total", "ffmpeg encodes that failed or timed out")
+
+
+# Posters live next to the clips: replays/posters/<clip name>.jpg
+def poster_path_for(video_path: Path) -> Path:
+    video_path = Path(video_path)
+    return video_path.parent / "posters" / f"{video_path.stem}.jpg"
+
+
+# Save a small JPEG preview for a clip so the replays page can show it
+# without the browser having to fetch any of the MP4
+def save_poster(jpeg_bytes: bytes, poster_path: Path, size=(480, 270)) -> None:
+    from PIL import Image  # only needed here, keep it out of the app's import time
+
+    poster_path.parent.mkdir(parents=True, exist_ok=True)
+    img = Image.open(io.BytesIO(jpeg_bytes))
+    img.thumbnail(size)
+    img.save(poster_path, format="JPEG", quality=75)
+
+
+# Delete a replay clip and its poster (missing files are fine)
+def remove_replay_files(video_path) -> None:
+    video_path = Path(video_path)
+    video_path.unlink(missing_ok=True)
+    poster_path_for(video_path).unlink(missing_ok=True)
+
+
+# Work out how long each frame should stay on screen, using the real capture
+# timestamps. Gaps (dropped frames) and bursts are kept as they happened.
+def frame_durations(timestamps: List[float], fps: float = 15) -> List[float]:
+    """
+    Turns capture timestamps into per-frame display durations (seconds).
+    The last frame has no "next" timestamp, so it gets the median gap
+    (or 1/fps if there is only one frame).
+    """
+    nominal = 1.0 / fps if fps else 0.0
+    gaps = [b - a for a, b in zip(timestamps, timestamps[1:])]
+    # Clock jumps backwards or duplicate timestamps shouldn't give zero/negative durations
+    gaps = [g if g > 0 else nominal for g in gaps]
+    if gaps:
+        tail = sorted(gaps)[len(gaps) // 2]
+    else:
+        tail = nominal
+    return gaps + [tail]
+
+
 # Take a list of (timestamp, jpeg_bytes) frames and make an MP4 video
-def frames_to_mp4(frames: List[Tuple[int, bytes]], output_path: Path, fps: int = 5) -> dict:
+def frames_to_mp4(frames: List[Tuple[float, bytes]], output_path: Path, fps: int = 5) -> dict:
     """
-    Converts a list of JPEG frames into an MP4 using ffmpeg.
+    Converts a list of JPEG frames into a variable-frame-rate MP4 using ffmpeg.
+    Each frame is shown for as long as it really lasted (based on its capture
+    timestamp), so dropped or bursty frames don't change the playback speed.
     Args:
-        frames: List of (timestamp, jpeg_bytes) tuples
+        frames: List of (timestamp, jpeg_bytes) tuples, timestamps in float seconds
         output_path: Where to save the MP4
-        fps: Frames per second for the video
+        fps: Nominal camera frame rate, only used to time the very last frame
     Returns:
-        Dictionary with duration, frame_count, and file_size
+        Dictionary with duration (float seconds), frame_count, and file_size
     """
     if not frames:
         raise ValueError("No frames provided")
 
+    durations = frame_durations([float(ts) for ts, _ in frames], fps)
+
     # We'll use a temp folder to store the JPEGs before encoding
     with tempfile.TemporaryDirectory() as tmpdir:
         tmpdir_path = Path(tmpdir)
 
-        # Write each frame as a numbered JPEG file
-        for i, (ts, jpeg_bytes) in enumerate(frames):
+        # Write each frame as a numbered JPEG file, plus a concat list that
+        # tells ffmpeg how long each one lasts
+        concat_lines = ["ffconcat version 1.0"]
+        for i, ((ts, jpeg_bytes), dur) in enumerate(zip(frames, durations)):
             frame_path = tmpdir_path / f"frame_{i:05d}.jpg"
             with open(frame_path, 'wb') as f:
                 f.write(jpeg_bytes)
+            concat_lines.append(f"file '{frame_path.name}'")
+            concat_lines.append(f"duration {dur:.6f}")
+        # The concat demuxer ignores the duration of the last entry unless
+        # the file is listed once more at the end
+        concat_lines.append(f"file 'frame_{len(frames) - 1:05d}.jpg'")
+
+        concat_path = tmpdir_path / "frames.ffconcat"
+        concat_path.write_text("\n".join(concat_lines) + "\n")
 
         # Build the ffmpeg command to make the MP4
         cmd = [
             'ffmpeg',
-            '-framerate', str(fps),
-            '-i', str(tmpdir_path / 'frame_%05d.jpg'),
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', str(concat_path),
+            '-vsync', 'vfr',  # keep the real frame timing, don't dup/drop to a fixed rate
             '-c:v', 'libx264',
             '-preset', 'fast',
             '-crf', '23',
@@ -47,26 +116,36 @@ def frames_to_mp4(frames: List[Tuple[int, bytes]], output_path: Path, fps: int =
         ]
 
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=30,
-                check=True
-            )
+            with ENCODE_SECONDS.time():
+                result = subprocess.run(
+                    cmd,
+                    capture_output=True,
+                    text=True,
+                    timeout=30,
+                    check=True
+                )
         except subprocess.CalledProcessError as e:
+            ENCODE_FAILURES.inc()
             raise RuntimeError(f"ffmpeg failed: {e.stderr}")
         except subprocess.TimeoutExpired:
+            ENCODE_FAILURES.inc()
             raise RuntimeError("ffmpeg encoding timeout")
+        ENCODED_FRAMES.inc(len(frames))
+
+    # Poster frame from the middle of the clip - we already have it as a JPEG,
+    # so there's no need to decode the MP4 again
+    try:
+        save_poster(frames[len(frames) // 2][1], poster_path_for(output_path))
+    except Exception as e:
+        print(f"[video_utils] Poster failed for {output_path.name}: {e}")
 
     # Get info about the finished video
     file_size = output_path.stat().st_size
     frame_count = len(frames)
-    duration = int(frame_count / fps)
+    duration = round(sum(durations), 3)
 
     return {
         'duration': duration,
         'frame_count': frame_count,
         'file_size': file_size
     }
-    frame_count = len(frames)
@@ -0,0 +1,80 @@
+"""
+Shared worker pools for the heavy per-camera work.
+Every camera wants to encode clips (ffmpeg) and save photos (PIL + disk +
+SQLite). With asyncio.to_thread each of those grabs a thread from the default
+executor, so two cameras seeing the same person = two ffmpegs plus a burst of
+thumbnailing all at once on a 4-core Pi. Instead all cameras queue their work
+here, into a small fixed pool per kind of work:
+
+  encode    - MP4 encodes for replays and event clips (1 at a time)
+  capture   - photo + thumbnail writes (2 at a time)
+  timelapse - timelapse segments (1 at a time, ffmpeg at nice 19), so they
+              never hold up a clip
+  recognition - embedding person crops for known-person matching (1 at a time)
+
+Usage from the event loop:
+    metadata = await scheduler.run("encode", video_utils.frames_to_mp4, frames, path, fps)
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from . import metrics
+
+DEFAULT_LIMITS = {"encode": 1, "capture": 2, "timelapse": 1, "recognition": 1}
+
+WORK_WAIT_SECONDS = metrics.histogram("work_wait_seconds", "Time work waited for a free worker", ("kind",))
+WORK_RUN_SECONDS = metrics.histogram("work_run_seconds", "Time work took once it ran", ("kind",))
+
+
+class WorkScheduler:
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = dict(limits or DEFAULT_LIMITS)
+        self._pools = {
+            kind: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"Work-{kind}")
+            for kind, n in self.limits.items()
+        }
+        self._pending = {kind: 0 for kind in self.limits}
+        self._lock = threading.Lock()
+        metrics.gauge("work_pending", "Queued plus running work items", ("kind",),
+                      callback=lambda: dict(self._pending))
+
+    async def run(self, kind: str, fn: Callable, *args, **kwargs):
+        """Run a blocking fn(*args, **kwargs) on the `kind` pool and await its result."""
+        pool = self._pools.get(kind)
+        if pool is None:
+            raise ValueError(f"Unknown work kind {kind!r} (have {sorted(self._pools)})")
+        queued_at = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            WORK_WAIT_SECONDS.observe(started - queued_at, kind=kind)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                WORK_RUN_SECONDS.observe(time.perf_counter() - started, kind=kind)
+
+        with self._lock:
+            self._pending[kind] += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, job)
+        finally:
+            with self._lock:
+                self._pending[kind] -= 1
+
+    def stats(self) -> Dict:
+        return {
+            kind: {
+                "workers": self.limits[kind],
+                "pending": self._pending[kind],
+                "wait": WORK_WAIT_SECONDS.summary(kind=kind),
+            }
+            for kind in self.limits
+        }
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -4,4 +4,15 @@ set -euo pipefail
 ROOT_DIR="$(cd "$(dirname "$0")" && pwd)"
 cd "$ROOT_DIR"
 source backend/venv/bin/activate
-exec uvicorn backend.main:app --host 0.0.0.0 --port 8080
+
+# PICAM_WORKERS=4 ./run.sh: one capture process plus 4 uvicorn workers sharing
+# its frames through shared memory (backend/frame_bus.py)
+WORKERS="${PICAM_WORKERS:-1}"
+if [ "$WORKERS" -gt 1 ]; then
+    python -m backend.capture &
+    CAPTURE_PID=$!
+    trap 'kill $CAPTURE_PID 2>/dev/null || true' EXIT
+    PICAM_ROLE=web uvicorn backend.main:app --host 0.0.0.0 --port 8080 --workers "$WORKERS"
+else
+    exec uvicorn backend.main:app --host 0.0.0.0 --port 8080
+fi
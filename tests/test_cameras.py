@@ -0,0 +1,142 @@
+"""
+Several cameras from one config: CameraRegistry.from_config parsing, and
+the app run with two fake (FileReplaySource) cameras - per-camera routes
+and per-camera metric labels.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+from backend.cameras import DEFAULT_ID, CameraRegistry
+from backend.frame_sources import FileReplaySource, RPiCamVidSource
+
+
+def _write(path, entries):
+    path.write_text(json.dumps(entries))
+    return path
+
+
+def test_from_config_parses_every_entry(tmp_path):
+    from backend.pipeline_bench import generate_recording
+
+    generate_recording(tmp_path / "rec", seconds=1)
+    config = _write(tmp_path / "cameras.json", [
+        {"id": "door", "camera": 0, "name": "Front door"},
+        {"id": "garden", "camera": 1, "zones": str(tmp_path / "zones-garden.json"), "h264": True,
+         "framerate": 10, "timelapse": True},
+        {"id": "test", "replay": str(tmp_path / "rec.mjpeg"), "metadata": str(tmp_path / "rec.json"),
+         "timelapse": {"interval": 5}},
+    ])
+    registry = CameraRegistry.from_config(config)
+    assert registry.ids() == ["door", "garden", "test"]
+    assert registry.default.id == "door"
+
+    door, garden, test = registry
+    assert door.name == "Front door" and garden.name == "garden"
+    assert door.timelapse is None
+    assert garden.zones_file == tmp_path / "zones-garden.json"
+    assert garden.streamer_options == {"framerate": 10, "h264": True}
+    assert garden.timelapse == {}
+    assert test.timelapse == {"interval": 5}
+    # Each camera writes its own detections file
+    assert len({c.metadata_file for c in registry}) == 3
+
+    assert isinstance(test.make_source(), FileReplaySource)
+    source = garden.make_source()
+    assert isinstance(source, RPiCamVidSource)
+    # Nothing was built yet (that's the bring-up's job)
+    assert not any(c.created for c in registry)
+
+
+def test_from_config_rejects_bad_lists(tmp_path):
+    with pytest.raises(ValueError):
+        CameraRegistry.from_config(_write(tmp_path / "dup.json", [{"id": "a", "camera": 0}, {"id": "a", "camera": 1}]))
+    with pytest.raises(ValueError):
+        CameraRegistry.from_config(_write(tmp_path / "empty.json", []))
+
+
+def test_no_config_is_one_default_camera(tmp_path):
+    registry = CameraRegistry.from_config(tmp_path / "missing.json")
+    assert registry.ids() == [DEFAULT_ID]
+
+
+@pytest.fixture(scope="module")
+def app_client(tmp_path_factory):
+    """The whole app on two fake cameras. main.py reads its config at import, so it's imported here."""
+    from fastapi.testclient import TestClient
+
+    from backend.pipeline_bench import generate_recording
+
+    tmp = tmp_path_factory.mktemp("two-cameras")
+    mjpeg, meta = generate_recording(tmp / "rec", seconds=4)
+    config = _write(tmp / "cameras.json", [
+        {"id": "door", "replay": str(mjpeg), "metadata": str(meta)},
+        {"id": "garden", "name": "Garden", "replay": str(mjpeg), "metadata": str(meta)},
+    ])
+    saved = {k: os.environ.get(k) for k in ("PICAM_CAMERAS", "PICAM_DATA_DIR")}
+    os.environ["PICAM_CAMERAS"] = str(config)
+    os.environ["PICAM_DATA_DIR"] = str(tmp / "data")
+    # database.py may have been imported already, with the default data dir
+    from backend import database
+    (tmp / "data").mkdir()
+    saved_db = database.DB_PATH, database._initialized
+    database.DB_PATH, database._initialized = tmp / "data" / "database.db", False
+    try:
+        import backend.main as main
+        assert main.cameras.ids() == ["door", "garden"], "backend.main was imported before this fixture"
+        with TestClient(main.app) as client:
+            deadline = time.time() + 30
+            while time.time() < deadline:
+                if all(client.get(f"/cam/{c}/frame").status_code == 200 for c in ("door", "garden")):
+                    break
+                time.sleep(0.2)
+            yield client
+    finally:
+        database.DB_PATH, database._initialized = saved_db
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def test_per_camera_routes(app_client):
+    cams = app_client.get("/api/cameras").json()
+    assert cams["default"] == "door"
+    assert [c["id"] for c in cams["cameras"]] == ["door", "garden"]
+    assert cams["cameras"][1]["name"] == "Garden"
+
+    for cam in ("door", "garden"):
+        r = app_client.get(f"/cam/{cam}/frame")
+        assert r.status_code == 200 and r.headers["content-type"] == "image/jpeg"
+        assert app_client.get(f"/api/cam/{cam}/log").status_code == 200
+    assert app_client.get("/cam/nope/frame").status_code == 404
+    # The original routes are the default camera
+    assert app_client.get("/camera/frame").status_code == 200
+
+    r = app_client.post("/api/cam/garden/photo")
+    assert r.status_code == 200
+    photos = app_client.get("/api/photos").json()
+    assert photos[0]["camera"] == "garden"
+
+    health = app_client.get("/api/health").json()
+    assert set(health["cameras"]) == {"door", "garden"}
+    assert health["camera"]["id"] == "door"
+
+
+def test_per_camera_metric_labels(app_client):
+    # The recording's person walks in after a second or so: wait until both cameras decoded some
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        text = app_client.get("/metrics").text
+        if all(f'picam_detection_seconds_count{{camera="{cam}"}}' in text for cam in ("door", "garden")):
+            break
+        time.sleep(0.3)
+    for cam in ("door", "garden"):
+        assert f'picam_frames_total{{camera="{cam}"}}' in text
+        assert f'picam_metadata_frames_total{{camera="{cam}",result="decoded"}}' in text
+        assert f'picam_detection_seconds_count{{camera="{cam}"}}' in text
+        assert f'picam_motion_seconds_count{{camera="{cam}"}}' in text
@@ -0,0 +1,133 @@
+"""
+Recognition with the stub embedder and synthetic images/vectors: enrolling,
+matching above the threshold, rejecting below it, and the memory-mapped
+index surviving a reload.
+"""
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+from backend import database
+from backend.recognition import EmbeddingIndex, Recognizer, StubEmbedder
+
+BBOX = [300 / 640, 200 / 480, 396 / 640, 392 / 480]
+
+
+def person(seed):
+    # A blocky pattern per person, so the stub's 16x16 thumbnails differ
+    blocks = np.random.default_rng(seed).integers(0, 255, (8, 4, 3), dtype=np.uint8)
+    return cv2.resize(blocks, (96, 192), interpolation=cv2.INTER_NEAREST)
+
+
+def frame_with(img, noise_seed=0):
+    """A 640x480 JPEG with `img` (a little noisier) where BBOX is."""
+    frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+    noise = np.random.default_rng(noise_seed).integers(-12, 12, img.shape)
+    frame[200:392, 300:396] = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "database.db")
+    monkeypatch.setattr(database, "_initialized", False)
+    database.init_db()
+    return tmp_path
+
+
+@pytest.fixture
+def recognizer(db):
+    """alice and bob enrolled with two images each, index built with the stub."""
+    root = db / "enrollments"
+    for name, seed in (("alice", 1), ("bob", 2)):
+        eid = database.add_enrollment(name)
+        (root / str(eid)).mkdir(parents=True)
+        for i in range(2):
+            path = root / str(eid) / f"{i}.jpg"
+            cv2.imwrite(str(path), person(seed))
+            database.add_enrollment_image(eid, path)
+    rec = Recognizer("stub", root, threshold=0.8)
+    rec.load(StubEmbedder())
+    return rec
+
+
+def test_enroll_builds_the_index(recognizer):
+    assert len(recognizer.index) == 4
+    assert sorted(recognizer.names.values()) == ["alice", "bob"]
+    assert recognizer.index.model == "stub"
+    # Nothing new: a second sync embeds nothing
+    assert recognizer.sync()["added"] == 0
+
+
+def test_match_above_threshold(recognizer):
+    alice = recognizer.identify("door", 1, frame_with(person(1)), BBOX)
+    bob = recognizer.identify("door", 2, frame_with(person(2), noise_seed=5), BBOX)
+    assert alice["name"] == "alice" and alice["score"] >= 0.8
+    assert bob["name"] == "bob" and bob["score"] >= 0.8
+    assert alice["enrollment_id"] != bob["enrollment_id"]
+    # Same track again: from the cache, no second embedding
+    embedded = recognizer.counts["embedded"]
+    assert recognizer.identify("door", 1, frame_with(person(1), noise_seed=9), BBOX) == alice
+    assert recognizer.counts["embedded"] == embedded
+    assert recognizer.known("door", 1) == alice
+
+
+def test_reject_below_threshold(recognizer):
+    frame = frame_with(person(99))
+    best = recognizer.index.search(recognizer.embedder.embed([person(99)]), 1)[0][0]
+    assert best[2] < recognizer.threshold
+    assert recognizer.identify("door", 3, frame, BBOX) is None
+    # Remembered as "nobody we know" (None), not "not asked yet" (False)
+    assert recognizer.known("door", 3) is None
+    recognizer.forget("door", 3)
+    assert recognizer.known("door", 3) is False
+
+
+def test_deleted_enrollment_leaves_the_index(recognizer):
+    bob = next(eid for eid, name in recognizer.names.items() if name == "bob")
+    database.delete_enrollment(bob)
+    result = recognizer.sync()
+    assert result["removed"] == 2 and len(recognizer.index) == 2
+    assert recognizer.identify("door", 4, frame_with(person(2)), BBOX) is None
+
+
+def test_index_persists_through_the_mmap_file(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((50, 32)).astype(np.float32)
+    index = EmbeddingIndex(tmp_path)
+    index.reset("synthetic", 32)
+    index.add(range(1, 51), [i // 10 for i in range(50)], vectors)
+
+    again = EmbeddingIndex(tmp_path)
+    assert isinstance(again.matrix, np.memmap)
+    assert again.model == "synthetic" and again.dim == 32 and len(again) == 50
+    assert np.allclose(np.linalg.norm(again.matrix, axis=1), 1.0, atol=1e-5)
+    # A slightly noisy copy of row 17 finds row 17 first
+    query = vectors[17] + 0.05 * rng.standard_normal(32).astype(np.float32)
+    enrollment_id, image_id, score = again.search(query, k=3)[0][0]
+    assert (image_id, enrollment_id) == (18, 1) and score > 0.9
+
+    # Removing rows writes a new file; the old one is gone and a reload sees the new one
+    old_file = again.file
+    again.remove([18])
+    assert not (tmp_path / old_file).exists()
+    third = EmbeddingIndex(tmp_path)
+    assert len(third) == 49 and 18 not in third.image_ids
+    assert third.search(query, k=1)[0][0][1] != 18
+
+
+def test_rows_past_index_json_are_ignored(tmp_path):
+    """An add that wrote its rows but crashed before index.json: the extra rows don't count."""
+    index = EmbeddingIndex(tmp_path)
+    index.reset("synthetic", 8)
+    index.add([1, 2], [1, 1], np.eye(2, 8, dtype=np.float32))
+    with open(tmp_path / index.file, "ab") as fh:
+        fh.write(np.ones((3, 8), dtype=np.float32).tobytes())
+    again = EmbeddingIndex(tmp_path)
+    assert len(again) == 2 and again.matrix.shape == (2, 8)
+    # And the next add overwrites them
+    again.add([3], [2], np.eye(1, 8, 5, dtype=np.float32))
+    assert (tmp_path / again.file).stat().st_size == 3 * 8 * 4
+    assert EmbeddingIndex(tmp_path).search(np.eye(1, 8, 5), k=1)[0][0][:2] == (2, 3)
@@ -0,0 +1,149 @@
+"""
+StreamSupervisor: stall detection and restarts against the fake source
+(FileReplaySource with stall_after), and the backoff schedule against a
+streamer stub.
+"""
+
+import time
+
+import pytest
+
+from backend.supervisor import RESTARTS, StreamSupervisor
+
+
+class FakeSource:
+    def __init__(self):
+        self.alive = True
+        self.exit_code = None
+
+    def is_alive(self):
+        return self.alive
+
+    def recent_log(self, limit=5):
+        return []
+
+
+class FakeStreamer:
+    """Just what the supervisor looks at; start() fails while `fail_starts` > 0."""
+
+    def __init__(self, fail_starts=0):
+        self.source = FakeSource()
+        self.started = False
+        self.fail_starts = fail_starts
+        self.starts = 0
+        self.info = {"started_at": None, "first_frame_at": None, "last_frame_age": None}
+
+    def start(self):
+        self.starts += 1
+        if self.fail_starts:
+            self.fail_starts -= 1
+            raise RuntimeError("camera busy")
+        self.started = True
+        self.source = FakeSource()
+        self.info = {"started_at": time.time(), "first_frame_at": None, "last_frame_age": None}
+
+    def stop(self):
+        self.started = False
+
+    def get_frame_info(self):
+        return dict(self.info)
+
+    def age_tracks(self, now=None):
+        pass
+
+
+def _frames_flowing(streamer, age=0.0, started_ago=1.0):
+    now = time.time()
+    streamer.info = {"started_at": now - started_ago, "first_frame_at": now - started_ago + 0.1,
+                     "last_frame_age": age}
+
+
+def test_failed_starts_back_off_exponentially():
+    streamer = FakeStreamer(fail_starts=10)
+    sup = StreamSupervisor(lambda: streamer, initial_backoff=1.0, max_backoff=4.0, camera_id="test")
+    backoffs = []
+    for _ in range(4):
+        sup._next_attempt = 0.0  # don't actually wait the backoff out
+        sup._check()
+        backoffs.append(sup.stats()["next_backoff"])
+    assert sup.state == "failed"
+    assert streamer.starts == 4
+    assert backoffs == [2.0, 4.0, 4.0, 4.0]
+    # Not retried before the backoff is up
+    sup._check()
+    assert streamer.starts == 4
+
+
+def test_stall_restarts_and_stable_run_resets_backoff():
+    streamer = FakeStreamer()
+    sup = StreamSupervisor(lambda: streamer, stall_timeout=2.0, initial_backoff=1.0, stable_after=60.0,
+                           camera_id="test")
+    before = RESTARTS.value(camera="test", reason="stalled")
+    sup._check()
+    assert streamer.started and sup.state == "starting"
+
+    _frames_flowing(streamer)
+    sup._check()
+    assert sup.state == "streaming"
+
+    _frames_flowing(streamer, age=5.0)
+    sup._check()
+    assert sup.state == "restarting"
+    assert not streamer.started
+    assert sup.restart_count == 1 and sup.last_restart_reason == "stalled"
+    assert RESTARTS.value(camera="test", reason="stalled") == before + 1
+    assert sup.stats()["next_backoff"] == 2.0
+
+    sup._next_attempt = 0.0
+    sup._check()
+    _frames_flowing(streamer, started_ago=61.0)
+    sup._check()
+    assert sup.state == "streaming"
+    assert sup.stats()["next_backoff"] == 1.0
+
+
+def test_exited_source_is_restarted():
+    streamer = FakeStreamer()
+    sup = StreamSupervisor(lambda: streamer, camera_id="test")
+    sup._check()
+    streamer.source.alive = False
+    streamer.source.exit_code = 255
+    sup._check()
+    assert sup.last_restart_reason == "exited (255)"
+    assert sup.state == "restarting"
+
+
+def test_no_first_frame_times_out():
+    streamer = FakeStreamer()
+    sup = StreamSupervisor(lambda: streamer, first_frame_timeout=5.0, camera_id="test")
+    sup._check()
+    sup._check()
+    assert sup.state == "warming_up"
+    streamer.info["started_at"] = time.time() - 6.0
+    sup._check()
+    assert sup.last_restart_reason == "no_frames"
+
+
+@pytest.mark.slow
+def test_stalling_recording_is_restarted(tmp_path):
+    """The real streamer on a recording that stops sending after 20 frames."""
+    from backend.frame_sources import FileReplaySource
+    from backend.pipeline_bench import generate_recording
+    from backend.rpicam_streaming import RPiCamStreaming
+
+    mjpeg, meta = generate_recording(tmp_path / "rec", seconds=2)
+    streamer = RPiCamStreaming(source=FileReplaySource(mjpeg, meta, realtime=True, stall_after=20),
+                               metadata_file=str(tmp_path / "meta.json"), motion_detection=False)
+    sup = StreamSupervisor(lambda: streamer, stall_timeout=0.5, initial_backoff=0.2, max_backoff=0.5,
+                           check_interval=0.1, camera_id="test-replay")
+    sup.start()
+    try:
+        deadline = time.time() + 15
+        while sup.restart_count < 2 and time.time() < deadline:
+            time.sleep(0.1)
+    finally:
+        sup.stop()
+        streamer.stop()
+    assert sup.restart_count >= 2
+    assert sup.last_restart_reason == "stalled"
+    assert sup.time_to_first_frame is not None